@@ -1,13 +1,30 @@
 # app.py
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, request, jsonify, render_template, send_from_directory, Response, stream_with_context
 import os
 import uuid
+import time
+import json
 import threading
 import requests
-from processing_logic import process_excel_file, clean_old_files
+from urllib.parse import quote
+from processing_logic import process_excel_file
+from ollama_client import get_ollama_client
+from concurrency_limiter import get_concurrency_limiter
+from ticket_io import SUPPORTED_UPLOAD_EXTENSIONS
+from job_store import get_job_store
+from job_worker import JobWorkerPool
+from checkpoint_store import get_checkpoint_store
+from live_results import get_live_result_store
+from pipeline_metrics import get_metrics_registry
+from health_monitor import HealthMonitor
+from result_store import (
+    EXPORT_FORMATS, EXPORT_MIMETYPES, ExportInProgressError, ResultStore, ResultStoreError, to_json_value
+)
 from config import (
     UPLOAD_FOLDER, PROCESSED_FOLDER, OLLAMA_MODEL, DEFAULT_COLUMNS_TO_ANALYZE,
-    OLLAMA_BASE_URL
+    OLLAMA_BASE_URLS, JOB_PROGRESS_WRITE_INTERVAL_SECONDS, SSE_POLL_INTERVAL_SECONDS, SSE_MIN_EVENT_INTERVAL_SECONDS,
+    SSE_KEEPALIVE_SECONDS, SSE_MAX_STREAM_SECONDS, SSE_MAX_CONCURRENT_STREAMS, SSE_BUSY_RETRY_AFTER_SECONDS, ROUTING_FAST_MODEL, PROMPT_TICKET_TOKEN_BUDGET, WORK_NOTES_SUMMARY_ENABLED,
+    INCREMENTAL_ANALYSIS_ENABLED, RESULTS_PAGE_SIZE_DEFAULT, RESULTS_PAGE_SIZE_MAX, RESULT_EXPORT_RETRY_AFTER_SECONDS
 )
 
 app = Flask(__name__)
@@ -15,32 +32,25 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['PROCESSED_FOLDER'] = PROCESSED_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024
 
-tasks_status = {}
-
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(PROCESSED_FOLDER, exist_ok=True)
 
+health_monitor = HealthMonitor()
+
 @app.route('/', methods=['GET'])
 def index():
-    clean_old_files()
-    ollama_status = "No disponible"
-    ollama_models_available = []
-    try:
-        response = requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=10) # Aumentado un poco el timeout para la comprobación
-        if response.status_code == 200:
-            ollama_status = "Disponible"
-            models_data = response.json().get("models", [])
-            ollama_models_available = sorted([model['name'] for model in models_data])
-        else:
-            ollama_status = f"Error: {response.status_code} - {response.text[:200]}"
-    except requests.exceptions.RequestException as e:
-        ollama_status = f"No se pudo conectar a Ollama en {OLLAMA_BASE_URL}. Asegúrate que esté ejecutándose. Detalle: {str(e)[:200]}"
-
+    # Estado guardado por el monitor en segundo plano: la página no espera a Ollama
+    ollama_health = health_monitor.status()
     return render_template('index.html',
                            ollama_model_default=OLLAMA_MODEL,
+                           routing_fast_model_default=ROUTING_FAST_MODEL,
+                           prompt_token_budget_default=PROMPT_TICKET_TOKEN_BUDGET,
+                           summarize_work_notes_default=WORK_NOTES_SUMMARY_ENABLED,
+                           incremental_default=INCREMENTAL_ANALYSIS_ENABLED,
                            default_cols=DEFAULT_COLUMNS_TO_ANALYZE,
-                           ollama_status=ollama_status,
-                           ollama_models=ollama_models_available)
+                           ollama_status=ollama_health["message"],
+                           ollama_status_pending=ollama_health["available"] is None,
+                           ollama_models=ollama_health["models"])
 
 
 @app.route('/upload', methods=['POST'])
@@ -51,7 +61,7 @@ def upload_file():
     if file.filename == '':
         return jsonify({"error": "No se seleccionó ningún archivo."}), 400
 
-    if file and (file.filename.endswith('.xlsx') or file.filename.endswith('.xls')):
+    if file and file.filename.lower().endswith(SUPPORTED_UPLOAD_EXTENSIONS):
         original_filename = file.filename
         temp_filename_base = str(uuid.uuid4())
         _, extension = os.path.splitext(original_filename)
@@ -61,128 +71,323 @@ def upload_file():
         file.save(filepath)
 
         task_id = str(uuid.uuid4())
-        tasks_status[task_id] = {
-            "status": "uploaded",
-            "message": "Archivo subido, listo para analizar.",
-            "original_filename": original_filename, 
-            "temp_filename_base": temp_filename_base,
-            "filepath_on_server": filepath,
-            "processed_filepath_on_server": None,
-            "progress_current": 0,
-            "progress_total": 1,
-            "analysis_summary": None
-        }
+        get_job_store().create_task(
+            task_id,
+            status="uploaded",
+            message="Archivo subido, listo para analizar.",
+            original_filename=original_filename,
+            temp_filename_base=temp_filename_base,
+            filepath_on_server=filepath,
+            processed_filepath_on_server=None,
+            progress_current=0,
+            progress_total=1,
+            analysis_summary=None
+        )
         return jsonify({
             "message": "Archivo subido exitosamente.",
             "task_id": task_id,
             "filename": original_filename
         }), 200
     else:
-        return jsonify({"error": "Formato de archivo no soportado. Por favor, suba un .xlsx o .xls."}), 400
+        return jsonify({"error": "Formato de archivo no soportado. Por favor, suba un .xlsx, .xls o .csv."}), 400
+
 
+def run_analysis_job(task):
+    task_id = task["task_id"]
+    job_store = get_job_store()
+    params = task.get("analysis_params") or {}
+    last_progress_write = {"at": 0.0}
 
-def analysis_thread_target(task_id, filepath_on_server, temp_filename_base, custom_context, selected_columns, ollama_model_to_use):
-    def update_progress_local(current, total, message, status_override=None):
-        task_data = tasks_status.get(task_id, {})
-        task_data["progress_current"] = current
-        task_data["progress_total"] = total
-        task_data["message"] = message
+    def update_progress_local(current, total, message, status_override=None, live_summary=None):
         if status_override:
-             task_data["status"] = status_override
+            status = status_override
         elif current == total and total > 0:
-            task_data["status"] = "completed"
+            status = "completed"
         else:
-            task_data["status"] = "processing"
-        tasks_status[task_id] = task_data
+            status = "processing"
+        # El progreso por ticket se escribe como mucho cada JOB_PROGRESS_WRITE_INTERVAL_SECONDS;
+        # los cambios a un estado final se escriben siempre.
+        now = time.monotonic()
+        if status == "processing" and now - last_progress_write["at"] < JOB_PROGRESS_WRITE_INTERVAL_SECONDS:
+            return
+        last_progress_write["at"] = now
+        job_store.update_task(
+            task_id,
+            progress_current=current,
+            progress_total=total,
+            message=message,
+            status=status,
+            runtime_stats={"ollama_concurrency": get_concurrency_limiter().snapshot(), "live_summary": live_summary}
+        )
 
     try:
         update_progress_local(0, 1, "Hilo de análisis iniciado, preparando...", "processing")
         
         processed_filepath_from_logic, analysis_summary_for_ui = process_excel_file(
-            filepath_on_server,
-            temp_filename_base,
-            custom_context,
-            selected_columns,
-            ollama_model_to_use,
-            update_progress_local
+            task["filepath_on_server"],
+            task["temp_filename_base"],
+            params.get("custom_context", ""),
+            params.get("selected_columns", {}),
+            params.get("ollama_model", OLLAMA_MODEL),
+            update_progress_local,
+            bypass_cache=params.get("bypass_cache", False),
+            batch_mode=params.get("batch_mode", False),
+            semantic_clustering=params.get("semantic_clustering", False),
+            model_routing=params.get("model_routing", False),
+            routing_fast_model=params.get("routing_fast_model", ROUTING_FAST_MODEL),
+            prompt_token_budget=params.get("prompt_token_budget", PROMPT_TICKET_TOKEN_BUDGET),
+            summarize_work_notes=params.get("summarize_work_notes", WORK_NOTES_SUMMARY_ENABLED),
+            incremental=params.get("incremental", INCREMENTAL_ANALYSIS_ENABLED),
+            task_id=task_id,
+            resume=params.get("resume", False)
         )
         
-        tasks_status[task_id]["analysis_summary"] = analysis_summary_for_ui
+        task_data = job_store.get_task(task_id)
+        job_store.update_task(task_id, analysis_summary=analysis_summary_for_ui, finished_at=time.time())
         if processed_filepath_from_logic:
-            tasks_status[task_id]["processed_filepath_on_server"] = processed_filepath_from_logic
-            if tasks_status[task_id]["status"] != "error":
-                update_progress_local(tasks_status[task_id]["progress_total"], tasks_status[task_id]["progress_total"], "Análisis finalizado. Resultados listos.", "completed")
+            job_store.update_task(task_id, processed_filepath_on_server=processed_filepath_from_logic)
+            if task_data["status"] != "error":
+                update_progress_local(task_data["progress_total"], task_data["progress_total"], "Análisis finalizado. Resultados listos.", "completed")
         else:
-            if tasks_status[task_id]["status"] != "error":
-                 update_progress_local(tasks_status[task_id]["progress_current"], tasks_status[task_id]["progress_total"], "El análisis falló al generar el archivo de salida. Revise logs.", "error")
+            if task_data["status"] != "error":
+                 update_progress_local(task_data["progress_current"], task_data["progress_total"], "El análisis falló al generar el archivo de salida. Revise logs.", "error")
     except Exception as e:
         print(f"Error CRÍTICO en el hilo de análisis para task_id {task_id}: {e}")
+        task_data = job_store.get_task(task_id) or {}
         update_progress_local(
-            tasks_status.get(task_id, {}).get("progress_current", 0),
-            tasks_status.get(task_id, {}).get("progress_total", 1),
+            task_data.get("progress_current", 0),
+            task_data.get("progress_total", 1),
             f"Error crítico no manejado en el hilo: {str(e)}", 
             "error"
         )
-        if tasks_status.get(task_id):
-            tasks_status[task_id]["analysis_summary"] = {"error": f"Error crítico en hilo: {str(e)}"}
+        job_store.update_task(task_id, analysis_summary={"error": f"Error crítico en hilo: {str(e)}"}, finished_at=time.time())
+
+    final_task = job_store.get_task(task_id) or {}
+    get_metrics_registry().increment("ticket_analyzer_tasks_finished_total", status=final_task.get("status") or "unknown")
+
+
+job_worker_pool = JobWorkerPool(run_analysis_job)
+
+def start_background_threads():
+    # Workers de análisis (y recuperación de tareas interrumpidas) y monitor de estado. Se arrancan al
+    # iniciar el proceso que sirve la aplicación: en `python app.py` desde el bloque __main__ y con
+    # gunicorn desde el hook post_worker_init de gunicorn.conf.py, una vez por worker. Es idempotente.
+    job_worker_pool.start()
+    health_monitor.start()
+
+@app.before_request
+def ensure_background_threads_started():
+    # Respaldo para servidores sin hook de arranque (flask run, waitress...): si nada los arrancó, lo
+    # hace la primera petición
+    start_background_threads()
 
 
 @app.route('/analyze/<task_id>', methods=['POST'])
 def analyze_tickets_route(task_id):
-    if task_id not in tasks_status:
+    job_store = get_job_store()
+    task_info = job_store.get_task(task_id)
+    if task_info is None:
         return jsonify({"error": "ID de tarea no válido."}), 404
-    
-    task_info = tasks_status[task_id]
 
-    if task_info["status"] == "processing":
+    if task_info["status"] in ("queued", "processing"):
          return jsonify({"message": "El análisis ya está en progreso para esta tarea.", "task_id": task_id}), 409
 
     custom_context = request.form.get('custom_context', '')
     desc_col = request.form.get('description_column', DEFAULT_COLUMNS_TO_ANALYZE['description_column'])
     short_desc_col = request.form.get('short_description_column', DEFAULT_COLUMNS_TO_ANALYZE['short_description_column'])
     work_notes_col = request.form.get('work_notes_column', DEFAULT_COLUMNS_TO_ANALYZE.get('work_notes_column', "Work notes"))
+    ticket_id_col = request.form.get('ticket_id_column', DEFAULT_COLUMNS_TO_ANALYZE['ticket_id_column']).strip()
     
     ollama_model_selected = request.form.get('ollama_model_select', OLLAMA_MODEL)
+    bypass_cache = request.form.get('bypass_cache', '').lower() in ('1', 'true', 'on', 'yes')
+    batch_mode = request.form.get('batch_mode', '').lower() in ('1', 'true', 'on', 'yes')
+    semantic_clustering = request.form.get('semantic_clustering', '').lower() in ('1', 'true', 'on', 'yes')
+    model_routing = request.form.get('model_routing', '').lower() in ('1', 'true', 'on', 'yes')
+    routing_fast_model = request.form.get('routing_fast_model', '').strip() or ROUTING_FAST_MODEL
+    summarize_work_notes = request.form.get('summarize_work_notes', '').lower() in ('1', 'true', 'on', 'yes')
+    incremental = request.form.get('incremental', '').lower() in ('1', 'true', 'on', 'yes')
+    try:
+        prompt_token_budget = int(request.form.get('prompt_token_budget') or PROMPT_TICKET_TOKEN_BUDGET)
+    except ValueError:
+        return jsonify({"error": "El presupuesto de tokens por ticket debe ser un número entero."}), 400
+    if prompt_token_budget < 0:
+        return jsonify({"error": "El presupuesto de tokens por ticket no puede ser negativo."}), 400
+    try:
+        priority = int(request.form.get('priority', 0))
+    except ValueError:
+        return jsonify({"error": "La prioridad debe ser un número entero."}), 400
 
     selected_columns = {
         "description_column": desc_col,
         "short_description_column": short_desc_col,
-        "work_notes_column": work_notes_col
+        "work_notes_column": work_notes_col,
+        "ticket_id_column": ticket_id_col
+    }
+
+    analysis_params = {
+        "custom_context": custom_context,
+        "selected_columns": selected_columns,
+        "ollama_model": ollama_model_selected,
+        "bypass_cache": bypass_cache,
+        "batch_mode": batch_mode,
+        "semantic_clustering": semantic_clustering,
+        "model_routing": model_routing,
+        "routing_fast_model": routing_fast_model,
+        "prompt_token_budget": prompt_token_budget,
+        "summarize_work_notes": summarize_work_notes,
+        "incremental": incremental and bool(ticket_id_col)
     }
+    if not job_store.enqueue_task(task_id, analysis_params, priority=priority):
+        return jsonify({"message": "El análisis ya está en progreso para esta tarea.", "task_id": task_id}), 409
+    job_worker_pool.notify()
+
+    return jsonify({
+        "message": "Análisis en cola.",
+        "task_id": task_id,
+        "queue_position": job_store.queue_position(task_id)
+    }), 202
+
+@app.route('/resume/<task_id>', methods=['POST'])
+def resume_analysis_route(task_id):
+    # Vuelve a encolar una tarea interrumpida o fallida con los mismos parámetros;
+    # solo se envían al LLM las filas que no tienen resultado guardado.
+    job_store = get_job_store()
+    task_info = job_store.get_task(task_id)
+    if task_info is None:
+        return jsonify({"error": "ID de tarea no válido."}), 404
+    if not task_info.get("analysis_params"):
+        return jsonify({"error": "La tarea no tiene un análisis previo que reanudar."}), 400
+    if task_info["status"] in ("queued", "processing"):
+        return jsonify({"message": "El análisis ya está en progreso para esta tarea.", "task_id": task_id}), 409
+
+    analysis_params = dict(task_info["analysis_params"], resume=True)
+    if not job_store.enqueue_task(task_id, analysis_params, priority=task_info.get("priority") or 0):
+        return jsonify({"message": "El análisis ya está en progreso para esta tarea.", "task_id": task_id}), 409
+    job_worker_pool.notify()
+
+    return jsonify({
+        "message": "Reanudación en cola.",
+        "task_id": task_id,
+        "rows_already_analyzed": get_checkpoint_store().count_rows(task_id),
+        "queue_position": job_store.queue_position(task_id)
+    }), 202
+
+def build_status_payload(task_data, job_store):
+    runtime_stats = task_data.pop("runtime_stats", None) or {}
+    if task_data.get("status") == "processing" and runtime_stats.get("ollama_concurrency"):
+        task_data["ollama_concurrency"] = runtime_stats["ollama_concurrency"]
+    if task_data.get("status") == "processing" and runtime_stats.get("live_summary"):
+        # Histograma de categorías y recomendaciones con los tickets terminados hasta ahora
+        task_data["live_summary"] = runtime_stats["live_summary"]
+    if task_data.get("status") == "queued":
+        task_data["queue_position"] = job_store.queue_position(task_data["task_id"])
+    # Rendimiento y tiempo restante estimados a partir del progreso desde el inicio del análisis
+    task_data["throughput_tickets_per_second"] = None
+    task_data["eta_seconds"] = None
+    started_at = task_data.get("started_at")
+    if task_data.get("status") == "processing" and started_at and task_data.get("progress_current"):
+        elapsed = max(time.time() - started_at, 0.001)
+        throughput = task_data["progress_current"] / elapsed
+        remaining = max((task_data.get("progress_total") or 0) - task_data["progress_current"], 0)
+        task_data["throughput_tickets_per_second"] = round(throughput, 3)
+        task_data["eta_seconds"] = round(remaining / throughput, 1) if throughput > 0 else None
+    return task_data
+
+
+_status_snapshots = {}
+_status_snapshots_lock = threading.Lock()
+
+def get_task_snapshot(task_id):
+    # Varias conexiones SSE que observan la misma tarea comparten una única lectura de la base de datos
+    # por intervalo, en lugar de consultarla cada una por su cuenta.
+    now = time.monotonic()
+    with _status_snapshots_lock:
+        cached = _status_snapshots.get(task_id)
+        if cached and now - cached[0] < SSE_POLL_INTERVAL_SECONDS:
+            return dict(cached[1]) if cached[1] is not None else None
+    task_data = get_job_store().get_task(task_id)
+    with _status_snapshots_lock:
+        _status_snapshots[task_id] = (now, task_data)
+        # Evitar que el diccionario crezca sin límite con tareas que ya nadie observa
+        for stale_task_id in [key for key, (fetched_at, _) in _status_snapshots.items()
+                              if now - fetched_at > 60]:
+            del _status_snapshots[stale_task_id]
+    return dict(task_data) if task_data is not None else None
 
-    filepath_on_server = task_info["filepath_on_server"]
-    temp_filename_base = task_info["temp_filename_base"]
-
-    task_info["status"] = "queued"
-    task_info["message"] = "Análisis en cola..."
-    task_info["progress_current"] = 0
-    task_info["progress_total"] = 1 
-    task_info["processed_filepath_on_server"] = None
-    task_info["analysis_summary"] = None
-    tasks_status[task_id] = task_info
-
-    thread = threading.Thread(target=analysis_thread_target, args=(
-        task_id,
-        filepath_on_server,
-        temp_filename_base,
-        custom_context,
-        selected_columns,
-        ollama_model_selected
-    ))
-    thread.daemon = True
-    thread.start()
-
-    return jsonify({"message": "Análisis iniciado.", "task_id": task_id}), 202
 
 @app.route('/status/<task_id>', methods=['GET'])
 def get_status(task_id):
-    if task_id not in tasks_status:
+    job_store = get_job_store()
+    task_data = job_store.get_task(task_id)
+    if task_data is None:
+        return jsonify({"error": "ID de tarea no válido."}), 404
+    return jsonify(build_status_payload(task_data, job_store))
+
+# Cada conexión SSE ocupa un hilo del servidor mientras está abierta: hace falta un servidor con hilos
+# (el de desarrollo de Flask lo es; con gunicorn, --worker-class gthread --threads N o gevent). Las
+# conexiones se limitan por proceso y se cierran tras SSE_MAX_STREAM_SECONDS para que el navegador se
+# reconecte y ningún cliente retenga un hilo durante toda la tarea.
+sse_stream_slots = threading.BoundedSemaphore(SSE_MAX_CONCURRENT_STREAMS)
+
+@app.route('/status/<task_id>/stream', methods=['GET'])
+def stream_status(task_id):
+    if get_task_snapshot(task_id) is None:
         return jsonify({"error": "ID de tarea no válido."}), 404
-    return jsonify(tasks_status[task_id])
+    if not sse_stream_slots.acquire(blocking=False):
+        # El cliente vuelve al polling de /status
+        response = jsonify({"error": "Demasiadas conexiones de progreso abiertas; usa /status."})
+        response.headers["Retry-After"] = str(SSE_BUSY_RETRY_AFTER_SECONDS)
+        return response, 503
+
+    def event_stream():
+        job_store = get_job_store()
+        last_sent_key = None
+        last_sent_at = 0.0
+        last_keepalive_at = time.monotonic()
+        stream_deadline = last_keepalive_at + SSE_MAX_STREAM_SECONDS
+        # Reconexión automática del navegador tras un corte o al llegar a la duración máxima
+        yield f"retry: {int(SSE_MIN_EVENT_INTERVAL_SECONDS * 1000)}\n\n"
+        while time.monotonic() < stream_deadline:
+            task_data = get_task_snapshot(task_id)
+            if task_data is None:
+                yield f"event: error\ndata: {json.dumps({'error': 'ID de tarea no válido.'})}\n\n"
+                return
+            now = time.monotonic()
+            is_final = task_data.get("status") in ("completed", "error")
+            change_key = (task_data.get("status"), task_data.get("progress_current"), task_data.get("message"))
+            # Eventos agrupados: como mucho uno cada SSE_MIN_EVENT_INTERVAL_SECONDS, y solo si algo cambió
+            if change_key != last_sent_key and (is_final or now - last_sent_at >= SSE_MIN_EVENT_INTERVAL_SECONDS):
+                payload = build_status_payload(task_data, job_store)
+                yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+                last_sent_key = change_key
+                last_sent_at = now
+                last_keepalive_at = now
+                if is_final:
+                    return
+            elif now - last_keepalive_at >= SSE_KEEPALIVE_SECONDS:
+                yield ": keepalive\n\n"
+                last_keepalive_at = now
+            time.sleep(SSE_POLL_INTERVAL_SECONDS)
+
+    response = Response(stream_with_context(event_stream()), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # Evita que nginx acumule los eventos
+    })
+    # Se libera al cerrar la respuesta, también si el cliente se desconecta antes del primer evento
+    response.call_on_close(sse_stream_slots.release)
+    return response
+
+def export_in_progress_response(message):
+    # Otra petición ya está generando ese formato: en lugar de generarlo dos veces, se pide reintentar.
+    # Refresh hace que el enlace de descarga abierto en el navegador se reintente solo.
+    response = jsonify({"status": "preparing", "message": message})
+    response.headers["Retry-After"] = str(RESULT_EXPORT_RETRY_AFTER_SECONDS)
+    response.headers["Refresh"] = str(RESULT_EXPORT_RETRY_AFTER_SECONDS)
+    return response, 202
 
 @app.route('/download/<task_id>', methods=['GET'])
 def download_processed_file(task_id):
-    task_info = tasks_status.get(task_id)
+    task_info = get_job_store().get_task(task_id)
     if not task_info or task_info["status"] != "completed":
         return jsonify({"error": "El archivo no está listo o la tarea no fue completada exitosamente."}), 404
 
@@ -190,23 +395,162 @@ def download_processed_file(task_id):
     if not processed_filepath_on_server or not os.path.exists(processed_filepath_on_server):
         return jsonify({"error": "Archivo procesado no encontrado en el sistema."}), 404
 
-    original_filename = task_info.get("original_filename", "descarga.xlsx")
-    base_orig, ext_orig = os.path.splitext(original_filename)
-    download_filename = f"{base_orig}_analizado{ext_orig}"
+    original_filename = task_info.get("original_filename") or "descarga.xlsx"
+    base_orig, _ = os.path.splitext(original_filename)
+    try:
+        store = ResultStore(processed_filepath_on_server)
+    except ResultStoreError as e:
+        return jsonify({"error": str(e)}), 404
+    # Por defecto, el mismo formato que el archivo subido (.csv -> .csv, .xlsx/.xls -> .xlsx)
+    export_format = (request.args.get('format') or store.manifest["default_format"]).lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": f"Formato no soportado: {export_format}. Formatos disponibles: {', '.join(EXPORT_FORMATS)}."}), 400
+    download_filename = f"{base_orig}_analizado.{export_format}"
+
+    if export_format == "csv.gz":
+        if not os.path.exists(store.export_path(export_format)) and store.export_in_progress(export_format):
+            return export_in_progress_response(f"El archivo {export_format} se está generando. Vuelve a intentarlo en unos segundos.")
+        # Se envía comprimido a medida que se genera, sin esperar a tener el archivo completo
+        return Response(stream_with_context(store.iter_csv_gz()), mimetype=EXPORT_MIMETYPES[export_format], headers={
+            "Content-Disposition": f"attachment; filename*=UTF-8''{quote(download_filename)}"
+        })
+    try:
+        export_path = store.ensure_export(export_format)
+    except ExportInProgressError as e:
+        return export_in_progress_response(str(e))
+    except ResultStoreError as e:
+        return jsonify({"error": str(e)}), 400
 
     return send_from_directory(
-        directory=os.path.dirname(processed_filepath_on_server),
-        path=os.path.basename(processed_filepath_on_server),
+        directory=os.path.dirname(export_path),
+        path=os.path.basename(export_path),
         as_attachment=True,
-        download_name=download_filename
+        download_name=download_filename,
+        mimetype=EXPORT_MIMETYPES[export_format]
     )
 
+@app.route('/results/<task_id>', methods=['GET'])
+def get_results_page(task_id):
+    # Navegación paginada por los resultados sin descargar el archivo completo: solo se leen las partes
+    # del almacén columnar que contienen la página pedida (y solo las columnas pedidas, si se indican).
+    task_info = get_job_store().get_task(task_id)
+    if task_info is None:
+        return jsonify({"error": "ID de tarea no válido."}), 404
+    if task_info["status"] != "completed" or not task_info.get("processed_filepath_on_server"):
+        return jsonify({"error": "Los resultados no están listos o la tarea no fue completada exitosamente."}), 404
+    try:
+        store = ResultStore(task_info["processed_filepath_on_server"])
+    except ResultStoreError as e:
+        return jsonify({"error": str(e)}), 404
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', RESULTS_PAGE_SIZE_DEFAULT))
+    except ValueError:
+        return jsonify({"error": "offset y limit deben ser números enteros."}), 400
+    if offset < 0 or limit < 1:
+        return jsonify({"error": "offset no puede ser negativo y limit debe ser mayor que 0."}), 400
+    limit = min(limit, RESULTS_PAGE_SIZE_MAX)
+    columns = [column for column in request.args.get('columns', '').split(',') if column] or None
+    unknown_columns = [column for column in columns or [] if column not in store.columns]
+    if unknown_columns:
+        return jsonify({"error": f"Columnas no encontradas: {', '.join(unknown_columns)}."}), 400
+
+    page_df = store.read_rows(offset, limit, columns)
+    rows = [{column: to_json_value(value) for column, value in zip(page_df.columns, row)}
+            for row in page_df.itertuples(index=False, name=None)]
+    return jsonify({
+        "task_id": task_id,
+        "total_rows": store.total_rows,
+        "offset": offset,
+        "limit": limit,
+        "columns": list(page_df.columns),
+        "rows": rows,
+        "next_offset": offset + len(rows) if offset + len(rows) < store.total_rows else None
+    })
+
+@app.route('/results/<task_id>/partial', methods=['GET'])
+def get_partial_results(task_id):
+    # Filas terminadas hasta ahora, en orden de finalización, mientras el análisis sigue en curso.
+    # El cliente pide las siguientes con ?after=<next_after de la respuesta anterior>.
+    task_info = get_job_store().get_task(task_id)
+    if task_info is None:
+        return jsonify({"error": "ID de tarea no válido."}), 404
+    try:
+        after = int(request.args.get('after', 0))
+        limit = int(request.args.get('limit', RESULTS_PAGE_SIZE_DEFAULT))
+    except ValueError:
+        return jsonify({"error": "after y limit deben ser números enteros."}), 400
+    if after < 0 or limit < 1:
+        return jsonify({"error": "after no puede ser negativo y limit debe ser mayor que 0."}), 400
+    limit = min(limit, RESULTS_PAGE_SIZE_MAX)
+
+    live_store = get_live_result_store()
+    completed_rows = live_store.load_rows(task_id, after, limit)
+    return jsonify({
+        "task_id": task_id,
+        "status": task_info["status"],
+        "rows_completed": live_store.count_rows(task_id),
+        "rows": [{"seq": seq, "row_index": row_index, "values": values} for seq, row_index, values in completed_rows],
+        "next_after": completed_rows[-1][0] if completed_rows else after
+    })
+
+@app.route('/health', methods=['GET'])
+def health():
+    # Solo lee estado ya calculado (monitor en segundo plano, limitador, almacén de tareas): responde al instante
+    # aunque Ollama no responda. Devuelve 200 siempre que la aplicación esté viva; el estado de Ollama va en "status".
+    ollama_health = health_monitor.status()
+    if ollama_health["available"] is None:
+        overall_status = "starting"
+    elif not ollama_health["available"]:
+        overall_status = "unavailable"
+    elif any(not backend["healthy"] or backend["reachable"] is False for backend in ollama_health["backends"]):
+        overall_status = "degraded"
+    else:
+        overall_status = "ok"
+    return jsonify({
+        "status": overall_status,
+        "ollama": ollama_health,
+        "concurrency": get_concurrency_limiter().snapshot(),
+        "tasks": get_job_store().count_by_status()
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Formato de exposición de texto de Prometheus. Los contadores e histogramas son por proceso:
+    # con varios workers de gunicorn, Prometheus debe consultar cada proceso (o agregar por instancia).
+    limiter_snapshot = get_concurrency_limiter().snapshot()
+    gauges = [
+        ("ticket_analyzer_ollama_concurrency_limit", "Límite actual del limitador adaptativo de concurrencia.", {},
+         limiter_snapshot["current_limit"]),
+        ("ticket_analyzer_ollama_in_flight_requests", "Peticiones a Ollama en curso.", {}, limiter_snapshot["in_flight"]),
+        ("ticket_analyzer_ollama_tokens_per_second", "Tokens generados por segundo (ventana reciente).", {},
+         limiter_snapshot["tokens_per_second"]),
+        ("ticket_analyzer_ollama_latency_seconds", "Latencia suavizada de Ollama.", {"kind": "smoothed"},
+         limiter_snapshot["smoothed_latency_seconds"]),
+        ("ticket_analyzer_ollama_latency_seconds", "Latencia suavizada de Ollama.", {"kind": "baseline"},
+         limiter_snapshot["baseline_latency_seconds"]),
+    ]
+    for backend in get_ollama_client().snapshot():
+        labels = {"backend": backend["base_url"]}
+        gauges.append(("ticket_analyzer_ollama_backend_up", "1 si la instancia de Ollama recibe peticiones, 0 si está retirada.",
+                       labels, 1 if backend["healthy"] else 0))
+        gauges.append(("ticket_analyzer_ollama_backend_outstanding_requests", "Peticiones en curso por instancia de Ollama.",
+                       labels, backend["outstanding"]))
+    for status, total in sorted(get_job_store().count_by_status().items()):
+        gauges.append(("ticket_analyzer_tasks", "Tareas por estado en el almacén de trabajos.", {"status": status}, total))
+    return Response(get_metrics_registry().render_prometheus(gauges), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 if __name__ == '__main__':
     try:
-        response = requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=10)
+        response = get_ollama_client().tags(timeout=10)
         response.raise_for_status()
-        print(f"Ollama parece estar respondiendo en {OLLAMA_BASE_URL}")
+        print(f"Ollama parece estar respondiendo en {', '.join(OLLAMA_BASE_URLS)}")
     except requests.exceptions.RequestException as e:
-        print(f"ADVERTENCIA: No se pudo conectar a Ollama en {OLLAMA_BASE_URL} o la respuesta fue un error. Detalle: {str(e)[:200]}")
+        print(f"ADVERTENCIA: No se pudo conectar a Ollama en {', '.join(OLLAMA_BASE_URLS)} o la respuesta fue un error. Detalle: {str(e)[:200]}")
     
-    app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
+    debug = True
+    # Con el reloader de depuración este bloque se ejecuta en el proceso vigilante y en el proceso hijo que
+    # atiende las peticiones (WERKZEUG_RUN_MAIN=true); solo el hijo arranca los hilos en segundo plano
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_threads()
+    app.run(debug=debug, host='0.0.0.0', port=5001)
\ No newline at end of file
@@ -0,0 +1,275 @@
+# benchmarks/bench_pipeline.py
+# Benchmark de extremo a extremo de process_excel_file contra un Ollama simulado (benchmarks/mock_ollama.py).
+# No necesita un modelo real: sirve para detectar regresiones de rendimiento y dimensionar hardware.
+#
+# Uso (desde la raíz del proyecto):
+#   python benchmarks/bench_pipeline.py --rows 5000 --html-ratio 0.3 --latency-ms 400 --error-rate 0.01
+#   python benchmarks/bench_pipeline.py --rows 5000 --json-output resultado.json
+#   python benchmarks/bench_pipeline.py --rows 5000 --compare resultado.json --max-regression 0.1
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import psutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ollama_client
+import processing_logic
+from config import DEFAULT_COLUMNS_TO_ANALYZE, OLLAMA_MODEL, PROMPT_TICKET_TOKEN_BUDGET
+from mock_ollama import add_mock_arguments, mock_config_from_args, start_mock_server
+from synthetic_tickets import synthetic_export, write_synthetic_workbook
+
+
+# --- Instrumentación ---
+# Los tiempos por etapa salen del propio pipeline (timing_breakdown del resumen); aquí solo se registra la
+# latencia de cada petición HTTP para calcular percentiles.
+class RequestLatencyRecorder:
+    def __init__(self, client):
+        self.latencies = []
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._client = client
+        self._original_generate = client.generate
+        client.generate = self._timed_generate
+
+    def _timed_generate(self, *args, **kwargs):
+        started = time.perf_counter()
+        failed = True
+        try:
+            response = self._original_generate(*args, **kwargs)
+            failed = response.status_code >= 400
+            return response
+        finally:
+            with self._lock:
+                self.latencies.append(time.perf_counter() - started)
+                self.errors += int(failed)
+
+    def restore(self):
+        self._client.generate = self._original_generate
+
+
+class PeakRssSampler(threading.Thread):
+    def __init__(self, interval_seconds=0.05):
+        super().__init__(name="rss-sampler", daemon=True)
+        self.process = psutil.Process()
+        self.interval_seconds = interval_seconds
+        self.baseline_rss = self.process.memory_info().rss
+        self.peak_rss = self.baseline_rss
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.peak_rss = max(self.peak_rss, self.process.memory_info().rss)
+            self._stop_event.wait(self.interval_seconds)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.peak_rss = max(self.peak_rss, self.process.memory_info().rss)
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+# --- Ejecución ---
+def run_benchmark(args, workdir):
+    input_path = os.path.join(workdir, f"export_sintetico.{args.format}")
+    df = synthetic_export(args.rows, args.html_ratio, seed=args.data_seed, duplicate_ratio=args.duplicate_ratio,
+                          near_duplicate_ratio=args.near_duplicate_ratio, long_notes_ratio=args.long_notes_ratio)
+    write_synthetic_workbook(df, input_path)
+    del df
+    print(f"Export sintético: {args.rows} filas ({args.format}), {args.html_ratio:.0%} de celdas con HTML, "
+          f"{args.duplicate_ratio:.0%} de duplicados, {args.near_duplicate_ratio:.0%} casi idénticos, "
+          f"{args.long_notes_ratio:.0%} con notas largas, {os.path.getsize(input_path) / 1e6:.1f} MB")
+
+    servers = [start_mock_server(mock_config_from_args(args)) for _ in range(args.backends)]
+    # Instancias "caídas": puertos sin nada escuchando, para comprobar la retirada y el reparto entre el resto
+    dead_urls = [f"http://127.0.0.1:{free_port()}" for _ in range(args.dead_backends)]
+    client = ollama_client.OllamaBackendPool(base_urls=[server.base_url for server in servers] + dead_urls)
+    ollama_client._ollama_client = client
+
+    recorder = RequestLatencyRecorder(client)
+
+    sampler = PeakRssSampler()
+    sampler.start()
+    started = time.perf_counter()
+    try:
+        processed_path, summary = processing_logic.process_excel_file(
+            input_path, "benchmark", args.custom_context, dict(DEFAULT_COLUMNS_TO_ANALYZE), args.models[0],
+            lambda current, total, message, status, **kwargs: None,
+            bypass_cache=not args.use_cache, batch_mode=args.batch_mode,
+            semantic_clustering=args.semantic_clustering,
+            model_routing=bool(args.routing_fast_model), routing_fast_model=args.routing_fast_model,
+            prompt_token_budget=args.token_budget, summarize_work_notes=args.summarize_work_notes
+        )
+    finally:
+        elapsed = time.perf_counter() - started
+        sampler.stop()
+        recorder.restore()
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+        client.close()
+        ollama_client._ollama_client = None
+
+    if processed_path is None:
+        raise RuntimeError(f"El pipeline terminó con error: {summary.get('error')}")
+
+    stages = summary["timing_breakdown"]["stages"]
+    latencies = recorder.latencies
+    return {
+        "rows": args.rows,
+        "format": args.format,
+        "html_ratio": args.html_ratio,
+        "duplicate_ratio": args.duplicate_ratio,
+        "batch_mode": bool(args.batch_mode),
+        "semantic_clustering": bool(args.semantic_clustering),
+        "mock_latency_ms": args.latency_ms,
+        "mock_error_rate": args.error_rate,
+        "mock_malformed_json_rate": args.malformed_json_rate,
+        "elapsed_seconds": round(elapsed, 3),
+        "tickets_per_second": round(args.rows / elapsed, 2) if elapsed else None,
+        "llm_requests": len(latencies),
+        "llm_request_errors": recorder.errors,
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 1) if latencies else None,
+        "latency_p95_ms": round(percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+        "read_seconds": stages["read"]["seconds"],
+        "prep_seconds": stages["clean"]["seconds"],
+        "llm_seconds": stages["llm_wait"]["seconds"],
+        "bookkeeping_seconds": stages["bookkeeping"]["seconds"],
+        "write_seconds": stages["write"]["seconds"],
+        "unattributed_seconds": stages["unattributed"]["seconds"],
+        "llm_queue_wait_seconds": stages["llm_queue_wait"]["seconds"],
+        "llm_service_seconds": stages["llm_service"]["seconds"],
+        "bound_by": summary["timing_breakdown"]["bound_by"],
+        "baseline_rss_mb": round(sampler.baseline_rss / 1e6, 1),
+        "peak_rss_mb": round(sampler.peak_rss / 1e6, 1),
+        "unique_tickets_analyzed": summary.get("unique_tickets_analyzed"),
+        "batches_sent": summary.get("batches_sent"),
+        "semantic_reused_tickets": summary.get("semantic_reused_tickets"),
+        "routing_tier_counts": summary.get("routing_tier_counts"),
+        "prompt_token_budget": summary.get("prompt_token_budget"),
+        "truncated_tickets": summary.get("truncated_tickets"),
+        "work_notes_summarized": summary.get("work_notes_summarized"),
+        "llm_prompt_tokens": summary["timing_breakdown"].get("llm_prompt_tokens"),
+        "mock_server_stats": {key: sum(server.stats[key] for server in servers) for key in servers[0].stats},
+        "ollama_backends": summary.get("ollama_backends"),
+    }
+
+
+def print_report(result):
+    print("\n--- Resultado ---")
+    print(f"Tiempo total:        {result['elapsed_seconds']:.2f}s")
+    print(f"Tickets/segundo:     {result['tickets_per_second']:,.2f}")
+    print(f"Peticiones al LLM:   {result['llm_requests']} ({result['llm_request_errors']} con error HTTP tras reintentos)")
+    mock_stats = result["mock_server_stats"]
+    print(f"Fallos simulados:    {mock_stats['errors_injected']} HTTP 500, {mock_stats['malformed_injected']} JSON malformado "
+          f"({mock_stats['generate_requests']} peticiones recibidas)")
+    if result["latency_p50_ms"] is not None:
+        print(f"Latencia p50 / p95:  {result['latency_p50_ms']:.0f} ms / {result['latency_p95_ms']:.0f} ms")
+    print(f"Lectura:             {result['read_seconds']:.2f}s")
+    print(f"Preparación texto:   {result['prep_seconds']:.2f}s")
+    print(f"Espera del LLM:      {result['llm_seconds']:.2f}s")
+    print(f"Gestión resultados:  {result['bookkeeping_seconds']:.2f}s")
+    print(f"Escritura:           {result['write_seconds']:.2f}s")
+    print(f"Sin atribuir:        {result['unattributed_seconds']:.2f}s")
+    print(f"Hilos del LLM:       {result['llm_queue_wait_seconds']:.2f}s en cola, {result['llm_service_seconds']:.2f}s de servicio (acumulado)")
+    print(f"Tokens de prompt:    {result['llm_prompt_tokens']:,} (presupuesto por ticket: {result['prompt_token_budget'] or 'sin límite'}, "
+          f"{result['truncated_tickets']} tickets recortados, {result['work_notes_summarized']} notas resumidas)")
+    if len(result["ollama_backends"] or {}) > 1:
+        for backend, stats in result["ollama_backends"].items():
+            print(f"  {backend}: {stats['requests']} peticiones ({stats['errors']} errores), "
+                  f"{stats['requests_per_second']:.1f} pet/s, latencia media {stats['avg_latency_seconds'] or 0:.3f}s")
+    if result["routing_tier_counts"]:
+        print(f"Enrutamiento:        {result['routing_tier_counts']}")
+    print(f"RSS inicial / pico:  {result['baseline_rss_mb']:.0f} MB / {result['peak_rss_mb']:.0f} MB")
+
+
+def compare_with_baseline(result, baseline_path, max_regression):
+    # Devuelve False si el rendimiento cae más de max_regression (fracción) respecto a la referencia
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\n--- Comparación con {baseline_path} ---")
+    passed = True
+    for key, higher_is_better in (("tickets_per_second", True), ("peak_rss_mb", False)):
+        old_value, new_value = baseline.get(key), result.get(key)
+        if not old_value or new_value is None:
+            continue
+        change = (new_value - old_value) / old_value
+        regression = -change if higher_is_better else change
+        flag = "REGRESIÓN" if regression > max_regression else "ok"
+        passed = passed and flag == "ok"
+        print(f"{key}: {old_value} -> {new_value} ({change:+.1%}) {flag}")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de extremo a extremo del pipeline con Ollama simulado.")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--html-ratio", type=float, default=0.3, help="Fracción de celdas con marcado HTML.")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0, help="Fracción de tickets repetidos.")
+    parser.add_argument("--near-duplicate-ratio", type=float, default=0.0,
+                        help="Fracción de tickets repetidos con otro servidor afectado (casi idénticos).")
+    parser.add_argument("--long-notes-ratio", type=float, default=0.0,
+                        help="Fracción de tickets con un historial largo de notas de trabajo.")
+    parser.add_argument("--format", choices=["xlsx", "csv"], default="xlsx")
+    parser.add_argument("--data-seed", type=int, default=42)
+    parser.add_argument("--batch-mode", action="store_true", help="Activar el modo por lotes.")
+    parser.add_argument("--semantic-clustering", action="store_true",
+                        help="Activar el agrupamiento semántico (el servidor simulado responde a /api/embed).")
+    parser.add_argument("--routing-fast-model", help="Activar el enrutamiento en dos niveles con este modelo rápido "
+                                                     "(se anuncia también en el servidor simulado).")
+    parser.add_argument("--token-budget", type=int, default=PROMPT_TICKET_TOKEN_BUDGET,
+                        help="Tokens estimados máximos del contenido de cada ticket (0 = sin límite).")
+    parser.add_argument("--summarize-work-notes", action="store_true", help="Resumir las notas de trabajo muy largas.")
+    parser.add_argument("--backends", type=int, default=1, help="Número de servidores simulados entre los que repartir.")
+    parser.add_argument("--dead-backends", type=int, default=0,
+                        help="Instancias adicionales que no responden (para probar la retirada de instancias).")
+    parser.add_argument("--use-cache", action="store_true",
+                        help="Usar la caché de resultados (por defecto se ignora para medir el LLM).")
+    parser.add_argument("--custom-context", default="")
+    parser.add_argument("--json-output", help="Guardar el resultado en un archivo JSON (referencia para --compare).")
+    parser.add_argument("--compare", help="Archivo JSON de una ejecución anterior con el que comparar.")
+    parser.add_argument("--max-regression", type=float, default=0.10)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    args.models = args.models or [OLLAMA_MODEL]
+    if args.routing_fast_model and args.routing_fast_model not in args.models:
+        args.models.append(args.routing_fast_model)
+
+    # El pipeline usa rutas relativas (processed/, cache/, data/): se ejecuta en un directorio temporal
+    original_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="bench_pipeline_") as workdir:
+        os.chdir(workdir)
+        try:
+            result = run_benchmark(args, workdir)
+        finally:
+            os.chdir(original_cwd)
+
+    print_report(result)
+    if args.json_output:
+        with open(args.json_output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"\nResultado guardado en {args.json_output}")
+    if args.compare and not compare_with_baseline(result, args.compare, args.max_regression):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
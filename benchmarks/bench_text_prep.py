@@ -0,0 +1,84 @@
+# benchmarks/bench_text_prep.py
+# Micro-benchmark de la preparación de texto de tickets:
+# implementación anterior (iterrows + BeautifulSoup por celda) frente a build_ticket_contents (por columnas).
+#
+# Uso (desde la raíz del proyecto):
+#   python benchmarks/bench_text_prep.py --rows 100000 --html-ratio 0.3
+import argparse
+import os
+import re
+import sys
+import time
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import DEFAULT_COLUMNS_TO_ANALYZE, IDENTIFIER_PATTERNS_TO_EXCLUDE
+from processing_logic import build_ticket_contents
+from synthetic_tickets import synthetic_export
+
+
+# --- Implementación de referencia (anterior) ---
+def legacy_clean_html_and_identifiers(text):
+    if not isinstance(text, str):
+        return ""
+    soup = BeautifulSoup(text, "html.parser")
+    cleaned_text = soup.get_text(separator=" ")
+    for pattern in IDENTIFIER_PATTERNS_TO_EXCLUDE:
+        cleaned_text = re.sub(pattern, "", cleaned_text, flags=re.IGNORECASE)
+    cleaned_text = re.sub(r'\s+', ' ', cleaned_text).strip()
+    return cleaned_text
+
+
+def legacy_build_ticket_contents(df, selected_columns):
+    desc_col = selected_columns.get('description_column')
+    short_desc_col = selected_columns.get('short_description_column')
+    work_notes_col = selected_columns.get('work_notes_column')
+    ticket_contents = []
+    for index, row in df.iterrows():
+        ticket_parts = []
+        if short_desc_col and short_desc_col in df.columns and pd.notna(row.get(short_desc_col)):
+            ticket_parts.append(f"Descripción breve: {legacy_clean_html_and_identifiers(str(row[short_desc_col]))}")
+        if desc_col and desc_col in df.columns and pd.notna(row.get(desc_col)):
+            ticket_parts.append(f"Descripción completa: {legacy_clean_html_and_identifiers(str(row[desc_col]))}")
+        if work_notes_col and work_notes_col in df.columns and pd.notna(row.get(work_notes_col)):
+            ticket_parts.append(f"Notas de trabajo: {legacy_clean_html_and_identifiers(str(row[work_notes_col]))}")
+        full_ticket_content = " || ".join(ticket_parts)
+        if not full_ticket_content.strip():
+            full_ticket_content = "Contenido del ticket no disponible o vacío en columnas seleccionadas."
+        ticket_contents.append(full_ticket_content)
+    return ticket_contents
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de preparación de texto de tickets.")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--html-ratio", type=float, default=0.3, help="Fracción de celdas con marcado HTML.")
+    parser.add_argument("--skip-legacy", action="store_true", help="No ejecutar la implementación anterior.")
+    args = parser.parse_args()
+
+    df = synthetic_export(args.rows, args.html_ratio)
+    print(f"Export sintético: {args.rows} filas, {args.html_ratio:.0%} de celdas con HTML")
+
+    start = time.perf_counter()
+    new_contents = build_ticket_contents(df, DEFAULT_COLUMNS_TO_ANALYZE)
+    new_elapsed = time.perf_counter() - start
+    print(f"build_ticket_contents (por columnas): {new_elapsed:.2f}s ({args.rows / new_elapsed:,.0f} filas/s)")
+
+    if args.skip_legacy:
+        return
+
+    start = time.perf_counter()
+    legacy_contents = legacy_build_ticket_contents(df, DEFAULT_COLUMNS_TO_ANALYZE)
+    legacy_elapsed = time.perf_counter() - start
+    print(f"iterrows + BeautifulSoup (anterior): {legacy_elapsed:.2f}s ({args.rows / legacy_elapsed:,.0f} filas/s)")
+    print(f"Aceleración: x{legacy_elapsed / new_elapsed:.1f}")
+
+    mismatches = sum(1 for a, b in zip(new_contents, legacy_contents) if a != b)
+    print(f"Filas con resultado distinto: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
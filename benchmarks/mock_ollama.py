@@ -0,0 +1,256 @@
+# benchmarks/mock_ollama.py
+# Servidor local que imita /api/generate, /api/embed, /api/tags y /api/show de Ollama para medir el pipeline sin un modelo real.
+#
+# Uso independiente (desde la raíz del proyecto):
+#   python benchmarks/mock_ollama.py --port 11434 --latency-ms 300 --latency-jitter 0.5 --error-rate 0.02
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+TICKET_MARKER_PATTERN = re.compile(r"\[TICKET (\d+)\]")
+WORD_PATTERN = re.compile(r"\w+")
+MOCK_EMBEDDING_DIMS = 512
+MOCK_CATEGORIES = ["Solicitud de Acceso", "Problema de Software", "Fallo de Hardware", "Problema de Red",
+                   "Restablecimiento de Contraseña"]
+
+
+# --- Configuración del Servidor Simulado ---
+class MockOllamaConfig:
+    def __init__(self, latency_ms=200.0, latency_jitter=0.3, latency_distribution="lognormal",
+                 ms_per_prompt_char=0.0, error_rate=0.0, malformed_json_rate=0.0, context_length=8192,
+                 max_parallel=0, models=("gemma:2b",), seed=None, model_latency_ms=None):
+        self.latency_ms = latency_ms
+        self.model_latency_ms = dict(model_latency_ms or {})  # Latencia media distinta por modelo (p. ej. modelo rápido)
+        self.latency_jitter = latency_jitter
+        self.latency_distribution = latency_distribution
+        self.ms_per_prompt_char = ms_per_prompt_char
+        self.error_rate = error_rate
+        self.malformed_json_rate = malformed_json_rate
+        self.context_length = context_length
+        self.max_parallel = max_parallel  # 0 = sin límite; >0 simula las ranuras de OLLAMA_NUM_PARALLEL
+        self.models = list(models)
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+
+    def sample_latency_seconds(self, prompt_chars, model_name=None):
+        mean_ms = self.model_latency_ms.get(model_name, self.latency_ms)
+        with self.rng_lock:
+            if self.latency_distribution == "fixed" or self.latency_jitter <= 0:
+                base_ms = mean_ms
+            elif self.latency_distribution == "uniform":
+                base_ms = self.rng.uniform(mean_ms * (1 - self.latency_jitter), mean_ms * (1 + self.latency_jitter))
+            else:
+                # Lognormal con media mean_ms: cola larga como en un LLM real
+                sigma = self.latency_jitter
+                mu = math.log(max(mean_ms, 0.001)) - sigma ** 2 / 2
+                base_ms = self.rng.lognormvariate(mu, sigma)
+        return max(base_ms + prompt_chars * self.ms_per_prompt_char, 0) / 1000.0
+
+    def roll(self, rate):
+        with self.rng_lock:
+            return self.rng.random() < rate
+
+
+def build_mock_analysis(rng_choice):
+    return {
+        "Clasificacion_Sugerida_IA": rng_choice(MOCK_CATEGORIES),
+        "Problema_Principal_IA": "Problema simulado",
+        "Sintomas_Detectados_IA": "Síntomas simulados",
+        "Acciones_Realizadas_IA": "No especificado",
+        "Causa_Raiz_Estimada_IA": "No especificado",
+        "Resumen_General_Conciso_IA": "Resumen generado por el servidor simulado."
+    }
+
+
+def build_mock_embedding(text):
+    # Bigramas de palabras con hashing: textos que comparten casi todo (mismo error, distinto host) tienen
+    # similitud coseno alta y textos distintos con el mismo vocabulario, baja, como con un modelo real
+    vector = [0.0] * MOCK_EMBEDDING_DIMS
+    words = WORD_PATTERN.findall((text or "").lower())
+    for bigram in zip(words, words[1:] or [""]):
+        bucket = int.from_bytes(hashlib.blake2b(" ".join(bigram).encode("utf-8"), digest_size=4).digest(), "little")
+        vector[bucket % MOCK_EMBEDDING_DIMS] += 1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+# --- Servidor HTTP ---
+class MockOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, mock_config):
+        super().__init__(address, MockOllamaHandler)
+        self.mock_config = mock_config
+        self.stats_lock = threading.Lock()
+        self.stats = {"generate_requests": 0, "embed_requests": 0, "errors_injected": 0, "malformed_injected": 0}
+        self.slots = threading.Semaphore(mock_config.max_parallel) if mock_config.max_parallel > 0 else None
+
+    def count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, como el servidor real
+    disable_nagle_algorithm = True  # Cabeceras y cuerpo van en escrituras separadas: evita el retardo de ACK de ~40 ms
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length) if length else b"{}"
+        try:
+            return json.loads(raw_body or b"{}")
+        except json.JSONDecodeError:
+            return {}
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/api/tags":
+            self._send_json({"models": [{"name": name} for name in self.server.mock_config.models]})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        payload = self._read_json()
+        path = self.path.rstrip("/")
+        if path == "/api/show":
+            self._send_json({"model_info": {"general.architecture": "mock",
+                                            "mock.context_length": self.server.mock_config.context_length}})
+        elif path == "/api/generate":
+            self._handle_generate(payload)
+        elif path == "/api/embed":
+            self.server.count("embed_requests")
+            inputs = payload.get("input")
+            inputs = inputs if isinstance(inputs, list) else [inputs]
+            self._send_json({"model": payload.get("model"), "embeddings": [build_mock_embedding(text) for text in inputs]})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _handle_generate(self, payload):
+        mock_config = self.server.mock_config
+        self.server.count("generate_requests")
+        prompt = payload.get("prompt", "")
+        if payload.get("model") not in mock_config.models:
+            self._send_json({"error": f"model '{payload.get('model')}' not found"}, status=404)
+            return
+
+        if self.server.slots is not None:
+            self.server.slots.acquire()
+        try:
+            started = time.perf_counter()
+            time.sleep(mock_config.sample_latency_seconds(len(prompt), payload.get("model")))
+            elapsed_ns = int((time.perf_counter() - started) * 1e9)
+        finally:
+            if self.server.slots is not None:
+                self.server.slots.release()
+
+        if mock_config.roll(mock_config.error_rate):
+            self.server.count("errors_injected")
+            self._send_json({"error": "simulated server error"}, status=500)
+            return
+
+        ticket_indices = [int(index) for index in TICKET_MARKER_PATTERN.findall(prompt)]
+        with mock_config.rng_lock:
+            if payload.get("format") != "json":
+                # Peticiones de texto libre (resumen de notas de trabajo)
+                response_text = "Resumen simulado: " + " ".join(mock_config.rng.choice(prompt.split() or ["-"]) for _ in range(40))
+            elif ticket_indices:
+                analyses = [dict(build_mock_analysis(mock_config.rng.choice), ticket_index=index) for index in ticket_indices]
+                response_text = json.dumps({"results": analyses}, ensure_ascii=False)
+            else:
+                analysis = build_mock_analysis(mock_config.rng.choice)
+                if "Confianza_IA" in prompt:
+                    analysis["Confianza_IA"] = round(mock_config.rng.uniform(0.4, 1.0), 2)
+                response_text = json.dumps(analysis, ensure_ascii=False)
+        if payload.get("format") == "json" and mock_config.roll(mock_config.malformed_json_rate):
+            self.server.count("malformed_injected")
+            response_text = response_text[: len(response_text) // 2]
+
+        prompt_tokens = len(prompt) // 4 + 1
+        eval_tokens = len(response_text) // 4 + 1
+        self._send_json({
+            "model": payload.get("model"),
+            "response": response_text,
+            "done": True,
+            "prompt_eval_count": prompt_tokens,
+            "eval_count": eval_tokens,
+            "total_duration": elapsed_ns,
+            "prompt_eval_duration": elapsed_ns // 4,
+            "eval_duration": elapsed_ns - elapsed_ns // 4
+        })
+
+
+def start_mock_server(mock_config, host="127.0.0.1", port=0):
+    # port=0 -> puerto libre asignado por el sistema
+    server = MockOllamaServer((host, port), mock_config)
+    thread = threading.Thread(target=server.serve_forever, name=f"mock-ollama-{server.server_address[1]}", daemon=True)
+    thread.start()
+    return server
+
+
+def add_mock_arguments(parser):
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="Latencia media por petición.")
+    parser.add_argument("--latency-jitter", type=float, default=0.3,
+                        help="Dispersión: sigma (lognormal) o fracción +/- (uniform).")
+    parser.add_argument("--latency-distribution", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--ms-per-prompt-char", type=float, default=0.0,
+                        help="Latencia adicional por carácter de prompt (simula el coste de prompts largos).")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de respuestas HTTP 500.")
+    parser.add_argument("--malformed-json-rate", type=float, default=0.0, help="Fracción de respuestas con JSON truncado.")
+    parser.add_argument("--max-parallel", type=int, default=0, help="Peticiones atendidas a la vez (0 = sin límite).")
+    parser.add_argument("--context-length", type=int, default=8192)
+    parser.add_argument("--model", action="append", dest="models", help="Modelos anunciados en /api/tags.")
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODELO=MS",
+                        help="Latencia media específica de un modelo (p. ej. gemma:2b=80).")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def mock_config_from_args(args):
+    return MockOllamaConfig(
+        latency_ms=args.latency_ms, latency_jitter=args.latency_jitter,
+        latency_distribution=args.latency_distribution, ms_per_prompt_char=args.ms_per_prompt_char,
+        error_rate=args.error_rate, malformed_json_rate=args.malformed_json_rate,
+        context_length=args.context_length, max_parallel=args.max_parallel,
+        models=args.models or ("gemma:2b",), seed=args.seed,
+        model_latency_ms={name: float(ms) for name, _, ms in (item.rpartition("=") for item in args.model_latency)}
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor Ollama simulado para benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    server = MockOllamaServer((args.host, args.port), mock_config_from_args(args))
+    print(f"Ollama simulado escuchando en {server.base_url} (Ctrl+C para salir)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# benchmarks/synthetic_tickets.py
+# Generador de exportaciones sintéticas con la forma de un export de incidencias de ServiceNow.
+import csv
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+import pandas as pd
+from openpyxl import Workbook
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import DEFAULT_COLUMNS_TO_ANALYZE
+
+VOCABULARY = ["usuario", "no", "puede", "acceder", "VPN", "impresora", "error", "servidor", "contraseña",
+              "reinicio", "aplicación", "SAP", "correo", "lento", "timeout", "red", "disco", "lleno"]
+ASSIGNMENT_GROUPS = ["Service Desk", "Redes", "Aplicaciones SAP", "Puesto de Trabajo", "Sistemas"]
+STATES = ["New", "In Progress", "On Hold", "Resolved", "Closed"]
+
+
+def synthetic_ticket_text(rng, html_ratio, words=30):
+    text = " ".join(rng.choice(VOCABULARY) for _ in range(words))
+    if rng.random() < 0.2:
+        text = f"[INC{rng.randint(100000, 999999)}] {text} CRQ{rng.randint(1000, 9999)}"
+    if rng.random() < html_ratio:
+        text = f"<p>{text}</p><br/><b>Detalle:</b>&nbsp;{rng.choice(VOCABULARY)}"
+    return text
+
+
+def synthetic_work_notes_log(rng, html_ratio, entries, opened):
+    # Notas de trabajo con una entrada por actualización, la más reciente primero (formato de ServiceNow)
+    timestamps = sorted((opened + timedelta(minutes=rng.randint(1, 60 * 24 * 30)) for _ in range(entries)), reverse=True)
+    return "\n\n".join(
+        f"{timestamp:%Y-%m-%d %H:%M:%S} - Técnico {rng.randint(1, 40)} (Work notes)\n{synthetic_ticket_text(rng, html_ratio, 40)}"
+        for timestamp in timestamps
+    )
+
+
+def synthetic_export(rows, html_ratio, seed=42, duplicate_ratio=0.0, work_notes_words=60, near_duplicate_ratio=0.0,
+                     long_notes_ratio=0.0, long_notes_entries=150):
+    # duplicate_ratio: fracción de filas que repiten el texto de una fila anterior (incidencias masivas)
+    # near_duplicate_ratio: fracción de filas que repiten una fila anterior cambiando el servidor afectado
+    # long_notes_ratio: fracción de filas con un historial largo de notas de trabajo (long_notes_entries entradas)
+    rng = random.Random(seed)
+    opened_base = datetime(2024, 1, 1)
+    short_descriptions, descriptions, work_notes = [], [], []
+    base_descriptions = []  # descripción sin el servidor añadido, para no encadenar variaciones
+    for i in range(rows):
+        if i and rng.random() < duplicate_ratio + near_duplicate_ratio:
+            source = rng.randrange(i)
+            is_near_duplicate = rng.random() < near_duplicate_ratio / (duplicate_ratio + near_duplicate_ratio)
+            host_suffix = f" en el servidor SRV{rng.randint(1000, 9999)}" if is_near_duplicate else ""
+            short_descriptions.append(short_descriptions[source])
+            descriptions.append(base_descriptions[source] + host_suffix if is_near_duplicate else descriptions[source])
+            base_descriptions.append(base_descriptions[source])
+            work_notes.append(work_notes[source])
+            continue
+        short_descriptions.append(synthetic_ticket_text(rng, html_ratio, 8))
+        descriptions.append(synthetic_ticket_text(rng, html_ratio, 40))
+        base_descriptions.append(descriptions[-1])
+        if rng.random() < long_notes_ratio:
+            work_notes.append(synthetic_work_notes_log(rng, html_ratio, long_notes_entries, opened_base + timedelta(minutes=17 * i)))
+        else:
+            work_notes.append(synthetic_ticket_text(rng, html_ratio, work_notes_words) if rng.random() < 0.7 else None)
+
+    return pd.DataFrame({
+        "Number": [f"INC{i:07d}" for i in range(rows)],
+        "Opened": [opened_base + timedelta(minutes=17 * i) for i in range(rows)],
+        "State": [rng.choice(STATES) for _ in range(rows)],
+        "Priority": [f"{rng.randint(1, 5)} - Prioridad" for _ in range(rows)],
+        "Assignment group": [rng.choice(ASSIGNMENT_GROUPS) for _ in range(rows)],
+        DEFAULT_COLUMNS_TO_ANALYZE["short_description_column"]: short_descriptions,
+        DEFAULT_COLUMNS_TO_ANALYZE["description_column"]: descriptions,
+        DEFAULT_COLUMNS_TO_ANALYZE["work_notes_column"]: work_notes,
+    })
+
+
+def write_synthetic_workbook(df, filepath):
+    # Escritura en modo write_only/CSV para poder generar exportaciones grandes sin agotar la memoria
+    if filepath.lower().endswith(".csv"):
+        df.to_csv(filepath, index=False, encoding="utf-8-sig", quoting=csv.QUOTE_MINIMAL)
+        return filepath
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet()
+    worksheet.append(list(df.columns))
+    for row in df.itertuples(index=False, name=None):
+        worksheet.append([None if value is None or (isinstance(value, float) and pd.isna(value)) else value
+                          for value in row])
+    workbook.save(filepath)
+    workbook.close()
+    return filepath
@@ -0,0 +1,90 @@
+# checkpoint_store.py
+import sqlite3
+import json
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+from config import CHECKPOINT_DB_PATH
+
+
+# --- Checkpoints por Fila ---
+# Cada resultado de análisis se guarda en cuanto se completa, indexado por (task_id, fila). Al reanudar
+# una tarea solo se envían al LLM las filas que todavía no tienen resultado.
+class CheckpointStore:
+    def __init__(self, db_path=CHECKPOINT_DB_PATH):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS row_results ("
+                " task_id TEXT NOT NULL,"
+                " row_index INTEGER NOT NULL,"
+                " result_json TEXT NOT NULL,"
+                " saved_at REAL NOT NULL,"
+                " PRIMARY KEY (task_id, row_index))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_row_results_saved_at ON row_results(saved_at)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA busy_timeout=30000")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def save_rows(self, task_id, results_by_row):
+        if not results_by_row:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO row_results (task_id, row_index, result_json, saved_at) VALUES (?, ?, ?, ?)",
+                [(task_id, int(row_index), json.dumps(result, ensure_ascii=False), now)
+                 for row_index, result in results_by_row.items()]
+            )
+
+    def load_rows(self, task_id, start_row, end_row):
+        # Resultados guardados para las filas [start_row, end_row)
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT row_index, result_json FROM row_results WHERE task_id = ? AND row_index >= ? AND row_index < ?",
+                (task_id, start_row, end_row)
+            ).fetchall()
+        return {row_index: json.loads(result_json) for row_index, result_json in rows}
+
+    def count_rows(self, task_id):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM row_results WHERE task_id = ?", (task_id,)).fetchone()[0]
+
+    def clear_task(self, task_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM row_results WHERE task_id = ?", (task_id,))
+
+    def delete_older_than(self, cutoff_timestamp):
+        # Las tareas cuyos archivos ya se eliminaron no se pueden reanudar
+        with self._connect() as conn:
+            cur = conn.execute(
+                "DELETE FROM row_results WHERE task_id IN ("
+                " SELECT task_id FROM row_results GROUP BY task_id HAVING MAX(saved_at) < ?)",
+                (cutoff_timestamp,)
+            )
+            return cur.rowcount
+
+
+_checkpoint_store = None
+_checkpoint_store_lock = threading.Lock()
+
+def get_checkpoint_store():
+    global _checkpoint_store
+    with _checkpoint_store_lock:
+        if _checkpoint_store is None:
+            _checkpoint_store = CheckpointStore()
+        return _checkpoint_store
@@ -0,0 +1,119 @@
+# concurrency_limiter.py
+import threading
+import time
+from collections import deque
+
+from config import (
+    ADAPTIVE_CONCURRENCY_INITIAL, ADAPTIVE_CONCURRENCY_MIN, ADAPTIVE_CONCURRENCY_MAX,
+    ADAPTIVE_CONCURRENCY_LATENCY_TOLERANCE, ADAPTIVE_CONCURRENCY_DECREASE_FACTOR,
+    ADAPTIVE_CONCURRENCY_THROUGHPUT_WINDOW_SECONDS
+)
+
+
+# --- Limitador Adaptativo de Concurrencia (AIMD) ---
+# Aumenta el límite en +1 por cada "ventana" de respuestas correctas mientras la latencia reciente se
+# mantenga cerca de la latencia base (media a largo plazo), y lo reduce multiplicativamente ante errores
+# de sobrecarga (timeouts, conexiones rechazadas, 5xx) o cuando la latencia reciente se dispara porque
+# Ollama empieza a encolar peticiones.
+class AdaptiveConcurrencyLimiter:
+    def __init__(self, initial_limit=ADAPTIVE_CONCURRENCY_INITIAL, min_limit=ADAPTIVE_CONCURRENCY_MIN,
+                 max_limit=ADAPTIVE_CONCURRENCY_MAX, latency_tolerance=ADAPTIVE_CONCURRENCY_LATENCY_TOLERANCE,
+                 decrease_factor=ADAPTIVE_CONCURRENCY_DECREASE_FACTOR,
+                 throughput_window_seconds=ADAPTIVE_CONCURRENCY_THROUGHPUT_WINDOW_SECONDS):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.decrease_factor = decrease_factor
+        self.throughput_window_seconds = throughput_window_seconds
+        self._limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self._smoothed_latency = None
+        self._baseline_latency = None
+        self._last_decrease_at = 0.0
+        self._requests_completed = 0
+        self._overload_errors = 0
+        self._recent_completions = deque()  # (timestamp, tokens generados)
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    def acquire(self):
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(self, latency_seconds, overloaded=False, generated_tokens=0):
+        now = time.monotonic()
+        with self._condition:
+            self._in_flight -= 1
+            self._requests_completed += 1
+            self._recent_completions.append((now, generated_tokens or 0))
+            while self._recent_completions and now - self._recent_completions[0][0] > self.throughput_window_seconds:
+                self._recent_completions.popleft()
+
+            if overloaded:
+                self._overload_errors += 1
+                self._decrease(now)
+            elif latency_seconds is not None:
+                self._record_latency(latency_seconds)
+                if self._smoothed_latency > self._baseline_latency * self.latency_tolerance:
+                    self._decrease(now)
+                elif self._in_flight + 1 >= int(self._limit):
+                    # Solo se sube el límite si realmente se está usando por completo
+                    self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+            self._condition.notify_all()
+
+    def _record_latency(self, latency_seconds):
+        if self._smoothed_latency is None:
+            self._smoothed_latency = latency_seconds
+            self._baseline_latency = latency_seconds
+            return
+        # Media rápida (latencia reciente) frente a media lenta (latencia base): la duración de cada
+        # generación varía mucho con el ticket, así que se comparan tendencias y no muestras sueltas.
+        # La base baja rápido y sube muy despacio, para que una cola sostenida no se convierta en la nueva normalidad.
+        self._smoothed_latency = 0.8 * self._smoothed_latency + 0.2 * latency_seconds
+        baseline_weight = 0.2 if latency_seconds < self._baseline_latency else 0.005
+        self._baseline_latency = (1 - baseline_weight) * self._baseline_latency + baseline_weight * latency_seconds
+
+    def _decrease(self, now):
+        # Como mucho una reducción por latencia media, para no colapsar ante una ráfaga de respuestas lentas
+        cooldown = self._smoothed_latency or 1.0
+        if now - self._last_decrease_at < cooldown:
+            return
+        self._limit = max(float(self.min_limit), self._limit * self.decrease_factor)
+        self._last_decrease_at = now
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._condition:
+            recent = [entry for entry in self._recent_completions if now - entry[0] <= self.throughput_window_seconds]
+            tokens_per_second = 0.0
+            requests_per_second = 0.0
+            if recent:
+                elapsed = max(now - recent[0][0], 1.0)
+                tokens_per_second = sum(tokens for _, tokens in recent) / elapsed
+                requests_per_second = len(recent) / elapsed
+            return {
+                "current_limit": int(self._limit),
+                "in_flight": self._in_flight,
+                "smoothed_latency_seconds": round(self._smoothed_latency, 3) if self._smoothed_latency is not None else None,
+                "baseline_latency_seconds": round(self._baseline_latency, 3) if self._baseline_latency is not None else None,
+                "tokens_per_second": round(tokens_per_second, 2),
+                "requests_per_second": round(requests_per_second, 3),
+                "requests_completed": self._requests_completed,
+                "overload_errors": self._overload_errors
+            }
+
+
+_concurrency_limiter = None
+_concurrency_limiter_lock = threading.Lock()
+
+def get_concurrency_limiter():
+    global _concurrency_limiter
+    with _concurrency_limiter_lock:
+        if _concurrency_limiter is None:
+            _concurrency_limiter = AdaptiveConcurrencyLimiter()
+        return _concurrency_limiter
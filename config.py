@@ -1,15 +1,26 @@
 # config.py
-import psutil
-
 # --- Ollama Configuration ---
 OLLAMA_BASE_URL = "http://localhost:11434"
 OLLAMA_MODEL = "gemma:2b"  # Modelo por defecto, puedes cambiarlo
+OLLAMA_POOL_SIZE = 32  # Conexiones keep-alive reutilizables hacia Ollama
+OLLAMA_CONNECT_TIMEOUT = 5  # segundos
+OLLAMA_READ_TIMEOUT = 180  # segundos (3 minutos por respuesta)
+OLLAMA_MAX_RETRIES = 3  # Reintentos ante errores 5xx o fallos de conexión (nunca ante timeouts de lectura)
+OLLAMA_RETRY_BACKOFF_FACTOR = 0.5  # Espera entre reintentos: 0.5s, 1s, 2s...
+# Instancias de Ollama entre las que se reparten las peticiones (la que tenga menos peticiones en curso).
+# Ej: ["http://gpu1:11434", "http://gpu2:11434"]. Todas deben tener descargados los modelos que se usen.
+OLLAMA_BASE_URLS = [OLLAMA_BASE_URL]
+OLLAMA_HEALTH_CHECK_INTERVAL_SECONDS = 10  # Comprobación periódica de /api/tags en cada instancia (con varias)
+OLLAMA_HEALTH_CHECK_TIMEOUT = 5  # segundos
+OLLAMA_BACKEND_EJECT_AFTER_FAILURES = 3  # Fallos consecutivos (5xx o conexión) para retirar una instancia
+OLLAMA_BACKEND_EJECT_SECONDS = 30  # Tiempo mínimo fuera antes de readmitirla si vuelve a responder
 
 # --- Processing Configuration ---
 DEFAULT_COLUMNS_TO_ANALYZE = {
     "description_column": "Description",
     "short_description_column": "Short description",
-    "work_notes_column": "Work notes"
+    "work_notes_column": "Work notes",
+    "ticket_id_column": "Number"  # Identificador estable del ticket (análisis incremental)
 }
 # DEFAULT_CATEGORIES ya no se usa activamente para la clasificación principal,
 # ya que ahora la IA sugiere la clasificación en una columna dedicada.
@@ -21,14 +32,149 @@ DEFAULT_CATEGORIES = [
 
 
 # --- System Configuration ---
-MAX_WORKERS = psutil.cpu_count(logical=True)
+# La concurrencia real hacia Ollama la decide el limitador adaptativo (concurrency_limiter.py):
+# parte de ADAPTIVE_CONCURRENCY_INITIAL y converge entre MIN y MAX según latencia y errores.
+# El número de CPUs no es relevante: el cuello de botella es la GPU del servidor Ollama.
+ADAPTIVE_CONCURRENCY_INITIAL = 4
+ADAPTIVE_CONCURRENCY_MIN = 1
+ADAPTIVE_CONCURRENCY_MAX = OLLAMA_POOL_SIZE * len(OLLAMA_BASE_URLS)
+ADAPTIVE_CONCURRENCY_LATENCY_TOLERANCE = 2.0  # Latencia > 2x la base se considera saturación
+ADAPTIVE_CONCURRENCY_DECREASE_FACTOR = 0.7
+ADAPTIVE_CONCURRENCY_THROUGHPUT_WINDOW_SECONDS = 30
+MAX_WORKERS = ADAPTIVE_CONCURRENCY_MAX
 # MAX_WORKERS = 1 # Reduce para pruebas si Ollama se satura
 
+# --- Batched Prompts ---
+# En modo por lotes, los tickets cortos se agrupan en un único prompt que devuelve un arreglo de resultados.
+BATCH_MAX_TICKET_CHARS = 600  # Solo se agrupan tickets con contenido limpio de hasta N caracteres
+BATCH_MAX_SIZE = 10  # Máximo de tickets por prompt
+BATCH_DEFAULT_CONTEXT_TOKENS = 2048  # Si no se puede consultar /api/show para el modelo
+BATCH_MAX_CONTEXT_TOKENS = 8192  # Tope de num_ctx solicitado a Ollama (más contexto = más VRAM)
+BATCH_OUTPUT_TOKENS_PER_TICKET = 200  # Tokens de respuesta reservados por ticket
+
+# --- Prompt Token Budget ---
+# Tokens estimados (~4 caracteres por token) que puede ocupar el contenido de cada ticket en el prompt (0 = sin límite).
+# Con el contexto por defecto de Ollama (2048) quedan ~800 tokens para instrucciones, contexto adicional y respuesta.
+PROMPT_TICKET_TOKEN_BUDGET = 1200
+PROMPT_DESCRIPTION_MAX_SHARE = 0.5  # Fracción del presupuesto reservada a la descripción cuando también hay notas de trabajo
+WORK_NOTES_NEWEST_FIRST = True  # Las exportaciones de ServiceNow listan primero las entradas más recientes
+# Cabecera de cada entrada de las notas de trabajo ("2024-01-05 10:22:33 - Nombre Apellido (Work notes)")
+WORK_NOTES_ENTRY_PATTERN = r"\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}\s+\d{1,2}:\d{2}(?::\d{2})?(?:\s*[AaPp][Mm])?\s+-\s+"
+# Entradas que se conservan con preferencia (tras la más reciente) al recortar notas largas
+WORK_NOTES_RELEVANT_PATTERNS = [
+    r"resuel[tv]", r"soluci[oó]n", r"causa", r"workaround", r"escalad", r"resolved", r"root cause"
+]
+WORK_NOTES_SUMMARY_ENABLED = False  # Resumir con el LLM las notas muy largas antes del análisis
+WORK_NOTES_SUMMARY_MIN_TOKENS = 3000  # Solo se resumen notas de más de N tokens estimados
+WORK_NOTES_SUMMARY_INPUT_TOKENS = 6000  # Máximo de tokens de notas (entradas más recientes y relevantes) enviados al resumen; se recorta al contexto de la tarea
+WORK_NOTES_SUMMARY_MAX_TOKENS = 300  # Longitud máxima del resumen (num_predict)
+WORK_NOTES_SUMMARY_MODEL = None  # None = el mismo modelo del análisis
+
+# --- Semantic Clustering (Embeddings) ---
+# Opcional por análisis: agrupa tickets por similitud de embeddings (/api/embed de Ollama) y reutiliza
+# el análisis del representante de cada grupo para los tickets casi idénticos.
+EMBEDDING_MODEL = 'nomic-embed-text'  # Requiere `ollama pull nomic-embed-text`
+EMBEDDING_BATCH_SIZE = 64  # Textos por petición a /api/embed
+EMBEDDING_MAX_CHARS = 2000  # Se recorta el contenido del ticket antes de calcular el embedding
+SEMANTIC_CLUSTER_THRESHOLD = 0.85  # Similitud coseno mínima para pertenecer al grupo de un representante
+SEMANTIC_REUSE_THRESHOLD = 0.95  # Similitud mínima para reutilizar el análisis del representante sin llamar al LLM
+SEMANTIC_MAX_CLUSTERS = 20000  # Tope de representantes en memoria (768 dims x 20000 ~ 60 MB)
+SEMANTIC_TOP_CLUSTERS = 10  # Grupos más grandes incluidos en el resumen
+SEMANTIC_RECOMMENDATION_MIN_SHARE = 0.02  # Grupos con al menos este % de tickets generan una recomendación
+SEMANTIC_RECOMMENDATION_MIN_SIZE = 5
+
+# --- Two-Tier Model Routing ---
+# Opcional por análisis: los tickets cortos y sin ambigüedad los resuelven reglas de palabras clave o un
+# modelo pequeño; solo los largos o dudosos se escalan al modelo seleccionado (modelo principal).
+ROUTING_FAST_MODEL = "gemma:2b"  # Modelo rápido del primer nivel
+ROUTING_KEYWORD_MAX_CHARS = 400  # Solo tickets de hasta N caracteres se resuelven por palabras clave
+ROUTING_FAST_MAX_CHARS = 1500  # Tickets más largos van directamente al modelo principal
+ROUTING_MIN_CONFIDENCE = 0.75  # Confianza mínima declarada por el modelo rápido para aceptar su análisis
+# Reglas del clasificador por palabras clave: un ticket corto se resuelve sin LLM si coincide con
+# exactamente una regla. Los patrones son expresiones regulares sobre el texto en minúsculas.
+ROUTING_KEYWORD_RULES = [
+    {
+        "category": "Restablecimiento de Contraseña",
+        "problem": "El usuario necesita restablecer o desbloquear su contraseña.",
+        "patterns": [r"contrase[ñn]a", r"password", r"desbloque", r"cuenta bloqueada", r"reset(ear)? (la )?clave"]
+    },
+    {
+        "category": "Solicitud de Acceso",
+        "problem": "El usuario solicita acceso o permisos a un recurso.",
+        "patterns": [r"solicit\w* (de )?acceso", r"dar acceso", r"alta (de|en) ", r"permisos? (de|para|en) ", r"access request"]
+    },
+]
+
+# --- Streaming de Archivos ---
+STREAMING_CHUNK_ROWS = 1000  # Filas leídas, analizadas y escritas por bloque
+DEDUP_MAX_TRACKED_CONTENTS = 20000  # Contenidos que se recuerdan entre bloques para deduplicar en toda la tarea (~300 bytes cada uno)
+DEDUP_MAX_TRACKED_RESULTS_WITHOUT_CACHE = 2000  # Sin caché de resultados se guarda el resultado completo (unos KB cada uno)
+
+# --- Job Queue ---
+JOB_STORE_DB_PATH = 'data/jobs.sqlite3'
+JOB_WORKER_COUNT = 2  # Análisis simultáneos por proceso; el resto espera en la cola persistente
+JOB_POLL_INTERVAL_SECONDS = 2
+JOB_HEARTBEAT_INTERVAL_SECONDS = 10
+JOB_STALE_AFTER_SECONDS = 60  # Sin latido durante este tiempo, la tarea se considera abandonada y se reencola
+JOB_PROGRESS_WRITE_INTERVAL_SECONDS = 0.5  # Frecuencia máxima de escritura del progreso en la base de datos
+
+# --- Progress Streaming (SSE) ---
+SSE_POLL_INTERVAL_SECONDS = 0.5  # Lectura del estado de la tarea, compartida entre conexiones
+SSE_MIN_EVENT_INTERVAL_SECONDS = 1.0  # Como mucho un evento de progreso por segundo y conexión
+SSE_KEEPALIVE_SECONDS = 15
+SSE_MAX_STREAM_SECONDS = 300  # Duración máxima de una conexión; el navegador se reconecta solo y libera el hilo mientras tanto
+SSE_MAX_CONCURRENT_STREAMS = 32  # Conexiones SSE simultáneas por proceso; por encima, 503 y el cliente pasa a polling
+SSE_BUSY_RETRY_AFTER_SECONDS = 5  # Retry-After del 503: en cuanto otra conexión se cierre vuelve a haber hueco
+
+# --- Metrics ---
+# Límites superiores (segundos) de los buckets del histograma de etapas expuesto en /metrics
+METRICS_STAGE_BUCKETS_SECONDS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# --- Checkpoints ---
+CHECKPOINT_ENABLED = True
+CHECKPOINT_DB_PATH = 'data/checkpoints.sqlite3'
+
+# --- Incremental Analysis ---
+# Resultados anteriores por número de ticket + hash del contenido: en una nueva subida solo se analizan
+# los tickets nuevos o cuyo texto cambió
+INCREMENTAL_ANALYSIS_ENABLED = True  # Valor por defecto de la opción en el formulario
+TICKET_HISTORY_DB_PATH = 'data/ticket_history.sqlite3'
+TICKET_HISTORY_MAX_AGE_SECONDS = 180 * 24 * 60 * 60  # Se olvidan los tickets no vistos en 180 días
+
+# --- Health Monitor ---
+# El estado de Ollama y la lista de modelos se consultan en segundo plano: la página principal y /health
+# solo leen el último resultado, sin esperar a Ollama
+HEALTH_REFRESH_INTERVAL_SECONDS = 15
+FILE_CLEANUP_INTERVAL_SECONDS = 10 * 60  # Limpieza periódica de archivos antiguos (antes en cada carga de página)
+
 # --- File Management ---
 UPLOAD_FOLDER = 'uploads'
 PROCESSED_FOLDER = 'processed'
 MAX_FILE_AGE_SECONDS = 24 * 60 * 60  # 1 día
 
+# --- Result Store ---
+# Resultados de cada tarea en partes columnares (Parquet con pyarrow; pickle de pandas si no está instalado).
+# El archivo de descarga en el formato de la subida se genera al terminar la tarea; los demás formatos
+# (.xlsx, .csv, .csv.gz, .parquet) se generan al pedirlos y se reutilizan
+RESULTS_PAGE_SIZE_DEFAULT = 100  # Filas por página en /results/<task_id>
+RESULTS_PAGE_SIZE_MAX = 1000
+RESULT_EXPORT_LOCK_STALE_SECONDS = 600  # Un bloqueo de exportación más antiguo se considera abandonado
+RESULT_EXPORT_RETRY_AFTER_SECONDS = 3  # Espera sugerida al cliente mientras otra petición genera el archivo
+
+# --- Live Results ---
+# Filas terminadas durante el análisis (en orden de finalización) para revisarlas antes de que acabe la tarea
+LIVE_RESULTS_ENABLED = True
+LIVE_RESULTS_DB_PATH = 'data/live_results.sqlite3'
+LIVE_RESULTS_FLUSH_INTERVAL_SECONDS = 1.0  # Las filas se guardan por lotes como mucho cada segundo
+# Columnas del archivo original (claves de DEFAULT_COLUMNS_TO_ANALYZE) que acompañan al análisis de cada fila
+LIVE_RESULTS_SOURCE_COLUMNS = ("ticket_id_column", "short_description_column")
+
+# --- LLM Result Cache ---
+RESULT_CACHE_ENABLED = True
+RESULT_CACHE_DB_PATH = 'cache/llm_results.sqlite3'
+RESULT_CACHE_MAX_ENTRIES = 200000
+RESULT_CACHE_MAX_AGE_SECONDS = 30 * 24 * 60 * 60  # 30 días
+
 # --- HTML Cleaning & Identifier Filtering ---
 IDENTIFIER_PATTERNS_TO_EXCLUDE = [
     r"\[ARGONAUTA.*?\]",
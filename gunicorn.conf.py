@@ -0,0 +1,15 @@
+# gunicorn.conf.py
+# Uso: gunicorn -c gunicorn.conf.py app:app
+bind = "0.0.0.0:5001"
+workers = 2
+# Cada conexión SSE de progreso ocupa un hilo mientras está abierta: hace falta un worker con hilos
+worker_class = "gthread"
+threads = 16
+# Las descargas grandes y los streams de progreso pueden superar el timeout por defecto (30 s)
+timeout = 120
+
+
+def post_worker_init(worker):
+    # Cada worker arranca sus hilos de análisis y el monitor de estado al iniciarse, sin esperar a la primera petición
+    from app import start_background_threads
+    start_background_threads()
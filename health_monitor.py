@@ -0,0 +1,94 @@
+# health_monitor.py
+import threading
+import time
+
+from config import OLLAMA_BASE_URLS, HEALTH_REFRESH_INTERVAL_SECONDS, FILE_CLEANUP_INTERVAL_SECONDS
+from ollama_client import get_ollama_client
+from processing_logic import clean_old_files
+
+
+# --- Monitor de Estado en Segundo Plano ---
+# Un hilo consulta periódicamente /api/tags en cada instancia de Ollama y guarda el resultado; otro
+# elimina los archivos antiguos. Las peticiones HTTP solo leen el último estado guardado, de modo que
+# una carga de página no depende de que Ollama responda ni del número de archivos en disco.
+class HealthMonitor:
+    def __init__(self, refresh_interval=HEALTH_REFRESH_INTERVAL_SECONDS, cleanup_interval=FILE_CLEANUP_INTERVAL_SECONDS):
+        self.refresh_interval = refresh_interval
+        self.cleanup_interval = cleanup_interval
+        self._lock = threading.Lock()
+        self._status = {
+            "available": None,  # None mientras no haya terminado la primera comprobación
+            "message": "Comprobando el estado de Ollama...",
+            "models": [],
+            "backends": [],
+            "checked_at": None
+        }
+        self._last_cleanup = {"finished_at": None, "duration_seconds": None, "error": None}
+        self._stop_event = threading.Event()
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._started:
+                return
+            self._started = True
+            threading.Thread(target=self._refresh_loop, name="health-monitor", daemon=True).start()
+            threading.Thread(target=self._cleanup_loop, name="file-cleanup", daemon=True).start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _refresh_loop(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error comprobando el estado de Ollama: {e}")
+            if self._stop_event.wait(self.refresh_interval):
+                return
+
+    def _cleanup_loop(self):
+        while True:
+            started = time.monotonic()
+            error = None
+            try:
+                clean_old_files()
+            except Exception as e:
+                error = str(e)
+                print(f"Error en la limpieza periódica de archivos: {e}")
+            with self._lock:
+                self._last_cleanup = {"finished_at": time.time(), "duration_seconds": round(time.monotonic() - started, 3),
+                                      "error": error}
+            if self._stop_event.wait(self.cleanup_interval):
+                return
+
+    def refresh(self):
+        client = get_ollama_client()
+        client.check_backends()
+        backends = client.snapshot()
+        reachable = [backend for backend in backends if backend["reachable"]]
+        models = sorted({model for backend in reachable for model in backend["models"] or []})
+        if not reachable:
+            errors = "; ".join(backend["last_error"] or "sin respuesta" for backend in backends)
+            message = (f"No se pudo conectar a Ollama en {', '.join(OLLAMA_BASE_URLS)}. "
+                       f"Asegúrate que esté ejecutándose. Detalle: {errors[:200]}")
+        elif len(backends) > 1:
+            message = f"Disponible ({len(reachable)} de {len(backends)} instancias activas)"
+        else:
+            message = "Disponible"
+        with self._lock:
+            self._status = {
+                "available": bool(reachable),
+                "message": message,
+                "models": models,
+                "backends": backends,
+                "checked_at": time.time()
+            }
+
+    def status(self):
+        with self._lock:
+            status = dict(self._status)
+            status["age_seconds"] = round(time.time() - status["checked_at"], 1) if status["checked_at"] else None
+            status["last_file_cleanup"] = dict(self._last_cleanup)
+            return status
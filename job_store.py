@@ -0,0 +1,193 @@
+# job_store.py
+import sqlite3
+import json
+import time
+import os
+import threading
+from contextlib import contextmanager
+
+from config import JOB_STORE_DB_PATH
+
+# Columnas guardadas como JSON en la base de datos
+JSON_FIELDS = ("analysis_summary", "analysis_params", "runtime_stats")
+TASK_FIELDS = (
+    "task_id", "status", "message", "original_filename", "temp_filename_base", "filepath_on_server",
+    "processed_filepath_on_server", "progress_current", "progress_total", "analysis_summary",
+    "analysis_params", "runtime_stats", "priority", "worker_id", "created_at", "queued_at",
+    "started_at", "finished_at", "heartbeat_at", "updated_at"
+)
+ACTIVE_STATUSES = ("queued", "processing")
+
+
+# --- Almacén Persistente de Tareas (SQLite) ---
+# Sustituye al diccionario en memoria: el estado sobrevive a reinicios y es legible desde cualquier
+# proceso (p. ej. varios workers de gunicorn), y la cola se reparte de forma atómica entre workers.
+class JobStore:
+    def __init__(self, db_path=JOB_STORE_DB_PATH):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                " task_id TEXT PRIMARY KEY,"
+                " status TEXT NOT NULL,"
+                " message TEXT,"
+                " original_filename TEXT,"
+                " temp_filename_base TEXT,"
+                " filepath_on_server TEXT,"
+                " processed_filepath_on_server TEXT,"
+                " progress_current INTEGER DEFAULT 0,"
+                " progress_total INTEGER DEFAULT 1,"
+                " analysis_summary TEXT,"
+                " analysis_params TEXT,"
+                " runtime_stats TEXT,"
+                " priority INTEGER DEFAULT 0,"
+                " worker_id TEXT,"
+                " created_at REAL,"
+                " queued_at REAL,"
+                " started_at REAL,"
+                " finished_at REAL,"
+                " heartbeat_at REAL,"
+                " updated_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_queue ON tasks(status, priority, queued_at)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA busy_timeout=30000")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _row_to_task(row):
+        if row is None:
+            return None
+        task = dict(row)
+        for field in JSON_FIELDS:
+            if task.get(field) is not None:
+                try:
+                    task[field] = json.loads(task[field])
+                except json.JSONDecodeError:
+                    task[field] = None
+        return task
+
+    @staticmethod
+    def _encode_fields(fields):
+        unknown_fields = set(fields) - set(TASK_FIELDS)
+        if unknown_fields:
+            raise ValueError(f"Campos de tarea desconocidos: {', '.join(sorted(unknown_fields))}")
+        return {key: json.dumps(value, ensure_ascii=False) if key in JSON_FIELDS and value is not None else value
+                for key, value in fields.items()}
+
+    def create_task(self, task_id, **fields):
+        now = time.time()
+        fields = self._encode_fields(dict(fields, task_id=task_id, created_at=now, updated_at=now))
+        columns = ", ".join(fields)
+        placeholders = ", ".join("?" for _ in fields)
+        with self._connect() as conn:
+            conn.execute(f"INSERT INTO tasks ({columns}) VALUES ({placeholders})", tuple(fields.values()))
+
+    def get_task(self, task_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return self._row_to_task(row)
+
+    def update_task(self, task_id, **fields):
+        fields = self._encode_fields(dict(fields, updated_at=time.time()))
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE tasks SET {assignments} WHERE task_id = ?", tuple(fields.values()) + (task_id,))
+
+    def enqueue_task(self, task_id, analysis_params, priority=0):
+        # Devuelve False si la tarea ya está en cola o en proceso
+        now = time.time()
+        with self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE tasks SET status = 'queued', message = ?, analysis_params = ?, priority = ?,"
+                " queued_at = ?, updated_at = ?, started_at = NULL, finished_at = NULL, worker_id = NULL,"
+                " progress_current = 0, progress_total = 1, processed_filepath_on_server = NULL,"
+                " analysis_summary = NULL, runtime_stats = NULL"
+                " WHERE task_id = ? AND status NOT IN ('queued', 'processing')",
+                ("Análisis en cola...", json.dumps(analysis_params, ensure_ascii=False), int(priority), now, now, task_id)
+            )
+            return cur.rowcount == 1
+
+    def claim_next_task(self, worker_id):
+        # Mayor prioridad primero; a igual prioridad, orden de llegada (FIFO)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT task_id FROM tasks WHERE status = 'queued' ORDER BY priority DESC, queued_at ASC LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE tasks SET status = 'processing', message = ?, worker_id = ?, started_at = ?,"
+                    " heartbeat_at = ?, updated_at = ? WHERE task_id = ?",
+                    ("Hilo de análisis iniciado, preparando...", worker_id, now, now, now, row["task_id"])
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return self.get_task(row["task_id"])
+
+    def heartbeat(self, task_ids):
+        if not task_ids:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany("UPDATE tasks SET heartbeat_at = ? WHERE task_id = ? AND status = 'processing'",
+                             [(now, task_id) for task_id in task_ids])
+
+    def requeue_stale_tasks(self, stale_after_seconds):
+        # Tareas "processing" cuyo worker dejó de dar señales (caída, reinicio, despliegue) vuelven a la cola
+        cutoff = time.time() - stale_after_seconds
+        with self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE tasks SET status = 'queued', worker_id = NULL,"
+                " analysis_params = json_set(COALESCE(analysis_params, '{}'), '$.resume', json('true')),"
+                " message = 'Tarea reanudada tras la interrupción del worker anterior. En cola...'"
+                " WHERE status = 'processing' AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                (cutoff,)
+            )
+            return cur.rowcount
+
+    def queue_position(self, task_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT priority, queued_at FROM tasks WHERE task_id = ? AND status = 'queued'",
+                               (task_id,)).fetchone()
+            if row is None:
+                return None
+            ahead = conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE status = 'queued' AND"
+                " (priority > ? OR (priority = ? AND queued_at < ?))",
+                (row["priority"], row["priority"], row["queued_at"])
+            ).fetchone()[0]
+            return ahead + 1
+
+    def count_by_status(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS total FROM tasks GROUP BY status").fetchall()
+        return {row["status"]: row["total"] for row in rows}
+
+
+_job_store = None
+_job_store_lock = threading.Lock()
+
+def get_job_store():
+    global _job_store
+    with _job_store_lock:
+        if _job_store is None:
+            _job_store = JobStore()
+        return _job_store
@@ -0,0 +1,96 @@
+# job_worker.py
+import os
+import socket
+import threading
+import time
+import uuid
+
+from config import (
+    JOB_WORKER_COUNT, JOB_POLL_INTERVAL_SECONDS, JOB_HEARTBEAT_INTERVAL_SECONDS, JOB_STALE_AFTER_SECONDS
+)
+from job_store import get_job_store
+
+
+# --- Pool Acotado de Workers de Análisis ---
+# Un número fijo de hilos por proceso toma tareas de la cola persistente. Con varios procesos
+# (gunicorn) cada uno aporta sus workers y la cola se reparte de forma atómica a través de SQLite.
+class JobWorkerPool:
+    def __init__(self, run_job, worker_count=JOB_WORKER_COUNT, poll_interval=JOB_POLL_INTERVAL_SECONDS,
+                 heartbeat_interval=JOB_HEARTBEAT_INTERVAL_SECONDS, stale_after=JOB_STALE_AFTER_SECONDS):
+        self.run_job = run_job
+        self.worker_count = worker_count
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.pool_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._running_tasks = set()
+        self._running_tasks_lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._started:
+                return
+            self._started = True
+            requeued = get_job_store().requeue_stale_tasks(self.stale_after)
+            if requeued:
+                print(f"{requeued} tareas interrumpidas devueltas a la cola.")
+            for i in range(self.worker_count):
+                thread = threading.Thread(target=self._worker_loop, args=(f"{self.pool_id}/w{i}",),
+                                          name=f"analysis-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name="analysis-heartbeat", daemon=True)
+            heartbeat_thread.start()
+            self._threads.append(heartbeat_thread)
+
+    def notify(self):
+        # Despierta a los workers en cuanto se encola una tarea, sin esperar al siguiente sondeo
+        self._wake_event.set()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def _worker_loop(self, worker_id):
+        job_store = get_job_store()
+        while not self._stop_event.is_set():
+            try:
+                task = job_store.claim_next_task(worker_id)
+            except Exception as e:
+                print(f"Error al obtener la siguiente tarea de la cola ({worker_id}): {e}")
+                task = None
+            if task is None:
+                self._wake_event.wait(self.poll_interval)
+                self._wake_event.clear()
+                continue
+
+            with self._running_tasks_lock:
+                self._running_tasks.add(task["task_id"])
+            try:
+                self.run_job(task)
+            except Exception as e:
+                print(f"Error no controlado ejecutando la tarea {task['task_id']}: {e}")
+            finally:
+                with self._running_tasks_lock:
+                    self._running_tasks.discard(task["task_id"])
+
+    def _heartbeat_loop(self):
+        job_store = get_job_store()
+        last_stale_check = time.monotonic()
+        while not self._stop_event.wait(self.heartbeat_interval):
+            with self._running_tasks_lock:
+                running_task_ids = list(self._running_tasks)
+            try:
+                job_store.heartbeat(running_task_ids)
+                # Recuperar también las tareas abandonadas por otros procesos que hayan caído
+                if time.monotonic() - last_stale_check >= self.stale_after:
+                    last_stale_check = time.monotonic()
+                    if job_store.requeue_stale_tasks(self.stale_after):
+                        self.notify()
+            except Exception as e:
+                print(f"Error actualizando el latido de las tareas en curso: {e}")
@@ -0,0 +1,46 @@
+# keyword_classifier.py
+import hashlib
+import json
+import re
+import threading
+
+from config import ROUTING_KEYWORD_RULES, ROUTING_KEYWORD_MAX_CHARS
+
+# Cambia automáticamente al editar las reglas: forma parte de la clave de caché del modo con enrutamiento
+KEYWORD_RULES_FINGERPRINT = hashlib.sha1(
+    json.dumps(ROUTING_KEYWORD_RULES, sort_keys=True, ensure_ascii=False).encode("utf-8")
+).hexdigest()[:8]
+
+
+# --- Clasificador por Palabras Clave (primer nivel del enrutamiento) ---
+class KeywordClassifier:
+    def __init__(self, rules=ROUTING_KEYWORD_RULES, max_chars=ROUTING_KEYWORD_MAX_CHARS):
+        self.max_chars = max_chars
+        self.rules = [
+            (rule, re.compile("|".join(f"(?:{pattern})" for pattern in rule["patterns"]), flags=re.IGNORECASE))
+            for rule in rules
+        ]
+
+    def classify(self, ticket_content):
+        # Devuelve (regla, texto coincidente) solo si el ticket es corto y coincide con exactamente una regla
+        if not ticket_content or len(ticket_content) > self.max_chars:
+            return None, None
+        matches = []
+        for rule, pattern in self.rules:
+            match = pattern.search(ticket_content)
+            if match:
+                matches.append((rule, match.group(0)))
+        if len(matches) != 1:
+            return None, None
+        return matches[0]
+
+
+_keyword_classifier = None
+_keyword_classifier_lock = threading.Lock()
+
+def get_keyword_classifier():
+    global _keyword_classifier
+    with _keyword_classifier_lock:
+        if _keyword_classifier is None:
+            _keyword_classifier = KeywordClassifier()
+        return _keyword_classifier
@@ -0,0 +1,90 @@
+# live_results.py
+import sqlite3
+import json
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+from config import LIVE_RESULTS_DB_PATH
+
+
+# --- Filas Terminadas Durante el Análisis ---
+# Cada fila se añade en cuanto termina su análisis, en orden de finalización (no de fila). El número de
+# secuencia (AUTOINCREMENT, nunca se reutiliza) sirve de cursor: un cliente pide "las filas después de
+# la secuencia N" y recibe solo las nuevas, desde cualquier proceso.
+class LiveResultStore:
+    def __init__(self, db_path=LIVE_RESULTS_DB_PATH):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS completed_rows ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " task_id TEXT NOT NULL,"
+                " row_index INTEGER NOT NULL,"
+                " row_json TEXT NOT NULL,"
+                " completed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_completed_rows_task ON completed_rows(task_id, seq)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_completed_rows_completed_at ON completed_rows(completed_at)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA busy_timeout=30000")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def append_rows(self, task_id, rows):
+        # rows: lista de (fila, valores) en orden de finalización
+        if not rows:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO completed_rows (task_id, row_index, row_json, completed_at) VALUES (?, ?, ?, ?)",
+                [(task_id, int(row_index), json.dumps(values, ensure_ascii=False), now) for row_index, values in rows]
+            )
+
+    def load_rows(self, task_id, after_seq=0, limit=100):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT seq, row_index, row_json FROM completed_rows WHERE task_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (task_id, after_seq, limit)
+            ).fetchall()
+        return [(seq, row_index, json.loads(row_json)) for seq, row_index, row_json in rows]
+
+    def count_rows(self, task_id):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM completed_rows WHERE task_id = ?", (task_id,)).fetchone()[0]
+
+    def clear_task(self, task_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM completed_rows WHERE task_id = ?", (task_id,))
+
+    def delete_older_than(self, cutoff_timestamp):
+        with self._connect() as conn:
+            cur = conn.execute(
+                "DELETE FROM completed_rows WHERE task_id IN ("
+                " SELECT task_id FROM completed_rows GROUP BY task_id HAVING MAX(completed_at) < ?)",
+                (cutoff_timestamp,)
+            )
+            return cur.rowcount
+
+
+_live_result_store = None
+_live_result_store_lock = threading.Lock()
+
+def get_live_result_store():
+    global _live_result_store
+    with _live_result_store_lock:
+        if _live_result_store is None:
+            _live_result_store = LiveResultStore()
+        return _live_result_store
@@ -0,0 +1,279 @@
+# ollama_client.py
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import (
+    OLLAMA_BASE_URL, OLLAMA_POOL_SIZE, OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT,
+    OLLAMA_MAX_RETRIES, OLLAMA_RETRY_BACKOFF_FACTOR, OLLAMA_BASE_URLS, OLLAMA_HEALTH_CHECK_INTERVAL_SECONDS,
+    OLLAMA_HEALTH_CHECK_TIMEOUT, OLLAMA_BACKEND_EJECT_AFTER_FAILURES, OLLAMA_BACKEND_EJECT_SECONDS
+)
+from pipeline_metrics import get_metrics_registry
+
+
+# --- Cliente HTTP de Ollama con Pool de Conexiones ---
+class OllamaClient:
+    def __init__(self, base_url=OLLAMA_BASE_URL, pool_size=OLLAMA_POOL_SIZE,
+                 connect_timeout=OLLAMA_CONNECT_TIMEOUT, read_timeout=OLLAMA_READ_TIMEOUT,
+                 max_retries=OLLAMA_MAX_RETRIES, backoff_factor=OLLAMA_RETRY_BACKOFF_FACTOR, connect_retries=None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        # Reintentos con backoff exponencial ante errores 5xx y fallos de conexión. POST se incluye
+        # explícitamente porque /api/generate no modifica nada, pero repetirla no es gratis: si la petición ya
+        # llegó a Ollama, la generación se vuelve a calcular en la GPU. Por eso no se reintentan los errores de
+        # lectura (timeout o conexión cortada después de enviar la petición): el modelo puede seguir generando
+        # la respuesta anterior y un reintento la duplicaría, justo cuando el servidor ya va lento.
+        retry_policy = Retry(
+            total=max_retries,
+            connect=max_retries if connect_retries is None else connect_retries,
+            read=0,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset(["GET", "POST"]),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=retry_policy)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # Las comprobaciones de estado (/api/tags) no reintentan: deben fallar rápido si Ollama no responde
+        probe_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0)
+        self.probe_session = requests.Session()
+        self.probe_session.mount("http://", probe_adapter)
+        self.probe_session.mount("https://", probe_adapter)
+
+    def post(self, path, payload, timeout=None):
+        return self.session.post(f"{self.base_url}{path}", json=payload, timeout=timeout or self.timeout)
+
+    def get(self, path, timeout=None):
+        return self.session.get(f"{self.base_url}{path}", timeout=timeout or self.timeout)
+
+    def generate(self, payload, timeout=None):
+        return self.post("/api/generate", payload, timeout=timeout)
+
+    def show(self, model_name, timeout=None):
+        return self.post("/api/show", {"model": model_name}, timeout=timeout)
+
+    def embed(self, model_name, texts, timeout=None):
+        return self.post("/api/embed", {"model": model_name, "input": list(texts)}, timeout=timeout)
+
+    def tags(self, timeout=None):
+        return self.probe_session.get(f"{self.base_url}/api/tags", timeout=timeout or self.timeout)
+
+    def close(self):
+        self.session.close()
+        self.probe_session.close()
+
+
+def model_name_variants(model_name):
+    # Ollama trata "modelo" y "modelo:latest" como el mismo modelo
+    if ":" in model_name:
+        return {model_name, model_name[:-len(":latest")]} if model_name.endswith(":latest") else {model_name}
+    return {model_name, f"{model_name}:latest"}
+
+
+# --- Balanceo entre Varias Instancias de Ollama ---
+class OllamaBackend:
+    def __init__(self, client):
+        self.client = client
+        self.base_url = client.base_url
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.requests = 0
+        self.failures = 0
+        self.busy_seconds = 0.0
+        self.models = None  # Modelos según la última comprobación de estado (None = aún sin comprobar)
+        self.missing_models = set()  # Modelos para los que la instancia respondió 404
+        self.last_error = None
+        self.reachable = None  # Resultado de la última comprobación de estado (None = aún sin comprobar)
+        self.last_checked_at = None
+
+
+# Expone la misma interfaz que OllamaClient. Cada petición va a la instancia sana con menos peticiones en
+# curso que tenga el modelo; las instancias con fallos consecutivos se retiran y un hilo de comprobación
+# (/api/tags) las readmite cuando vuelven a responder. Con una sola instancia se comporta como OllamaClient.
+class OllamaBackendPool:
+    def __init__(self, base_urls=OLLAMA_BASE_URLS, health_check_interval=OLLAMA_HEALTH_CHECK_INTERVAL_SECONDS,
+                 eject_after_failures=OLLAMA_BACKEND_EJECT_AFTER_FAILURES, eject_seconds=OLLAMA_BACKEND_EJECT_SECONDS,
+                 **client_options):
+        base_urls = list(dict.fromkeys(url.rstrip("/") for url in base_urls)) or [OLLAMA_BASE_URL]
+        if len(base_urls) > 1:
+            # Si una instancia rechaza la conexión es más rápido probar en otra que reintentar con espera
+            client_options.setdefault("connect_retries", 0)
+        self.backends = [OllamaBackend(OllamaClient(base_url=url, **client_options)) for url in base_urls]
+        self.base_url = self.backends[0].base_url
+        self.health_check_interval = health_check_interval
+        self.eject_after_failures = eject_after_failures
+        self.eject_seconds = eject_seconds
+        self._lock = threading.Lock()
+        self._next_index = 0
+        self._last_check_at = 0.0
+        self._health_thread = None
+        self._stop_event = threading.Event()
+
+    def post(self, path, payload, timeout=None):
+        return self._dispatch("post", payload.get("model"), path, payload, timeout=timeout)
+
+    def get(self, path, timeout=None):
+        return self._dispatch("get", None, path, timeout=timeout)
+
+    def generate(self, payload, timeout=None):
+        return self._dispatch("generate", payload.get("model"), payload, timeout=timeout)
+
+    def show(self, model_name, timeout=None):
+        return self._dispatch("show", model_name, model_name, timeout=timeout)
+
+    def embed(self, model_name, texts, timeout=None):
+        return self._dispatch("embed", model_name, model_name, texts, timeout=timeout)
+
+    def tags(self, timeout=None):
+        return self._dispatch("tags", None, timeout=timeout)
+
+    def _acquire_backend(self, model_name, excluded):
+        with self._lock:
+            available = [backend for backend in self.backends if backend not in excluded]
+            candidates = [backend for backend in available if backend.healthy]
+            if model_name:
+                variants = model_name_variants(model_name)
+                with_model = [backend for backend in candidates if not variants & backend.missing_models
+                              and (backend.models is None or variants & backend.models)]
+                candidates = with_model or candidates
+            if not candidates:
+                # Todas retiradas: antes que fallar sin intentarlo, se usa la que lleva más tiempo fuera
+                candidates = sorted(available, key=lambda backend: backend.ejected_until)[:1]
+            if not candidates:
+                return None
+            fewest_outstanding = min(backend.outstanding for backend in candidates)
+            tied = [backend for backend in candidates if backend.outstanding == fewest_outstanding]
+            backend = tied[self._next_index % len(tied)]
+            self._next_index += 1
+            backend.outstanding += 1
+            return backend
+
+    def _release(self, backend, busy_seconds, failed, error=None):
+        with self._lock:
+            backend.outstanding -= 1
+            backend.requests += 1
+            backend.busy_seconds += busy_seconds
+            if not failed:
+                backend.consecutive_failures = 0
+                return
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            backend.last_error = error
+            if backend.healthy and backend.consecutive_failures >= self.eject_after_failures and len(self.backends) > 1:
+                self._eject(backend, error)
+
+    def _eject(self, backend, reason):
+        # Llamar con self._lock adquirido
+        backend.healthy = False
+        backend.ejected_until = time.monotonic() + self.eject_seconds
+        backend.ejections += 1
+        get_metrics_registry().increment("ticket_analyzer_ollama_backend_ejections_total", backend=backend.base_url)
+        print(f"Instancia de Ollama retirada temporalmente: {backend.base_url} ({reason})")
+
+    def _dispatch(self, method_name, model_name, *args, **kwargs):
+        self._ensure_health_checks()
+        tried = []
+        while True:
+            backend = self._acquire_backend(model_name, tried)
+            tried.append(backend)
+            started = time.monotonic()
+            try:
+                response = getattr(backend.client, method_name)(*args, **kwargs)
+            except requests.exceptions.RequestException as e:
+                self._release(backend, time.monotonic() - started, failed=True, error=str(e)[:200])
+                # Si la instancia no acepta conexiones, se prueba en otra: la petición no llegó a procesarse
+                if isinstance(e, requests.exceptions.ConnectionError) and len(tried) < len(self.backends):
+                    continue
+                e.ollama_backend = backend.base_url
+                raise
+            failed = response.status_code >= 500
+            self._release(backend, time.monotonic() - started, failed=failed,
+                          error=f"HTTP {response.status_code}" if failed else None)
+            if response.status_code == 404 and model_name and len(tried) < len(self.backends):
+                # El modelo no está descargado en esta instancia: se prueba en otra
+                with self._lock:
+                    backend.missing_models.add(model_name)
+                continue
+            response.ollama_backend = backend.base_url
+            return response
+
+    def _ensure_health_checks(self):
+        if self._health_thread is not None or len(self.backends) < 2 or not self.health_check_interval:
+            return
+        with self._lock:
+            if self._health_thread is None:
+                self._health_thread = threading.Thread(target=self._health_check_loop, name="ollama-health-check",
+                                                       daemon=True)
+                self._health_thread.start()
+
+    def _health_check_loop(self):
+        while not self._stop_event.wait(self.health_check_interval):
+            # En la aplicación el monitor de estado ya comprueba las instancias: no se repite la comprobación
+            if time.monotonic() - self._last_check_at >= self.health_check_interval / 2:
+                self.check_backends()
+
+    def check_backends(self):
+        self._last_check_at = time.monotonic()
+        for backend in self.backends:
+            try:
+                response = backend.client.tags(timeout=OLLAMA_HEALTH_CHECK_TIMEOUT)
+                response.raise_for_status()
+                model_names = {model.get("name") for model in response.json().get("models", [])}
+            except (requests.exceptions.RequestException, ValueError) as e:
+                with self._lock:
+                    backend.reachable = False
+                    backend.last_checked_at = time.time()
+                    backend.last_error = str(e)[:200]
+                    if backend.healthy and len(self.backends) > 1:
+                        self._eject(backend, f"comprobación de estado fallida: {str(e)[:200]}")
+                continue
+            with self._lock:
+                backend.reachable = True
+                backend.last_checked_at = time.time()
+                backend.models = model_names
+                backend.missing_models -= model_names
+                if not backend.healthy and time.monotonic() >= backend.ejected_until:
+                    backend.healthy = True
+                    backend.consecutive_failures = 0
+                    print(f"Instancia de Ollama readmitida: {backend.base_url}")
+
+    def snapshot(self):
+        with self._lock:
+            return [{
+                "base_url": backend.base_url,
+                "healthy": backend.healthy,
+                "reachable": backend.reachable,
+                "last_checked_at": backend.last_checked_at,
+                "outstanding": backend.outstanding,
+                "requests": backend.requests,
+                "failures": backend.failures,
+                "ejections": backend.ejections,
+                "busy_seconds": round(backend.busy_seconds, 3),
+                "models": sorted(backend.models) if backend.models is not None else None,
+                "last_error": backend.last_error
+            } for backend in self.backends]
+
+    def close(self):
+        self._stop_event.set()
+        for backend in self.backends:
+            backend.client.close()
+
+
+_ollama_client = None
+_ollama_client_lock = threading.Lock()
+
+def get_ollama_client():
+    global _ollama_client
+    with _ollama_client_lock:
+        if _ollama_client is None:
+            _ollama_client = OllamaBackendPool()
+        return _ollama_client
@@ -0,0 +1,192 @@
+# pipeline_metrics.py
+import threading
+import time
+from contextlib import contextmanager
+
+from config import METRICS_STAGE_BUCKETS_SECONDS
+
+# Etapas instrumentadas del pipeline. Las del hilo principal (lectura, limpieza, espera de resultados,
+# gestión de resultados, escritura) suman el tiempo total de la tarea; lo que no cae en ninguna se informa
+# como "unattributed". Las del LLM se acumulan en los hilos del pool y pueden superar el tiempo de reloj.
+PIPELINE_STAGES = ("read", "clean", "embed", "prompt_build", "llm_queue_wait", "llm_service", "json_parse", "llm_wait",
+                   "bookkeeping", "write")
+MAIN_THREAD_STAGES = ("read", "clean", "embed", "llm_wait", "bookkeeping", "write")
+OLLAMA_BOUND_STAGES = ("embed", "llm_wait")
+
+
+# --- Tiempos por Tarea ---
+class StageTimings:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seconds = {stage: 0.0 for stage in PIPELINE_STAGES}
+        self._counts = {stage: 0 for stage in PIPELINE_STAGES}
+        self.prompt_tokens = 0
+        self.eval_tokens = 0
+        self.backends = {}  # instancia de Ollama -> [peticiones, errores, segundos de servicio, tokens generados]
+        self.started_at = time.perf_counter()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self._seconds[stage] = self._seconds.get(stage, 0.0) + seconds
+            self._counts[stage] = self._counts.get(stage, 0) + 1
+
+    def add_tokens(self, prompt_tokens, eval_tokens):
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.eval_tokens += eval_tokens
+
+    def add_backend_request(self, backend, service_seconds, eval_tokens, failed):
+        with self._lock:
+            stats = self.backends.setdefault(backend, [0, 0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += 1 if failed else 0
+            stats[2] += service_seconds
+            stats[3] += eval_tokens
+
+    def backend_summary(self):
+        # Reparto de la tarea entre instancias de Ollama y su rendimiento (por segundo de reloj de la tarea)
+        with self._lock:
+            wall_seconds = time.perf_counter() - self.started_at
+            return {
+                backend: {
+                    "requests": requests_count,
+                    "errors": errors,
+                    "service_seconds": round(service_seconds, 3),
+                    "avg_latency_seconds": round(service_seconds / requests_count, 3) if requests_count else None,
+                    "eval_tokens": eval_tokens,
+                    "requests_per_second": round(requests_count / wall_seconds, 3) if wall_seconds else 0.0,
+                    "tokens_per_second": round(eval_tokens / wall_seconds, 2) if wall_seconds else 0.0
+                }
+                for backend, (requests_count, errors, service_seconds, eval_tokens) in sorted(self.backends.items())
+            }
+
+    def as_summary(self):
+        with self._lock:
+            wall_seconds = time.perf_counter() - self.started_at
+            stages = {stage: {"seconds": round(self._seconds[stage], 3), "count": self._counts[stage]}
+                      for stage in self._seconds}
+            main_thread_total = sum(self._seconds[stage] for stage in MAIN_THREAD_STAGES)
+            for stage in MAIN_THREAD_STAGES:
+                stages[stage]["share_of_wall"] = round(self._seconds[stage] / wall_seconds, 4) if wall_seconds else 0.0
+            # Resto del tiempo de reloj (preparación de la tarea, agrupamiento, resumen final...): así el desglose
+            # del hilo principal suma el tiempo total
+            unattributed_seconds = max(wall_seconds - main_thread_total, 0.0)
+            stages["unattributed"] = {
+                "seconds": round(unattributed_seconds, 3),
+                "share_of_wall": round(unattributed_seconds / wall_seconds, 4) if wall_seconds else 0.0
+            }
+            dominant_stage = max(MAIN_THREAD_STAGES, key=lambda stage: self._seconds[stage]) if main_thread_total else None
+            return {
+                "wall_seconds": round(wall_seconds, 3),
+                "stages": stages,
+                "dominant_stage": dominant_stage,
+                # "ollama" si el hilo principal pasa la mayor parte del tiempo esperando al LLM, "pandas" si la
+                # mayor parte se va en trabajo local (lectura, limpieza, gestión de resultados, escritura)
+                "bound_by": None if dominant_stage is None else ("ollama" if dominant_stage in OLLAMA_BOUND_STAGES else "pandas"),
+                "llm_prompt_tokens": self.prompt_tokens,
+                "llm_eval_tokens": self.eval_tokens
+            }
+
+
+# --- Métricas Globales del Proceso (formato Prometheus) ---
+class MetricsRegistry:
+    def __init__(self, buckets=METRICS_STAGE_BUCKETS_SECONDS):
+        self._lock = threading.Lock()
+        self.buckets = tuple(sorted(buckets))
+        self._stage_histograms = {}  # stage -> [conteos por bucket, suma, total]
+        self._counters = {}  # (nombre, etiquetas ordenadas) -> valor
+
+    def observe_stage(self, stage, seconds):
+        with self._lock:
+            histogram = self._stage_histograms.setdefault(stage, [[0] * len(self.buckets), 0.0, 0])
+            for i, upper_bound in enumerate(self.buckets):
+                if seconds <= upper_bound:
+                    histogram[0][i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def render_prometheus(self, gauges=None):
+        # gauges: lista de (nombre, ayuda, {etiquetas}, valor) calculados en el momento de la consulta
+        lines = []
+        with self._lock:
+            lines.append("# HELP ticket_analyzer_stage_seconds Duración de cada etapa del pipeline.")
+            lines.append("# TYPE ticket_analyzer_stage_seconds histogram")
+            for stage in sorted(self._stage_histograms):
+                bucket_counts, total_seconds, total_count = self._stage_histograms[stage]
+                for upper_bound, bucket_count in zip(self.buckets, bucket_counts):
+                    lines.append(f'ticket_analyzer_stage_seconds_bucket{{stage="{stage}",le="{upper_bound:g}"}} {bucket_count}')
+                lines.append(f'ticket_analyzer_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {total_count}')
+                lines.append(f'ticket_analyzer_stage_seconds_sum{{stage="{stage}"}} {total_seconds:.6f}')
+                lines.append(f'ticket_analyzer_stage_seconds_count{{stage="{stage}"}} {total_count}')
+            counter_names = sorted({name for name, _ in self._counters})
+            for name in counter_names:
+                lines.append(f"# TYPE {name} counter")
+                for (counter_name, labels), value in sorted(self._counters.items()):
+                    if counter_name == name:
+                        lines.append(f"{name}{_format_labels(dict(labels))} {value}")
+        declared_gauges = set()
+        for name, help_text, labels, value in gauges or []:
+            if value is None:
+                continue
+            if name not in declared_gauges:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} gauge")
+                declared_gauges.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = []
+    for key, value in sorted(labels.items()):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        escaped.append(f'{key}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+_metrics_registry = None
+_metrics_registry_lock = threading.Lock()
+
+def get_metrics_registry():
+    global _metrics_registry
+    with _metrics_registry_lock:
+        if _metrics_registry is None:
+            _metrics_registry = MetricsRegistry()
+        return _metrics_registry
+
+
+# --- Helpers de Instrumentación ---
+def record_stage(stage, seconds, stage_timings=None):
+    get_metrics_registry().observe_stage(stage, seconds)
+    if stage_timings is not None:
+        stage_timings.add(stage, seconds)
+
+
+@contextmanager
+def timed_stage(stage, stage_timings=None):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started, stage_timings)
+
+
+def timed_iterator(iterable, stage, stage_timings=None):
+    # Mide el tiempo de producir cada elemento (p. ej. leer el siguiente bloque del archivo)
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            record_stage(stage, time.perf_counter() - started, stage_timings)
+            return
+        record_stage(stage, time.perf_counter() - started, stage_timings)
+        yield item
@@ -3,32 +3,428 @@ import pandas as pd
 import requests
 import json
 import re
+import hashlib
 from bs4 import BeautifulSoup
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import Counter, OrderedDict
 import time
 import os
+import shutil
+import threading
 from datetime import datetime, timedelta
 
 from config import (
-    OLLAMA_BASE_URL, OLLAMA_MODEL,
+    OLLAMA_MODEL,
     IDENTIFIER_PATTERNS_TO_EXCLUDE, UPLOAD_FOLDER, PROCESSED_FOLDER, MAX_FILE_AGE_SECONDS,
-    MAX_WORKERS
+    MAX_WORKERS, RESULT_CACHE_ENABLED, CHECKPOINT_ENABLED, BATCH_MAX_TICKET_CHARS, BATCH_MAX_SIZE, BATCH_DEFAULT_CONTEXT_TOKENS,
+    BATCH_MAX_CONTEXT_TOKENS, BATCH_OUTPUT_TOKENS_PER_TICKET, EMBEDDING_MODEL, SEMANTIC_TOP_CLUSTERS,
+    SEMANTIC_RECOMMENDATION_MIN_SHARE, SEMANTIC_RECOMMENDATION_MIN_SIZE, ROUTING_FAST_MODEL, ROUTING_FAST_MAX_CHARS,
+    ROUTING_MIN_CONFIDENCE, PROMPT_TICKET_TOKEN_BUDGET, PROMPT_DESCRIPTION_MAX_SHARE, WORK_NOTES_NEWEST_FIRST,
+    WORK_NOTES_ENTRY_PATTERN, WORK_NOTES_RELEVANT_PATTERNS, WORK_NOTES_SUMMARY_ENABLED, WORK_NOTES_SUMMARY_MIN_TOKENS,
+    WORK_NOTES_SUMMARY_INPUT_TOKENS, WORK_NOTES_SUMMARY_MAX_TOKENS, WORK_NOTES_SUMMARY_MODEL,
+    INCREMENTAL_ANALYSIS_ENABLED, TICKET_HISTORY_MAX_AGE_SECONDS, LIVE_RESULTS_ENABLED,
+    LIVE_RESULTS_FLUSH_INTERVAL_SECONDS, LIVE_RESULTS_SOURCE_COLUMNS, DEDUP_MAX_TRACKED_CONTENTS,
+    DEDUP_MAX_TRACKED_RESULTS_WITHOUT_CACHE
 )
+from result_cache import build_cache_key, get_result_cache
+from ollama_client import get_ollama_client
+from concurrency_limiter import get_concurrency_limiter
+from ticket_io import TicketFileReader, processed_file_extension
+from result_store import ResultStore, ResultStoreWriter, to_json_value
+from checkpoint_store import get_checkpoint_store
+from pipeline_metrics import StageTimings, get_metrics_registry, record_stage, timed_stage, timed_iterator
+from semantic_index import SemanticIndex, EmbeddingError, embed_texts
+from keyword_classifier import KEYWORD_RULES_FINGERPRINT, get_keyword_classifier
+from ticket_history import get_ticket_history_store
+from live_results import get_live_result_store
+
+# Incrementar al modificar el prompt o las claves esperadas para invalidar la caché de resultados
+STRUCTURED_SUMMARY_PROMPT_VERSION = "v1"
+WORK_NOTES_SUMMARY_PROMPT_VERSION = "notes-v1"
 
 # --- Helper para Limpieza de Texto ---
+# Todos los patrones de identificadores en una única regex precompilada
+COMBINED_IDENTIFIER_PATTERN = re.compile(
+    "|".join(f"(?:{pattern})" for pattern in IDENTIFIER_PATTERNS_TO_EXCLUDE) or r"(?!x)x",
+    flags=re.IGNORECASE
+)
+# Celdas sin etiquetas ni "&" no necesitan pasar por BeautifulSoup. Cualquier "&" cuenta: el parser
+# también decodifica entidades sin ";" final ("&amp b", "&lt 5", "&copy 2024").
+HTML_MARKUP_PATTERN = re.compile(r'<[a-zA-Z/!?]|&')
+
+TICKET_CONTENT_PREFIXES = [
+    ("short_description_column", "Descripción breve"),
+    ("description_column", "Descripción completa"),
+    ("work_notes_column", "Notas de trabajo"),
+]
+TICKET_PARTS_SEPARATOR = " || "
+EMPTY_TICKET_CONTENT = "Contenido del ticket no disponible o vacío en columnas seleccionadas."
+
+
+def collapse_whitespace(text):
+    # Equivalente a re.sub(r'\s+', ' ', text).strip(), pero bastante más rápido
+    return " ".join(text.split())
+
+
+def strip_html(text):
+    if not HTML_MARKUP_PATTERN.search(text):
+        return text
+    return BeautifulSoup(text, "html.parser").get_text(separator=" ")
+
+
 def clean_html_and_identifiers(text):
     if not isinstance(text, str):
         return ""
-    soup = BeautifulSoup(text, "html.parser")
-    cleaned_text = soup.get_text(separator=" ")
-    for pattern in IDENTIFIER_PATTERNS_TO_EXCLUDE:
-        cleaned_text = re.sub(pattern, "", cleaned_text, flags=re.IGNORECASE)
-    cleaned_text = re.sub(r'\s+', ' ', cleaned_text).strip()
-    return cleaned_text
+    cleaned_text = COMBINED_IDENTIFIER_PATTERN.sub("", strip_html(text))
+    return collapse_whitespace(cleaned_text)
+
+
+def clean_text_series(series):
+    # Versión por columnas de clean_html_and_identifiers; las celdas vacías (NaN) se mantienen como NaN
+    present = series.notna()
+    cleaned = series[present].astype(str)
+    has_markup = cleaned.str.contains(HTML_MARKUP_PATTERN, regex=True)
+    if has_markup.any():
+        cleaned[has_markup] = cleaned[has_markup].map(strip_html)
+    cleaned = cleaned.str.replace(COMBINED_IDENTIFIER_PATTERN, "", regex=True)
+    cleaned = cleaned.map(collapse_whitespace)
+    return cleaned.reindex(series.index)
+
+
+def build_ticket_parts(df, selected_columns):
+    # Por fila, lista de (clave de columna, prefijo, texto limpio) de las columnas con contenido
+    cleaned_columns = []
+    for column_key, prefix in TICKET_CONTENT_PREFIXES:
+        column_name = selected_columns.get(column_key)
+        if not column_name or column_name not in df.columns:
+            continue
+        cleaned_columns.append((column_key, prefix, clean_text_series(df[column_name]).tolist()))
+
+    if not cleaned_columns:
+        return [[] for _ in range(len(df))]
+    return [
+        [(column_key, prefix, text) for (column_key, prefix, _), text in zip(cleaned_columns, row_texts)
+         if isinstance(text, str)]
+        for row_texts in zip(*(texts for _, _, texts in cleaned_columns))
+    ]
+
+
+def compose_ticket_content(ticket_parts, token_budget=None, truncation_stats=None):
+    # Construye el texto del ticket ("Descripción breve: ... || Descripción completa: ... || Notas de trabajo: ...")
+    full_ticket_content = TICKET_PARTS_SEPARATOR.join(f"{prefix}: {text}" for _, prefix, text in ticket_parts)
+    if token_budget and estimate_tokens(full_ticket_content) > token_budget:
+        ticket_parts = fit_ticket_parts(ticket_parts, token_budget, truncation_stats)
+        full_ticket_content = TICKET_PARTS_SEPARATOR.join(f"{prefix}: {text}" for _, prefix, text in ticket_parts)
+    if not full_ticket_content.strip():
+        full_ticket_content = EMPTY_TICKET_CONTENT
+    return full_ticket_content
+
+
+def build_ticket_contents(df, selected_columns, token_budget=None, truncation_stats=None):
+    return [compose_ticket_content(ticket_parts, token_budget, truncation_stats)
+            for ticket_parts in build_ticket_parts(df, selected_columns)]
+
+
+# --- Presupuesto de Tokens por Ticket ---
+# La latencia de Ollama crece casi linealmente con la longitud del prompt: unas notas de trabajo de 50 KB
+# desbordan la ventana de contexto y acaparan la GPU. Cada ticket se recorta a un presupuesto de tokens
+# conservando la descripción breve, parte de la descripción y las entradas de notas más recientes y relevantes.
+WORK_NOTES_ENTRY_SPLIT_PATTERN = re.compile(f"(?<!\\w)(?={WORK_NOTES_ENTRY_PATTERN})")
+WORK_NOTES_RELEVANT_PATTERN = re.compile(
+    "|".join(f"(?:{pattern})" for pattern in WORK_NOTES_RELEVANT_PATTERNS) or r"(?!x)x",
+    flags=re.IGNORECASE
+)
+TRUNCATION_MARKER = " [...]"
+OMITTED_WORK_NOTES_ENTRIES = "[{count} entradas anteriores de las notas de trabajo omitidas por longitud]"
+WORK_NOTES_SUMMARY_PREFIX = "Resumen de notas de trabajo"
+
+
+def estimate_tokens(text):
+    # Aproximación habitual para modelos tipo Llama/Gemma: ~4 caracteres por token
+    return len(text or "") // 4 + 1
+
+
+def truncate_to_tokens(text, max_tokens):
+    # Recorta el final del texto (en un límite de palabra si es posible) para no superar max_tokens estimados
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    max_chars = (max_tokens - 1) * 4 - len(TRUNCATION_MARKER)
+    if max_chars <= 0:
+        return ""
+    truncated = text[:max_chars]
+    last_space = truncated.rfind(" ")
+    if last_space > max_chars // 2:
+        truncated = truncated[:last_space]
+    return truncated + TRUNCATION_MARKER
+
+
+def split_work_notes(work_notes):
+    return [entry.strip() for entry in WORK_NOTES_ENTRY_SPLIT_PATTERN.split(work_notes) if entry.strip()]
+
+
+def select_work_notes_entries(work_notes, max_tokens):
+    # Devuelve (texto con las entradas que caben, nº de entradas omitidas). Se prioriza la entrada más
+    # reciente, después las que mencionan solución o causa y por último el resto, de más nueva a más antigua;
+    # las entradas conservadas mantienen su orden original.
+    entries = split_work_notes(work_notes)
+    if len(entries) <= 1:
+        return truncate_to_tokens(work_notes, max_tokens), 0
+    by_recency = list(range(len(entries))) if WORK_NOTES_NEWEST_FIRST else list(range(len(entries) - 1, -1, -1))
+    relevant = [i for i in by_recency[1:] if WORK_NOTES_RELEVANT_PATTERN.search(entries[i])]
+    relevant_set = set(relevant)
+    preferred = by_recency[:1] + relevant + [i for i in by_recency[1:] if i not in relevant_set]
+
+    remaining = max_tokens - estimate_tokens(OMITTED_WORK_NOTES_ENTRIES.format(count=len(entries)))
+    kept = set()
+    for i in preferred:
+        entry_tokens = estimate_tokens(entries[i]) + 1
+        if entry_tokens <= remaining:
+            kept.add(i)
+            remaining -= entry_tokens
+    if not kept:
+        # Ni la entrada más reciente cabe completa: se recorta, y si no cabe nada se omiten todas
+        omitted_note = OMITTED_WORK_NOTES_ENTRIES.format(count=len(entries) - 1)
+        newest_entry = truncate_to_tokens(entries[by_recency[0]], max_tokens - estimate_tokens(f" {omitted_note}"))
+        if not newest_entry:
+            return "", len(entries)
+        return f"{newest_entry} {omitted_note}", len(entries) - 1
+
+    omitted_count = len(entries) - len(kept)
+    selected = " ".join(entry for i, entry in enumerate(entries) if i in kept)
+    if omitted_count:
+        selected = f"{selected} {OMITTED_WORK_NOTES_ENTRIES.format(count=omitted_count)}"
+    return selected, omitted_count
+
+
+def part_overhead_tokens(prefix, is_first):
+    # "Prefijo: " y, salvo en la primera parte, el separador que la precede
+    return estimate_tokens(f"{prefix}: ") + (0 if is_first else estimate_tokens(TICKET_PARTS_SEPARATOR))
+
+
+def fit_ticket_parts(ticket_parts, token_budget, truncation_stats=None):
+    # Recorta las partes para que el texto compuesto (prefijos y separadores incluidos) no supere
+    # token_budget tokens estimados. Las partes que se quedan sin espacio se omiten, en lugar de enviar
+    # un prefijo vacío.
+    texts = {column_key: text for column_key, _, text in ticket_parts}
+    prefixes = {column_key: prefix for column_key, prefix, _ in ticket_parts}
+    remaining = token_budget
+    fitted = {}
+    omitted_entries = 0
+
+    work_notes = texts.get("work_notes_column")
+    for column_key in ("short_description_column", "description_column", "work_notes_column"):
+        text = texts.get(column_key)
+        if text is None:
+            continue
+        overhead = part_overhead_tokens(prefixes[column_key], is_first=not fitted)
+        allowance = remaining - overhead
+        if column_key == "work_notes_column":
+            fitted_text, omitted_entries = select_work_notes_entries(text, allowance)
+            if not fitted_text:
+                omitted_entries = len(split_work_notes(text))
+        else:
+            if column_key == "description_column" and work_notes:
+                # La descripción cede a las notas hasta PROMPT_DESCRIPTION_MAX_SHARE del presupuesto; si las
+                # notas son cortas, la descripción aprovecha lo que no usen
+                work_notes_tokens = estimate_tokens(work_notes) + part_overhead_tokens(prefixes["work_notes_column"], False)
+                allowance = max(allowance - work_notes_tokens, int(allowance * PROMPT_DESCRIPTION_MAX_SHARE))
+            fitted_text = truncate_to_tokens(text, allowance)
+        if fitted_text:
+            fitted[column_key] = fitted_text
+            remaining -= overhead + estimate_tokens(fitted_text)
+
+    if truncation_stats is not None:
+        original_tokens = sum(estimate_tokens(text) for text in texts.values())
+        truncation_stats["truncated_tickets"] += 1
+        truncation_stats["truncated_tokens_removed"] += original_tokens - sum(estimate_tokens(text) for text in fitted.values())
+        truncation_stats["work_notes_entries_omitted"] += omitted_entries
+    return [(column_key, prefix, fitted[column_key]) for column_key, prefix, _ in ticket_parts if column_key in fitted]
+
+
+def build_work_notes_summary_prompt(notes_excerpt):
+    return (
+        f"Resume las siguientes notas de trabajo de un ticket de TI en un único párrafo de como máximo "
+        f"{WORK_NOTES_SUMMARY_MAX_TOKENS // 2} palabras. Conserva los síntomas, las acciones realizadas, la causa "
+        f"identificada y el estado final; omite saludos, firmas y repeticiones. Responde solo con el resumen.\n"
+        f"Notas de trabajo:\n\"\"\"\n{notes_excerpt}\n\"\"\"\n"
+        f"Resumen:"
+    )
+
+
+def summarize_work_notes(work_notes, ollama_model, context_tokens, input_tokens, stage_timings=None):
+    # Devuelve el resumen o None si el LLM falla (en ese caso el ticket se recorta sin resumir)
+    with timed_stage("prompt_build", stage_timings):
+        notes_excerpt, _ = select_work_notes_entries(work_notes, input_tokens)
+        summary_prompt = build_work_notes_summary_prompt(notes_excerpt)
+    options = {"num_predict": WORK_NOTES_SUMMARY_MAX_TOKENS}
+    if context_tokens:
+        options["num_ctx"] = context_tokens
+    summary = call_ollama(summary_prompt, ollama_model, task_type="work_notes_summary", extra_options=options,
+                          stage_timings=stage_timings)
+    if not summary or summary.startswith("ERROR_OLLAMA"):
+        return None
+    return collapse_whitespace(summary)
+
+
+def summarize_long_work_notes(rows_parts, ollama_model, executor, result_cache, bypass_cache, pipeline_stats,
+                              stage_timings=None, context_tokens=None):
+    # Sustituye en rows_parts las notas de trabajo muy largas por su resumen. Los resúmenes se cachean por
+    # texto de las notas: así el contenido del ticket, y su clave en la caché de análisis, es estable.
+    # Se usa el mismo num_ctx que el resto de llamadas de la tarea (un num_ctx distinto obliga a Ollama a
+    # recargar el modelo) y las notas enviadas se recortan para que quepan en ese contexto.
+    summary_model = WORK_NOTES_SUMMARY_MODEL or ollama_model
+    long_notes = {}
+    for row_position, ticket_parts in enumerate(rows_parts):
+        for part_position, (column_key, _, text) in enumerate(ticket_parts):
+            if column_key == "work_notes_column" and estimate_tokens(text) > WORK_NOTES_SUMMARY_MIN_TOKENS:
+                long_notes.setdefault(text, []).append((row_position, part_position))
+    if not long_notes:
+        return
+
+    summaries = {}
+    pending_futures = []
+    prompt_overhead = estimate_tokens(build_work_notes_summary_prompt(""))
+    available_tokens = (context_tokens or BATCH_DEFAULT_CONTEXT_TOKENS) - prompt_overhead - WORK_NOTES_SUMMARY_MAX_TOKENS
+    input_tokens = max(min(WORK_NOTES_SUMMARY_INPUT_TOKENS, available_tokens), WORK_NOTES_SUMMARY_MAX_TOKENS)
+    summary_version = f"{WORK_NOTES_SUMMARY_PROMPT_VERSION}-{input_tokens}"  # Otro recorte de entrada, otro resumen
+    for work_notes in long_notes:
+        cache_key = None
+        if result_cache is not None:
+            cache_key = build_cache_key(work_notes, "", summary_model, summary_version)
+            cached_summary = None if bypass_cache else result_cache.get(cache_key)
+            if cached_summary is not None and cached_summary.get("summary"):
+                summaries[work_notes] = cached_summary["summary"]
+                continue
+        future = executor.submit(summarize_work_notes, work_notes, summary_model, context_tokens, input_tokens,
+                                 stage_timings)
+        pending_futures.append((work_notes, cache_key, future))
+
+    cache_writes = []
+    for work_notes, cache_key, future in pending_futures:
+        wait_started = time.perf_counter()
+        try:
+            summary = future.result()
+        except Exception as e:
+            print(f"Error resumiendo notas de trabajo: {e}")
+            summary = None
+        record_stage("llm_wait", time.perf_counter() - wait_started, stage_timings)
+        if summary is None:
+            pipeline_stats["work_notes_summary_errors"] += len(long_notes[work_notes])
+            continue
+        summaries[work_notes] = summary
+        if cache_key:
+            cache_writes.append((cache_key, {"summary": summary}))
+    if result_cache is not None:
+        with timed_stage("bookkeeping", stage_timings):
+            result_cache.put_many(cache_writes)
+
+    for work_notes, positions in long_notes.items():
+        summary = summaries.get(work_notes)
+        if summary is None:
+            continue
+        pipeline_stats["work_notes_summarized"] += len(positions)
+        for row_position, part_position in positions:
+            rows_parts[row_position][part_position] = ("work_notes_column", WORK_NOTES_SUMMARY_PREFIX, summary)
+
+# --- Identidad de Tickets (análisis incremental) ---
+INCREMENTAL_RESULT_COLUMNS = ["Estado_Incremental_IA"]
+INCREMENTAL_STATUS_NEW = "Nuevo"
+INCREMENTAL_STATUS_CHANGED = "Modificado"
+INCREMENTAL_STATUS_UNCHANGED = "Sin cambios"
+INCREMENTAL_STATUS_NO_ID = "Sin número"
+
+
+def normalize_ticket_id(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip() or None
+
+
+def build_ticket_identities(df, selected_columns):
+    # Por fila, (número de ticket o None, hash del texto original de las columnas analizadas). Se usa el texto
+    # sin limpiar: así los tickets sin cambios se reconocen sin pasar por la limpieza de HTML.
+    id_column = selected_columns.get("ticket_id_column")
+    if id_column and id_column in df.columns:
+        ticket_ids = [normalize_ticket_id(value) for value in df[id_column].tolist()]
+    else:
+        ticket_ids = [None] * len(df)
+    text_column_names = [selected_columns.get(key) for key, _ in TICKET_CONTENT_PREFIXES
+                         if selected_columns.get(key) in df.columns]
+    column_signature = "\x1f".join(text_column_names)
+    content_hashes = []
+    for row_values in zip(*(df[column_name].tolist() for column_name in text_column_names)):
+        row_text = "\x1f".join("" if not isinstance(value, str) and pd.isna(value) else str(value) for value in row_values)
+        content_hashes.append(hashlib.sha1(f"{column_signature}\x00{row_text}".encode("utf-8")).hexdigest())
+    if not text_column_names:
+        content_hashes = [None] * len(df)
+    return ticket_ids, content_hashes
+
+
+# --- Deduplicación de Tickets ---
+def normalize_ticket_content(text):
+    return re.sub(r'\s+', ' ', text or "").strip().casefold()
+
+
+def group_duplicate_tickets(ticket_contents):
+    # Devuelve listas de índices de fila con el mismo contenido normalizado, en orden de primera aparición
+    groups = {}
+    for row_index, content in enumerate(ticket_contents):
+        groups.setdefault(normalize_ticket_content(content), []).append(row_index)
+    return list(groups.values())
+
+
+class JobContentResults:
+    # Resultados correctos de la tarea por contenido normalizado, para que los duplicados exactos que caen en
+    # bloques distintos tampoco vuelvan al LLM (ni siquiera con bypass_cache, que ignora la caché). Se guarda
+    # un hash del contenido, no el texto, y como mucho max_entries entradas, descartando las usadas hace más
+    # tiempo. Con caché de resultados solo se guarda la clave de caché y el resultado se relee de ella; sin
+    # caché se guarda el resultado completo, con un límite menor.
+    def __init__(self, result_cache=None, max_entries=None):
+        self.result_cache = result_cache
+        if max_entries is None:
+            max_entries = DEDUP_MAX_TRACKED_CONTENTS if result_cache is not None else DEDUP_MAX_TRACKED_RESULTS_WITHOUT_CACHE
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def content_key(ticket_content):
+        return hashlib.sha1(normalize_ticket_content(ticket_content).encode("utf-8")).digest()
+
+    def get(self, content_key):
+        # Devuelve (resultado, id de grupo semántico) o None
+        entry = self._entries.get(content_key)
+        if entry is None:
+            return None
+        stored, cluster_id = entry
+        if self.result_cache is not None:
+            result = self.result_cache.get(stored.hex())
+            if result is None:
+                # Expirada o descartada de la caché: el contenido se vuelve a analizar
+                del self._entries[content_key]
+                return None
+        else:
+            result = stored
+        self._entries.move_to_end(content_key)
+        return result, cluster_id
+
+    def put(self, content_key, result, cluster_id=None, cache_key=None):
+        # Con caché, solo se recuerdan los resultados que están guardados en ella (cache_key)
+        if self.result_cache is not None:
+            if not cache_key:
+                return
+            stored = bytes.fromhex(cache_key)
+        else:
+            stored = dict(result)
+        self._entries[content_key] = (stored, cluster_id)
+        self._entries.move_to_end(content_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
 
 # --- Interacción con Ollama ---
-def call_ollama(prompt_text, model_name=OLLAMA_MODEL, task_type="general", expect_json=False):
-    full_url = f"{OLLAMA_BASE_URL}/api/generate"
+def call_ollama(prompt_text, model_name=OLLAMA_MODEL, task_type="general", expect_json=False, extra_options=None,
+                stage_timings=None):
     payload = {
         "model": model_name,
         "prompt": prompt_text,
@@ -37,32 +433,66 @@ def call_ollama(prompt_text, model_name=OLLAMA_MODEL, task_type="general", expec
             "temperature": 0.3,
         }
     }
+    if extra_options:
+        payload["options"].update(extra_options)
     if expect_json:
         payload["format"] = "json"
 
     response_text_for_error = ""
+    metrics = get_metrics_registry()
+    limiter = get_concurrency_limiter()
+    # Tiempo de espera por un hueco del limitador (cola) separado del tiempo de servicio de Ollama
+    with timed_stage("llm_queue_wait", stage_timings):
+        limiter.acquire()
+    request_started = time.monotonic()
+    response_received_at = None
+    overloaded = False
+    succeeded = False
+    generated_tokens = 0
+    outcome = "unexpected_error"
+    backend = None
     try:
-        response = requests.post(full_url, json=payload, timeout=180) # 3 minutos timeout
+        response = get_ollama_client().generate(payload)
+        backend = getattr(response, "ollama_backend", None)
+        response_received_at = time.monotonic()
         response_text_for_error = response.text
+        overloaded = response.status_code >= 500
         response.raise_for_status()
+        succeeded = True
         response_json = response.json()
+        generated_tokens = response_json.get("eval_count") or 0
+        prompt_tokens = response_json.get("prompt_eval_count") or 0
+        metrics.increment("ticket_analyzer_llm_prompt_tokens_total", prompt_tokens, model=model_name)
+        metrics.increment("ticket_analyzer_llm_eval_tokens_total", generated_tokens, model=model_name)
+        if stage_timings is not None:
+            stage_timings.add_tokens(prompt_tokens, generated_tokens)
         raw_llm_response = response_json.get("response", "").strip()
 
         if expect_json:
+            parse_started = time.perf_counter()
             try:
                 json_match = re.search(r'\{.*\}', raw_llm_response, re.DOTALL)
                 if json_match:
                     parsed_json = json.loads(json_match.group(0))
-                    return parsed_json
                 else: # Intentar parsear directamente si no hay un bloque JSON claro
-                    return json.loads(raw_llm_response)
+                    parsed_json = json.loads(raw_llm_response)
+                outcome = "success"
+                return parsed_json
             except json.JSONDecodeError as je:
+                outcome = "invalid_json"
                 print(f"Error decodificando JSON de Ollama ({task_type}): {je}. Respuesta: {raw_llm_response[:500]}")
                 return {"error_parsing_json": f"JSONDecodeError: {str(je)}", "raw_response": raw_llm_response}
+            finally:
+                record_stage("json_parse", time.perf_counter() - parse_started, stage_timings)
         else:
+            outcome = "success"
             return raw_llm_response
 
     except requests.exceptions.RequestException as e:
+        backend = backend or getattr(e, "ollama_backend", None)
+        outcome = "http_error" if response_received_at is not None else "connection_error"
+        if isinstance(e, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+            overloaded = True
         print(f"Error llamando a Ollama ({task_type}): {e}. Respuesta: {response_text_for_error[:500]}")
         error_message = f"ERROR_OLLAMA: No se pudo conectar o procesar la solicitud con Ollama. {str(e)}"
         if "model not found" in str(e).lower() or ("no such file or directory" in response_text_for_error.lower() if response_text_for_error else False):
@@ -71,21 +501,52 @@ def call_ollama(prompt_text, model_name=OLLAMA_MODEL, task_type="general", expec
     except Exception as e:
         print(f"Error inesperado en call_ollama ({task_type}): {e}")
         return {"error_unexpected": str(e)} if expect_json else f"ERROR_OLLAMA: Error inesperado. {str(e)}"
+    finally:
+        service_seconds = (response_received_at or time.monotonic()) - request_started
+        record_stage("llm_service", service_seconds, stage_timings)
+        metrics.increment("ticket_analyzer_llm_requests_total", model=model_name, outcome=outcome)
+        if backend:
+            metrics.increment("ticket_analyzer_ollama_backend_requests_total", backend=backend, outcome=outcome)
+            if stage_timings is not None:
+                stage_timings.add_backend_request(backend, service_seconds, generated_tokens, not succeeded)
+        # Solo las respuestas correctas aportan muestras de latencia (un 404 rápido no es representativo)
+        limiter.release(service_seconds if succeeded else None, overloaded=overloaded, generated_tokens=generated_tokens)
 
 
 # --- Lógica de Análisis de Ticket Individual ---
-def analyze_single_ticket(ticket_content, custom_context, ollama_model):
-    expected_keys = [
-        "Clasificacion_Sugerida_IA",
-        "Problema_Principal_IA",
-        "Sintomas_Detectados_IA",
-        "Acciones_Realizadas_IA",
-        "Causa_Raiz_Estimada_IA",
-        "Resumen_General_Conciso_IA"
-    ]
-    default_values = {key: "No generado por IA" for key in expected_keys}
+ANALYSIS_RESULT_KEYS = [
+    "Clasificacion_Sugerida_IA",
+    "Problema_Principal_IA",
+    "Sintomas_Detectados_IA",
+    "Acciones_Realizadas_IA",
+    "Causa_Raiz_Estimada_IA",
+    "Resumen_General_Conciso_IA"
+]
+ANALYSIS_RESULT_COLUMNS = ANALYSIS_RESULT_KEYS + ["Error_Analisis_IA"]
+# Categorías que no se consideran un patrón real al generar recomendaciones
+NON_PATTERN_CATEGORIES = ["Otro", "Error Futuro", "No generado por IA", "No aplica", "No especificado"]
+
+
+def normalize_llm_analysis(llm_response):
+    analysis_result = {}
+    for key in ANALYSIS_RESULT_KEYS:
+        analysis_result[key] = llm_response.get(key, "No generado por IA")
+    analysis_result["Error_Analisis_IA"] = None
+    return analysis_result
+
+
+def analyze_single_ticket(ticket_content, custom_context, ollama_model, stage_timings=None, include_confidence=False,
+                          context_tokens=None):
+    # context_tokens: num_ctx común a todas las peticiones de la tarea (modo por lotes). Ollama recarga el modelo
+    # cada vez que cambia num_ctx, así que las peticiones individuales deben usar el mismo valor que los lotes.
+    default_values = {key: "No generado por IA" for key in ANALYSIS_RESULT_KEYS}
     default_values["Error_Analisis_IA"] = None
 
+    prompt_started = time.perf_counter()
+    confidence_instruction = (
+        f"- \"Confianza_IA\": Un número entre 0 y 1 con tu confianza en la clasificación (1 = totalmente seguro).\n"
+        if include_confidence else ""
+    )
     structured_summary_prompt = (
         f"Eres un asistente experto en análisis de tickets de TI. Analiza el siguiente ticket y proporciona la información en un formato JSON estructurado. "
         f"El objeto JSON debe tener las siguientes claves EXACTAS:\n"
@@ -95,13 +556,17 @@ def analyze_single_ticket(ticket_content, custom_context, ollama_model):
         f"- \"Acciones_Realizadas_IA\": Cualquier acción ya tomada por el usuario o soporte mencionada en el ticket.\n"
         f"- \"Causa_Raiz_Estimada_IA\": Una estimación breve de la posible causa raíz, si se puede inferir.\n"
         f"- \"Resumen_General_Conciso_IA\": Un resumen técnico muy breve (1-2 frases) del ticket en general.\n"
+        f"{confidence_instruction}"
         f"Si alguna información no está presente o no se puede inferir del ticket, usa el valor string \"No aplica\" o \"No especificado\" para esa clave.\n"
         f"Contexto Adicional del Entorno: {custom_context if custom_context else 'Ninguno'}\n"
         f"Ticket:\n\"\"\"\n{ticket_content}\n\"\"\"\n"
         f"Respuesta JSON:"
     )
+    record_stage("prompt_build", time.perf_counter() - prompt_started, stage_timings)
 
-    llm_response = call_ollama(structured_summary_prompt, ollama_model, task_type="structured_summary", expect_json=True)
+    llm_response = call_ollama(structured_summary_prompt, ollama_model, task_type="structured_summary", expect_json=True,
+                               extra_options={"num_ctx": context_tokens} if context_tokens else None,
+                               stage_timings=stage_timings)
 
     if isinstance(llm_response, dict):
         if "error_ollama" in llm_response or "error_unexpected" in llm_response or "error_parsing_json" in llm_response:
@@ -115,10 +580,9 @@ def analyze_single_ticket(ticket_content, custom_context, ollama_model):
                  analysis_result["Resumen_General_Conciso_IA"] = f"Respuesta cruda (error JSON): {llm_response['raw_response'][:200]}"
             return analysis_result
         else:
-            analysis_result = {}
-            for key in expected_keys:
-                analysis_result[key] = llm_response.get(key, default_values[key])
-            analysis_result["Error_Analisis_IA"] = None
+            analysis_result = normalize_llm_analysis(llm_response)
+            if include_confidence:
+                analysis_result["Confianza_IA"] = parse_confidence(llm_response.get("Confianza_IA"))
             return analysis_result
     else:
         analysis_result = default_values.copy()
@@ -126,121 +590,791 @@ def analyze_single_ticket(ticket_content, custom_context, ollama_model):
         return analysis_result
 
 
-# --- Procesamiento del Archivo Excel ---
-def process_excel_file(filepath, original_filename_base, custom_context, selected_columns, ollama_model, update_progress_callback):
+# --- Enrutamiento en Dos Niveles (reglas o modelo rápido -> modelo principal) ---
+ROUTING_RESULT_COLUMNS = ["Ruta_Modelo_IA", "Motivo_Ruta_IA"]
+ROUTING_TIER_KEYWORDS = "reglas"
+ROUTING_TIER_FAST = "modelo_rapido"
+ROUTING_TIER_LARGE = "modelo_principal"
+# Forma parte de la clave de caché: cambia al editar las reglas o el umbral de confianza
+ROUTING_PROMPT_VERSION = f"routing-{KEYWORD_RULES_FINGERPRINT}-{ROUTING_MIN_CONFIDENCE}"
+
+
+def parse_confidence(value):
     try:
-        df = pd.read_excel(filepath)
-    except Exception as e:
-        msg = f"Error al leer el archivo Excel: {e}"
-        update_progress_callback(0, 0, msg, "error")
-        return None, {"error": msg}
+        confidence = float(str(value).strip().rstrip("%"))
+    except (TypeError, ValueError):
+        return None
+    if 1 < confidence <= 100:  # Algunos modelos responden en porcentaje
+        confidence /= 100
+    return confidence if 0 <= confidence <= 1 else None
 
-    num_tickets = len(df)
-    if num_tickets == 0:
-        update_progress_callback(0, 0, "El archivo Excel está vacío.", "completed")
-        return filepath, {"message": "Archivo vacío", "total_tickets": 0}
-
-    analysis_results_list = []
-    processed_count = 0
-    
-    desc_col = selected_columns.get('description_column')
-    short_desc_col = selected_columns.get('short_description_column')
-    work_notes_col = selected_columns.get('work_notes_column')
-
-    actual_cols_to_use_for_content = []
-    if desc_col and desc_col in df.columns: actual_cols_to_use_for_content.append(desc_col)
-    if short_desc_col and short_desc_col in df.columns: actual_cols_to_use_for_content.append(short_desc_col)
-    if work_notes_col and work_notes_col in df.columns: actual_cols_to_use_for_content.append(work_notes_col)
-    
-    if not actual_cols_to_use_for_content:
-        msg = (f"Error: Ninguna de las columnas de texto especificadas ({desc_col}, {short_desc_col}, {work_notes_col}) "
-               f"se encontraron en el archivo Excel o no se proporcionaron. Columnas disponibles: {', '.join(df.columns)}")
-        update_progress_callback(0, num_tickets, msg, "error")
-        return None, {"error": msg}
 
-    update_progress_callback(0, num_tickets, "Iniciando análisis de tickets...", "processing")
-
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = []
-        for index, row in df.iterrows():
-            ticket_parts = []
-            if short_desc_col and short_desc_col in df.columns and pd.notna(row.get(short_desc_col)):
-                ticket_parts.append(f"Descripción breve: {clean_html_and_identifiers(str(row[short_desc_col]))}")
-            if desc_col and desc_col in df.columns and pd.notna(row.get(desc_col)):
-                ticket_parts.append(f"Descripción completa: {clean_html_and_identifiers(str(row[desc_col]))}")
-            if work_notes_col and work_notes_col in df.columns and pd.notna(row.get(work_notes_col)):
-                ticket_parts.append(f"Notas de trabajo: {clean_html_and_identifiers(str(row[work_notes_col]))}")
-
-            full_ticket_content = " || ".join(ticket_parts)
-            if not full_ticket_content.strip():
-                full_ticket_content = "Contenido del ticket no disponible o vacío en columnas seleccionadas."
-            
-            futures.append(executor.submit(analyze_single_ticket, full_ticket_content, custom_context, ollama_model))
-
-        for i, future in enumerate(futures):
+def build_keyword_result(ticket_content, rule):
+    # Resumen a partir de la primera parte del ticket (normalmente la descripción breve), sin su etiqueta
+    first_part = ticket_content.split(TICKET_PARTS_SEPARATOR)[0]
+    _, separator, text = first_part.partition(": ")
+    result = {key: "No especificado" for key in ANALYSIS_RESULT_KEYS}
+    result["Clasificacion_Sugerida_IA"] = rule["category"]
+    result["Problema_Principal_IA"] = rule["problem"]
+    result["Resumen_General_Conciso_IA"] = (text if separator else first_part)[:200]
+    result["Error_Analisis_IA"] = None
+    return result
+
+
+def analyze_ticket_routed(ticket_content, custom_context, ollama_model, fast_model, stage_timings=None):
+    # Nivel 1: reglas de palabras clave (sin LLM) o modelo rápido; nivel 2: modelo principal para los
+    # tickets largos o cuando el modelo rápido falla, duda o devuelve una categoría genérica.
+    metrics = get_metrics_registry()
+    rule, matched_text = get_keyword_classifier().classify(ticket_content)
+    if rule is not None:
+        metrics.increment("ticket_analyzer_routing_decisions_total", tier=ROUTING_TIER_KEYWORDS)
+        return dict(build_keyword_result(ticket_content, rule), Ruta_Modelo_IA=ROUTING_TIER_KEYWORDS,
+                    Motivo_Ruta_IA=f"Palabra clave '{matched_text}'")
+
+    if len(ticket_content) > ROUTING_FAST_MAX_CHARS:
+        reason = f"Ticket largo ({len(ticket_content)} caracteres)"
+    elif fast_model == ollama_model:
+        reason = "El modelo rápido es el mismo que el principal"
+    else:
+        fast_result = analyze_single_ticket(ticket_content, custom_context, fast_model, stage_timings, include_confidence=True)
+        confidence = fast_result.pop("Confianza_IA", None)
+        if fast_result.get("Error_Analisis_IA"):
+            reason = f"Error en el modelo rápido: {fast_result['Error_Analisis_IA'][:100]}"
+        elif fast_result["Clasificacion_Sugerida_IA"] in NON_PATTERN_CATEGORIES:
+            reason = f"Clasificación genérica del modelo rápido ('{fast_result['Clasificacion_Sugerida_IA']}')"
+        elif confidence is None or confidence < ROUTING_MIN_CONFIDENCE:
+            reason = "Confianza baja del modelo rápido" + (f" ({confidence:.2f})" if confidence is not None else " (no indicada)")
+        else:
+            metrics.increment("ticket_analyzer_routing_decisions_total", tier=ROUTING_TIER_FAST)
+            return dict(fast_result, Ruta_Modelo_IA=ROUTING_TIER_FAST, Motivo_Ruta_IA=f"Confianza {confidence:.2f}")
+
+    metrics.increment("ticket_analyzer_routing_decisions_total", tier=ROUTING_TIER_LARGE)
+    large_result = analyze_single_ticket(ticket_content, custom_context, ollama_model, stage_timings)
+    return dict(large_result, Ruta_Modelo_IA=ROUTING_TIER_LARGE, Motivo_Ruta_IA=reason)
+
+
+# --- Análisis por Lotes (varios tickets cortos en un mismo prompt) ---
+_model_context_lengths = {}
+_model_context_lengths_lock = threading.Lock()
+
+
+def get_model_context_length(ollama_model):
+    with _model_context_lengths_lock:
+        if ollama_model in _model_context_lengths:
+            return _model_context_lengths[ollama_model]
+    context_length = BATCH_DEFAULT_CONTEXT_TOKENS
+    try:
+        response = get_ollama_client().show(ollama_model, timeout=10)
+        response.raise_for_status()
+        model_info = response.json().get("model_info") or {}
+        for key, value in model_info.items():
+            if key.endswith(".context_length") and isinstance(value, int):
+                context_length = value
+                break
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"No se pudo obtener la longitud de contexto de '{ollama_model}', se usa {context_length}: {e}")
+    with _model_context_lengths_lock:
+        _model_context_lengths[ollama_model] = context_length
+    return context_length
+
+
+def build_batch_prompt(ticket_contents, custom_context):
+    tickets_block = "\n".join(
+        f"[TICKET {ticket_index}]\n\"\"\"\n{content}\n\"\"\"" for ticket_index, content in enumerate(ticket_contents)
+    )
+    return (
+        f"Eres un asistente experto en análisis de tickets de TI. Analiza CADA UNO de los {len(ticket_contents)} tickets siguientes "
+        f"de forma independiente y responde con un objeto JSON con una única clave \"results\", cuyo valor sea un arreglo JSON "
+        f"con exactamente un objeto por ticket. Cada objeto debe tener las siguientes claves EXACTAS:\n"
+        f"- \"ticket_index\": El número del ticket tal como aparece en [TICKET n].\n"
+        f"- \"Clasificacion_Sugerida_IA\": Una categoría concisa para el ticket (ej: 'Problema de Software', 'Fallo de Hardware', 'Solicitud de Acceso').\n"
+        f"- \"Problema_Principal_IA\": Descripción breve del problema central del ticket.\n"
+        f"- \"Sintomas_Detectados_IA\": Síntomas o efectos observables del problema.\n"
+        f"- \"Acciones_Realizadas_IA\": Cualquier acción ya tomada por el usuario o soporte mencionada en el ticket.\n"
+        f"- \"Causa_Raiz_Estimada_IA\": Una estimación breve de la posible causa raíz, si se puede inferir.\n"
+        f"- \"Resumen_General_Conciso_IA\": Un resumen técnico muy breve (1-2 frases) del ticket en general.\n"
+        f"Si alguna información no está presente o no se puede inferir del ticket, usa el valor string \"No aplica\" o \"No especificado\" para esa clave.\n"
+        f"Contexto Adicional del Entorno: {custom_context if custom_context else 'Ninguno'}\n"
+        f"Tickets:\n{tickets_block}\n"
+        f"Respuesta JSON:"
+    )
+
+
+def plan_ticket_batches(ticket_contents, custom_context, context_tokens):
+    # Empaqueta índices de tickets en lotes que quepan en la ventana de contexto (prompt + respuesta esperada)
+    prompt_overhead = estimate_tokens(build_batch_prompt([], custom_context))
+    batches = []
+    current_batch = []
+    current_tokens = prompt_overhead
+    for ticket_index, content in enumerate(ticket_contents):
+        ticket_tokens = estimate_tokens(content) + BATCH_OUTPUT_TOKENS_PER_TICKET + 10
+        if current_batch and (len(current_batch) >= BATCH_MAX_SIZE or current_tokens + ticket_tokens > context_tokens):
+            batches.append(current_batch)
+            current_batch = []
+            current_tokens = prompt_overhead
+        current_batch.append(ticket_index)
+        current_tokens += ticket_tokens
+    if current_batch:
+        batches.append(current_batch)
+    return batches
+
+
+def analyze_ticket_batch(ticket_contents, custom_context, ollama_model, context_tokens, stage_timings=None):
+    # Devuelve (resultados en el mismo orden que ticket_contents, nº de tickets reanalizados individualmente)
+    if len(ticket_contents) == 1:
+        return [analyze_single_ticket(ticket_contents[0], custom_context, ollama_model, stage_timings,
+                                      context_tokens=context_tokens)], 0
+
+    with timed_stage("prompt_build", stage_timings):
+        batch_prompt = build_batch_prompt(ticket_contents, custom_context)
+    llm_response = call_ollama(batch_prompt, ollama_model, task_type="structured_summary_batch", expect_json=True,
+                               extra_options={"num_ctx": context_tokens}, stage_timings=stage_timings)
+
+    results = [None] * len(ticket_contents)
+    batch_items = llm_response.get("results") if isinstance(llm_response, dict) else None
+    if isinstance(batch_items, list):
+        for item in batch_items:
+            if not isinstance(item, dict):
+                continue
             try:
-                single_ticket_analysis = future.result()
-                analysis_results_list.append(single_ticket_analysis)
+                ticket_index = int(item.get("ticket_index"))
+            except (TypeError, ValueError):
+                continue
+            # Solo se aceptan objetos con índice válido, no repetido y con todas las claves esperadas
+            if 0 <= ticket_index < len(results) and results[ticket_index] is None \
+                    and all(key in item for key in ANALYSIS_RESULT_KEYS):
+                results[ticket_index] = normalize_llm_analysis(item)
+    else:
+        print(f"Respuesta de lote no válida ({len(ticket_contents)} tickets), se reanalizan individualmente.")
+
+    retried_individually = 0
+    for ticket_index, result in enumerate(results):
+        if result is None:
+            results[ticket_index] = analyze_single_ticket(ticket_contents[ticket_index], custom_context, ollama_model,
+                                                          stage_timings, context_tokens=context_tokens)
+            retried_individually += 1
+    return results, retried_individually
+
+
+# --- Procesamiento del Archivo de Tickets ---
+def build_error_result(error_message, placeholder="Error Futuro"):
+    error_result = {key: placeholder for key in ANALYSIS_RESULT_KEYS}
+    error_result["Error_Analisis_IA"] = error_message
+    return error_result
+
+
+def analyze_ticket_chunk(chunk_df, selected_columns, custom_context, ollama_model, executor,
+                         result_cache, bypass_cache, pipeline_stats, report_progress, batch_context_tokens=None,
+                         checkpoint_store=None, task_id=None, row_offset=0, stage_timings=None, semantic_index=None,
+                         routing_fast_model=None, prompt_token_budget=None, summarize_notes=False, ticket_history=None,
+                         job_content_results=None):
+    # report_progress(filas, resultados) se llama una vez por cada conjunto de filas del bloque que termina,
+    # en orden de finalización
+    chunk_results = [None] * len(chunk_df)
+    incremental_statuses = None
+
+    def complete_rows(row_indices):
+        if incremental_statuses is None:
+            results = [chunk_results[i] for i in row_indices]
+        else:
+            results = [dict(chunk_results[i], Estado_Incremental_IA=incremental_statuses[i]) for i in row_indices]
+        report_progress(row_indices, results)
+
+    # Con enrutamiento el resultado depende de ambos modelos y de las reglas: se cachea bajo otra clave
+    if routing_fast_model:
+        cache_model = f"{routing_fast_model}>{ollama_model}"
+        cache_prompt_version = f"{STRUCTURED_SUMMARY_PROMPT_VERSION}+{ROUTING_PROMPT_VERSION}"
+    else:
+        cache_model = ollama_model
+        cache_prompt_version = STRUCTURED_SUMMARY_PROMPT_VERSION
+
+    # Filas ya analizadas en una ejecución anterior de esta tarea (reanudación)
+    restored_indices = []
+    if checkpoint_store is not None:
+        restored_rows = checkpoint_store.load_rows(task_id, row_offset, row_offset + len(chunk_df))
+        for row_index, restored_result in restored_rows.items():
+            chunk_results[row_index - row_offset] = restored_result
+            restored_indices.append(row_index - row_offset)
+        pipeline_stats["resumed_rows"] += len(restored_rows)
+
+    # Análisis incremental: los tickets con el mismo número y el mismo contenido que en una subida anterior
+    # (con la misma configuración de análisis) reutilizan su resultado sin limpiar el texto ni llamar al LLM
+    if ticket_history is not None:
+        history_key = build_cache_key(f"{prompt_token_budget or 0}|{bool(summarize_notes)}", custom_context,
+                                      cache_model, cache_prompt_version)
+        ticket_ids, content_hashes = build_ticket_identities(chunk_df, selected_columns)
+        known_tickets = ticket_history.load(history_key, [ticket_id for ticket_id in ticket_ids if ticket_id])
+        incremental_statuses = []
+        reused_ids = []
+        reused_indices = []
+        for row_index, (ticket_id, content_hash) in enumerate(zip(ticket_ids, content_hashes)):
+            previous = known_tickets.get(ticket_id) if ticket_id else None
+            if not ticket_id:
+                incremental_statuses.append(INCREMENTAL_STATUS_NO_ID)
+            elif previous is None:
+                incremental_statuses.append(INCREMENTAL_STATUS_NEW)
+            elif previous[0] != content_hash:
+                incremental_statuses.append(INCREMENTAL_STATUS_CHANGED)
+            else:
+                incremental_statuses.append(INCREMENTAL_STATUS_UNCHANGED)
+                if not bypass_cache and chunk_results[row_index] is None:
+                    chunk_results[row_index] = dict(previous[1])
+                    reused_ids.append(ticket_id)
+                    reused_indices.append(row_index)
+        pipeline_stats["incremental_status_counts"].update(incremental_statuses)
+        if reused_ids:
+            ticket_history.touch(history_key, reused_ids)
+            pipeline_stats["incremental_reused_rows"] += len(reused_ids)
+            complete_rows(reused_indices)
+    if restored_indices:
+        complete_rows(restored_indices)
+
+    def finish_chunk():
+        if ticket_history is None:
+            return chunk_results
+        reused_id_set = set(reused_ids)
+        entries = {}
+        for ticket_id, content_hash, result in zip(ticket_ids, content_hashes, chunk_results):
+            if ticket_id and ticket_id not in reused_id_set and result is not None and not result.get("Error_Analisis_IA"):
+                entries[ticket_id] = (ticket_id, content_hash, result)
+        try:
+            ticket_history.save(history_key, list(entries.values()))
+        except Exception as e:
+            print(f"Error guardando el historial de tickets de la tarea {task_id}: {e}")
+        # El estado se añade después de guardar: describe esta subida, no forma parte del análisis
+        for result, status in zip(chunk_results, incremental_statuses):
+            if result is not None:
+                result["Estado_Incremental_IA"] = status
+        return chunk_results
+
+    pending_indices = [i for i, result in enumerate(chunk_results) if result is None]
+    if not pending_indices:
+        return finish_chunk()
+    ticket_contents = [None] * len(chunk_df)
+    with timed_stage("clean", stage_timings):
+        pending_parts = build_ticket_parts(chunk_df.iloc[pending_indices], selected_columns)
+    if summarize_notes:
+        summarize_long_work_notes(pending_parts, ollama_model, executor, result_cache, bypass_cache, pipeline_stats,
+                                  stage_timings, context_tokens=batch_context_tokens)
+    with timed_stage("clean", stage_timings):
+        pending_contents = [compose_ticket_content(ticket_parts, prompt_token_budget, pipeline_stats)
+                            for ticket_parts in pending_parts]
+    for i, content in zip(pending_indices, pending_contents):
+        ticket_contents[i] = content
+
+    # Agrupar filas con contenido idéntico (incidencias masivas, tickets de monitorización)
+    # para consultar al LLM una sola vez por grupo y replicar el resultado a todos sus miembros.
+    ticket_groups = [[pending_indices[j] for j in group]
+                     for group in group_duplicate_tickets([ticket_contents[i] for i in pending_indices])]
+
+    def assign_group_result(member_indices, group_result):
+        for member_index in member_indices:
+            chunk_results[member_index] = dict(group_result)
+
+    def checkpoint_groups(groups, group_analyses):
+        if checkpoint_store is None:
+            return
+        # Los análisis con error no se guardan: al reanudar se vuelven a intentar
+        checkpoint_store.save_rows(task_id, {row_offset + member_index: group_analysis
+                                             for (member_indices, _), group_analysis in zip(groups, group_analyses)
+                                             if not group_analysis.get("Error_Analisis_IA")
+                                             for member_index in member_indices})
+
+    def checkpoint_when_done(groups, is_batch):
+        # Se guarda en cuanto termina cada petición (en el hilo del worker), sin esperar a que se
+        # consuman los resultados en orden: si el proceso cae, no se pierde trabajo ya hecho.
+        def on_done(future):
+            if future.cancelled() or future.exception() is not None:
+                return
+            try:
+                checkpoint_groups(groups, future.result()[0] if is_batch else [future.result()])
             except Exception as e:
-                print(f"Error procesando ticket {i} en el futuro: {e}")
-                error_result = {
-                    "Clasificacion_Sugerida_IA": "Error Futuro", "Problema_Principal_IA": "Error Futuro",
-                    "Sintomas_Detectados_IA": "Error Futuro", "Acciones_Realizadas_IA": "Error Futuro",
-                    "Causa_Raiz_Estimada_IA": "Error Futuro", "Resumen_General_Conciso_IA": "Error Futuro",
-                    "Error_Analisis_IA": f"Error en ThreadPoolExecutor: {str(e)}"
-                }
-                analysis_results_list.append(error_result)
-            processed_count += 1
-            update_progress_callback(processed_count, num_tickets, f"Procesando ticket {processed_count}/{num_tickets}", "processing")
-
-    df_analysis_results = pd.DataFrame(analysis_results_list)
+                print(f"Error guardando checkpoint de la tarea {task_id}: {e}")
+        return on_done
+
+    # Gestión de resultados en el hilo principal (caché, duplicados, checkpoints, progreso): etapa "bookkeeping"
+    bookkeeping_started = time.perf_counter()
+    # Contenidos ya analizados en bloques anteriores de la tarea: la deduplicación abarca todo el archivo
+    content_key_of_group = {}
+    if job_content_results is not None:
+        new_groups = []
+        repeated_groups = []
+        for member_indices in ticket_groups:
+            content_key = JobContentResults.content_key(ticket_contents[member_indices[0]])
+            known = job_content_results.get(content_key)
+            if known is None:
+                content_key_of_group[member_indices[0]] = content_key
+                new_groups.append(member_indices)
+                continue
+            known_result, known_cluster_id = known
+            assign_group_result(member_indices, known_result)
+            if semantic_index is not None and not pipeline_stats["semantic_error"]:
+                semantic_index.add_rows(known_cluster_id, len(member_indices))
+            repeated_groups.append(member_indices)
+        ticket_groups = new_groups
+        if repeated_groups:
+            checkpoint_groups([(group, None) for group in repeated_groups], [chunk_results[group[0]] for group in repeated_groups])
+            complete_rows([member_index for group in repeated_groups for member_index in group])
+    pipeline_stats["unique_tickets"] += len(ticket_groups)
+
+    groups_to_analyze = []
+    cached_rows = 0
+    cache_key_of_group = {}  # primera fila del grupo -> clave de caché donde está guardado su resultado
+    for member_indices in ticket_groups:
+        representative_content = ticket_contents[member_indices[0]]
+
+        cache_key = None
+        if result_cache is not None:
+            cache_key = build_cache_key(representative_content, custom_context, cache_model, cache_prompt_version)
+            cached_result = None if bypass_cache else result_cache.get(cache_key)
+            if cached_result is not None:
+                pipeline_stats["cache_hits"] += 1
+                cache_key_of_group[member_indices[0]] = cache_key
+                assign_group_result(member_indices, cached_result)
+                cached_rows += len(member_indices)
+                continue
+            pipeline_stats["cache_misses"] += 1
+        groups_to_analyze.append((member_indices, cache_key))
+
+    if cached_rows:
+        cached_groups = [group for group in ticket_groups if chunk_results[group[0]] is not None]
+        checkpoint_groups([(group, None) for group in cached_groups], [chunk_results[group[0]] for group in cached_groups])
+        complete_rows([member_index for group in cached_groups for member_index in group])
+    record_stage("bookkeeping", time.perf_counter() - bookkeeping_started, stage_timings)
+
+    # Agrupamiento semántico: los tickets casi idénticos (mismo error, distinto host o usuario) reutilizan
+    # el análisis del representante de su grupo en lugar de generar uno nuevo.
+    cluster_of_group = {}  # primera fila del grupo -> id de grupo semántico
+    representative_of_cluster = {}  # id de grupo semántico -> primera fila del grupo representante (en este bloque)
+    followers_of_group = {}  # primera fila del representante -> grupos (filas, clave de caché) que esperan su análisis
+    if semantic_index is not None and not pipeline_stats["semantic_error"]:
+        representative_contents = [ticket_contents[group[0]] for group in ticket_groups]
+        try:
+            with timed_stage("embed", stage_timings):
+                vectors = embed_texts(representative_contents)
+        except EmbeddingError as e:
+            print(f"Agrupamiento semántico desactivado para la tarea {task_id}: {e}")
+            pipeline_stats["semantic_error"] = str(e)
+            vectors = None
+        if vectors is not None:
+            assignments = semantic_index.assign(vectors, representative_contents)
+            reuse_candidates = {}
+            for member_indices, (cluster_id, similarity, is_new) in zip(ticket_groups, assignments):
+                semantic_index.add_rows(cluster_id, len(member_indices))
+                cluster_of_group[member_indices[0]] = cluster_id
+                if is_new:
+                    representative_of_cluster[cluster_id] = member_indices[0]
+                    if chunk_results[member_indices[0]] is not None:
+                        semantic_index.set_result(cluster_id, chunk_results[member_indices[0]])
+                elif cluster_id is not None and similarity >= semantic_index.reuse_threshold:
+                    reuse_candidates[member_indices[0]] = cluster_id
+
+            reused_groups = []
+            remaining_groups = []
+            for group in groups_to_analyze:
+                member_indices = group[0]
+                cluster_id = reuse_candidates.get(member_indices[0])
+                if cluster_id is not None and semantic_index.cluster_results[cluster_id] is not None:
+                    assign_group_result(member_indices, semantic_index.cluster_results[cluster_id])
+                    reused_groups.append(member_indices)
+                elif cluster_id is not None and cluster_id in representative_of_cluster \
+                        and chunk_results[representative_of_cluster[cluster_id]] is None:
+                    followers_of_group.setdefault(representative_of_cluster[cluster_id], []).append(group)
+                else:
+                    remaining_groups.append(group)
+            groups_to_analyze = remaining_groups
+            if reused_groups:
+                reused_rows = sum(len(member_indices) for member_indices in reused_groups)
+                pipeline_stats["semantic_reused_rows"] += reused_rows
+                checkpoint_groups([(group, None) for group in reused_groups], [chunk_results[group[0]] for group in reused_groups])
+                complete_rows([member_index for group in reused_groups for member_index in group])
+
+    # Cada envío agrupa uno o varios grupos de tickets: en modo por lotes los tickets cortos comparten prompt
+    submissions = []
+    single_groups = groups_to_analyze
+    if batch_context_tokens:
+        short_groups = [group for group in groups_to_analyze
+                        if len(ticket_contents[group[0][0]]) <= BATCH_MAX_TICKET_CHARS]
+        single_groups = [group for group in groups_to_analyze
+                         if len(ticket_contents[group[0][0]]) > BATCH_MAX_TICKET_CHARS]
+        short_contents = [ticket_contents[member_indices[0]] for member_indices, _ in short_groups]
+        for batch_positions in plan_ticket_batches(short_contents, custom_context, batch_context_tokens):
+            batch_groups = [short_groups[position] for position in batch_positions]
+            batch_contents = [short_contents[position] for position in batch_positions]
+            future = executor.submit(analyze_ticket_batch, batch_contents, custom_context, ollama_model, batch_context_tokens,
+                                     stage_timings)
+            future.add_done_callback(checkpoint_when_done(batch_groups, True))
+            submissions.append((batch_groups, future, True))
+            if len(batch_groups) > 1:
+                pipeline_stats["batches_sent"] += 1
+                pipeline_stats["batched_tickets"] += len(batch_groups)
+    def submit_single_group(group):
+        representative_content = ticket_contents[group[0][0]]
+        if routing_fast_model:
+            future = executor.submit(analyze_ticket_routed, representative_content, custom_context, ollama_model,
+                                     routing_fast_model, stage_timings)
+        else:
+            future = executor.submit(analyze_single_ticket, representative_content, custom_context, ollama_model, stage_timings,
+                                     context_tokens=batch_context_tokens)
+        future.add_done_callback(checkpoint_when_done([group], False))
+        return future
+
+    for group in single_groups:
+        submissions.append(([group], submit_single_group(group), False))
+
+    def consume_submission(future):
+        submission_groups, is_batch = submission_of_future.pop(future)
+        try:
+            if is_batch:
+                group_analyses, retried_individually = future.result()
+                pipeline_stats["batch_fallback_tickets"] += retried_individually
+            else:
+                group_analyses = [future.result()]
+        except Exception as e:
+            print(f"Error procesando ticket {submission_groups[0][0][0]} en el futuro: {e}")
+            group_analyses = [build_error_result(f"Error en ThreadPoolExecutor: {str(e)}")] * len(submission_groups)
 
+        for (member_indices, cache_key), single_ticket_analysis in zip(submission_groups, group_analyses):
+            # Solo se cachean análisis correctos; los errores deben reintentarse. Se escriben todos juntos al
+            # final del bloque (una transacción) en lugar de uno por uno en este hilo
+            if cache_key and not single_ticket_analysis.get("Error_Analisis_IA"):
+                cache_writes.append((cache_key, single_ticket_analysis))
+                cache_key_of_group[member_indices[0]] = cache_key
+            assign_group_result(member_indices, single_ticket_analysis)
+            complete_rows(member_indices)
+
+            cluster_id = cluster_of_group.get(member_indices[0])
+            if cluster_id is not None and representative_of_cluster.get(cluster_id) == member_indices[0]:
+                semantic_index.set_result(cluster_id, single_ticket_analysis)
+            followers = followers_of_group.pop(member_indices[0], [])
+            if not followers:
+                continue
+            if single_ticket_analysis.get("Error_Analisis_IA"):
+                # El representante falló: nunca se replica un error. El primer seguidor pasa a ser el
+                # representante del grupo y se analiza; el resto espera su resultado.
+                new_representative, *remaining_followers = followers
+                representative_of_cluster[cluster_id] = new_representative[0][0]
+                if remaining_followers:
+                    followers_of_group[new_representative[0][0]] = remaining_followers
+                submission_of_future[submit_single_group(new_representative)] = ([new_representative], False)
+                continue
+            for follower_indices, _ in followers:
+                assign_group_result(follower_indices, single_ticket_analysis)
+            follower_rows = sum(len(follower_indices) for follower_indices, _ in followers)
+            pipeline_stats["semantic_reused_rows"] += follower_rows
+            checkpoint_groups([(follower_indices, None) for follower_indices, _ in followers],
+                              [single_ticket_analysis] * len(followers))
+            complete_rows([member_index for follower_indices, _ in followers for member_index in follower_indices])
+
+    # Los resultados se consumen en orden de finalización: un ticket lento no retrasa el progreso ni la
+    # publicación de los que terminan después que él. Se pueden añadir envíos mientras tanto (seguidores
+    # semánticos cuyo representante falló).
+    submission_of_future = {future: (submission_groups, is_batch) for submission_groups, future, is_batch in submissions}
+    cache_writes = []
+    wait_started = time.perf_counter()
+    while submission_of_future:
+        done_futures, _ = wait(list(submission_of_future), return_when=FIRST_COMPLETED)
+        # Tiempo que el hilo principal pasa bloqueado esperando al LLM
+        record_stage("llm_wait", time.perf_counter() - wait_started, stage_timings)
+        wait_started = time.perf_counter()
+        for future in done_futures:
+            consume_submission(future)
+        record_stage("bookkeeping", time.perf_counter() - wait_started, stage_timings)
+        wait_started = time.perf_counter()
+
+    bookkeeping_started = time.perf_counter()
+    if result_cache is not None:
+        # También guarda los últimos accesos de los aciertos de caché de este bloque
+        result_cache.put_many(cache_writes)
+    if job_content_results is not None:
+        for member_indices in ticket_groups:
+            result = chunk_results[member_indices[0]]
+            if result is not None and not result.get("Error_Analisis_IA"):
+                job_content_results.put(content_key_of_group[member_indices[0]], result,
+                                        cluster_of_group.get(member_indices[0]), cache_key_of_group.get(member_indices[0]))
+    finished_results = finish_chunk()
+    record_stage("bookkeeping", time.perf_counter() - bookkeeping_started, stage_timings)
+    return finished_results
+
+
+def merge_analysis_columns(chunk_df, chunk_results, result_columns=ANALYSIS_RESULT_COLUMNS):
+    df_analysis_results = pd.DataFrame(chunk_results, columns=result_columns, index=chunk_df.index)
+    merged_df = chunk_df.copy()
     for col in df_analysis_results.columns:
-        if col not in df.columns:
-             df[col] = df_analysis_results[col]
+        if col not in chunk_df.columns:
+            merged_df[col] = df_analysis_results[col]
         else:
-            df[f"GenIA_{col}"] = df_analysis_results[col]
-    
-    category_counts = {}
+            merged_df[f"GenIA_{col}"] = df_analysis_results[col]
+    return merged_df
+
+
+def build_pattern_recommendations(category_counts, num_tickets, top_clusters=None):
     recommendations = []
     new_classification_col_name = "Clasificacion_Sugerida_IA"
-    if new_classification_col_name in df.columns:
-        valid_classifications = df[new_classification_col_name].dropna()
-        if not valid_classifications.empty:
-            category_counts = valid_classifications.value_counts().to_dict()
-            for category, count in category_counts.items():
-                if count > (num_tickets * 0.1) and category not in ["Otro", "Error Futuro", "No generado por IA", "No aplica", "No especificado"]:
-                    recommendations.append(
-                        f"La categoría '{category}' (sugerida por IA) aparece {count} veces ({count/num_tickets*100:.1f}%). "
-                        f"Considerar revisar patrones para este tipo."
-                    )
-        if not recommendations and num_tickets > 0 and not valid_classifications.empty:
-            recommendations.append("No se detectaron patrones de alta frecuencia en las categorías sugeridas por IA (>10% del total).")
-        elif valid_classifications.empty and num_tickets > 0:
-            recommendations.append(f"La columna '{new_classification_col_name}' no contiene clasificaciones válidas para analizar patrones.")
-
-    elif num_tickets > 0 :
-         recommendations.append(f"No se pudo generar la columna '{new_classification_col_name}' para el análisis de patrones.")
-    
     if num_tickets == 0:
         recommendations.append("No hay tickets para analizar patrones.")
-            
+        return recommendations
+    # Los grupos semánticos señalan problemas concretos repetidos, más útiles que la frecuencia por categoría
+    for cluster in top_clusters or []:
+        if cluster["size"] >= max(SEMANTIC_RECOMMENDATION_MIN_SIZE, num_tickets * SEMANTIC_RECOMMENDATION_MIN_SHARE):
+            description = cluster.get("problem") or cluster["sample"][:120]
+            category_note = f" (categoría '{cluster['category']}')" if cluster.get("category") else ""
+            recommendations.append(
+                f"{cluster['size']} tickets ({cluster['size']/num_tickets*100:.1f}%) describen el mismo problema: "
+                f"'{description}'{category_note}. Considerar un análisis de problema para su causa raíz común "
+                f"o una solución automatizada."
+            )
+    if not category_counts:
+        recommendations.append(f"La columna '{new_classification_col_name}' no contiene clasificaciones válidas para analizar patrones.")
+        return recommendations
+    for category, count in category_counts.items():
+        if count > (num_tickets * 0.1) and category not in NON_PATTERN_CATEGORIES:
+            recommendations.append(
+                f"La categoría '{category}' (sugerida por IA) aparece {count} veces ({count/num_tickets*100:.1f}%). "
+                f"Considerar revisar patrones para este tipo."
+            )
+    if not recommendations:
+        recommendations.append("No se detectaron patrones de alta frecuencia en las categorías sugeridas por IA (>10% del total).")
+    return recommendations
+
+
+def process_excel_file(filepath, original_filename_base, custom_context, selected_columns, ollama_model, update_progress_callback,
+                       bypass_cache=False, batch_mode=False, task_id=None, resume=False, semantic_clustering=False,
+                       model_routing=False, routing_fast_model=ROUTING_FAST_MODEL,
+                       prompt_token_budget=PROMPT_TICKET_TOKEN_BUDGET, summarize_work_notes=WORK_NOTES_SUMMARY_ENABLED,
+                       incremental=INCREMENTAL_ANALYSIS_ENABLED):
+    # Admite .xlsx, .xls y .csv. El archivo se lee y se escribe por bloques de STREAMING_CHUNK_ROWS filas,
+    # de modo que la memoria usada no depende del tamaño del archivo. Los resultados se guardan en un
+    # almacén columnar por tarea (result_store.py); al terminar se genera el .xlsx/.csv para descargar.
+    reader = TicketFileReader(filepath)
+
+    os.makedirs(PROCESSED_FOLDER, exist_ok=True)
+    processed_filepath = os.path.join(PROCESSED_FOLDER, f"{original_filename_base}_resultados")
+    if os.path.isdir(processed_filepath):
+        shutil.rmtree(processed_filepath)  # Resultados y exportaciones de un análisis anterior de la misma subida
+
+    result_cache = get_result_cache() if RESULT_CACHE_ENABLED else None
+    pipeline_stats = {"unique_tickets": 0, "cache_hits": 0, "cache_misses": 0,
+                      "batches_sent": 0, "batched_tickets": 0, "batch_fallback_tickets": 0, "resumed_rows": 0,
+                      "semantic_reused_rows": 0, "semantic_error": None, "truncated_tickets": 0,
+                      "truncated_tokens_removed": 0, "work_notes_entries_omitted": 0, "work_notes_summarized": 0,
+                      "work_notes_summary_errors": 0, "incremental_status_counts": Counter(), "incremental_reused_rows": 0}
+
+    checkpoint_store = None
+    if CHECKPOINT_ENABLED and task_id:
+        checkpoint_store = get_checkpoint_store()
+        if not resume:
+            checkpoint_store.clear_task(task_id)
+    # El enrutamiento decide ticket a ticket qué modelo lo analiza, por lo que no se combina con el modo por lotes
+    routing_fast_model = (routing_fast_model or ROUTING_FAST_MODEL) if model_routing else None
+    if routing_fast_model:
+        batch_mode = False
+    result_columns = ANALYSIS_RESULT_COLUMNS + ROUTING_RESULT_COLUMNS if routing_fast_model else ANALYSIS_RESULT_COLUMNS
+    ticket_history = get_ticket_history_store() if incremental else None
+    incremental_note = None
+    routing_tier_counts = Counter()
+    batch_context_tokens = None
+    if batch_mode:
+        batch_context_tokens = min(get_model_context_length(ollama_model), BATCH_MAX_CONTEXT_TOKENS)
+    category_counts = Counter()
+    progress = {"processed": 0}
+    stage_timings = StageTimings()
+    metrics = get_metrics_registry()
+    semantic_index = SemanticIndex() if semantic_clustering else None
+    job_content_results = JobContentResults(result_cache)
+
+    def progress_total():
+        return max(reader.total_rows_hint or 0, progress["processed"], 1)
+
+    # Filas terminadas durante el análisis: se publican por lotes (LIVE_RESULTS_FLUSH_INTERVAL_SECONDS) junto con
+    # algunas columnas del archivo original para poder identificarlas y revisarlas antes de que acabe la tarea
+    live_store = None
+    if LIVE_RESULTS_ENABLED and task_id:
+        live_store = get_live_result_store()
+        live_store.clear_task(task_id)
+    live_rows = {"pending": [], "flushed_at": time.monotonic()}
+    current_chunk = {"df": None, "row_offset": 0, "source_columns": []}
+
+    def flush_live_rows():
+        if live_store is None or not live_rows["pending"]:
+            return
+        try:
+            live_store.append_rows(task_id, live_rows["pending"])
+        except Exception as e:
+            print(f"Error guardando las filas terminadas de la tarea {task_id}: {e}")
+        live_rows["pending"] = []
+        live_rows["flushed_at"] = time.monotonic()
+
+    def build_live_summary():
+        # Histograma y recomendaciones con las filas terminadas hasta ahora (se envían con cada actualización de progreso)
+        counts = dict(category_counts.most_common())
+        return {"tickets_completed": progress["processed"], "category_counts": counts,
+                "recommendations": build_pattern_recommendations(counts, progress["processed"])}
+
+    def report_progress(row_indices, results):
+        progress["processed"] += len(row_indices)
+        category_counts.update(result["Clasificacion_Sugerida_IA"] for result in results
+                               if result.get("Clasificacion_Sugerida_IA") is not None)
+        if live_store is not None:
+            chunk_df = current_chunk["df"]
+            for row_index, result in zip(row_indices, results):
+                values = {column: to_json_value(chunk_df[column].iat[row_index]) for column in current_chunk["source_columns"]}
+                values.update((column, result.get(column)) for column in result_columns)
+                live_rows["pending"].append((current_chunk["row_offset"] + row_index, values))
+            if time.monotonic() - live_rows["flushed_at"] >= LIVE_RESULTS_FLUSH_INTERVAL_SECONDS:
+                flush_live_rows()
+        update_progress_callback(progress["processed"], progress_total(),
+                                 f"Procesando ticket {progress['processed']}/{progress_total()}", "processing",
+                                 live_summary=build_live_summary())
+
+    writer = None
+    num_tickets = 0
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            for chunk_df in timed_iterator(reader.iter_chunks(), "read", stage_timings):
+                if writer is None:
+                    available_text_columns = [selected_columns.get(key) for key, _ in TICKET_CONTENT_PREFIXES
+                                              if selected_columns.get(key) in reader.columns]
+                    if not available_text_columns:
+                        msg = (f"Error: Ninguna de las columnas de texto especificadas ({selected_columns.get('description_column')}, "
+                               f"{selected_columns.get('short_description_column')}, {selected_columns.get('work_notes_column')}) "
+                               f"se encontraron en el archivo o no se proporcionaron. Columnas disponibles: {', '.join(reader.columns)}")
+                        update_progress_callback(0, reader.total_rows_hint or 0, msg, "error")
+                        return None, {"error": msg}
+                    ticket_id_column = selected_columns.get("ticket_id_column")
+                    if ticket_history is not None and ticket_id_column not in reader.columns:
+                        incremental_note = (f"Columna de número de ticket '{ticket_id_column}' no encontrada: "
+                                            f"se analizaron todos los tickets.")
+                        ticket_history = None
+                    if ticket_history is not None:
+                        result_columns = result_columns + INCREMENTAL_RESULT_COLUMNS
+                    current_chunk["source_columns"] = [selected_columns.get(key) for key in LIVE_RESULTS_SOURCE_COLUMNS
+                                                       if selected_columns.get(key) in reader.columns]
+                    update_progress_callback(0, progress_total(), "Iniciando análisis de tickets...", "processing")
+                    writer = ResultStoreWriter(processed_filepath,
+                                               default_format=processed_file_extension(filepath).lstrip('.'),
+                                               csv_delimiter=reader.csv_delimiter or ',')
+
+                current_chunk["df"] = chunk_df
+                current_chunk["row_offset"] = num_tickets
+                chunk_results = analyze_ticket_chunk(chunk_df, selected_columns, custom_context, ollama_model, executor,
+                                                     result_cache, bypass_cache, pipeline_stats, report_progress,
+                                                     batch_context_tokens=batch_context_tokens,
+                                                     checkpoint_store=checkpoint_store, task_id=task_id,
+                                                     row_offset=num_tickets, stage_timings=stage_timings,
+                                                     semantic_index=semantic_index, routing_fast_model=routing_fast_model,
+                                                     prompt_token_budget=prompt_token_budget,
+                                                     summarize_notes=summarize_work_notes, ticket_history=ticket_history,
+                                                     job_content_results=job_content_results)
+                with timed_stage("write", stage_timings):
+                    merged_df = merge_analysis_columns(chunk_df, chunk_results, result_columns)
+                    writer.write_chunk(merged_df)
+                with timed_stage("bookkeeping", stage_timings):
+                    flush_live_rows()
+                num_tickets += len(chunk_df)
+                metrics.increment("ticket_analyzer_tickets_processed_total", len(chunk_df))
+                if routing_fast_model:
+                    routing_tier_counts.update(result.get("Ruta_Modelo_IA") or "sin_ruta" for result in chunk_results)
+    except Exception as e:
+        msg = f"Error al procesar el archivo: {e}"
+        flush_live_rows()
+        update_progress_callback(progress["processed"], progress_total(), msg, "error")
+        if writer is not None:
+            writer.close()
+        return None, {"error": msg}
+
+    if writer is None:
+        # Sin filas se guarda igualmente un almacén vacío (solo cabeceras), para que /download y /results
+        # respondan como en cualquier otra tarea completada
+        try:
+            default_format = processed_file_extension(filepath).lstrip('.')
+            writer = ResultStoreWriter(processed_filepath, default_format=default_format,
+                                       csv_delimiter=reader.csv_delimiter or ',')
+            writer.write_chunk(pd.DataFrame(columns=reader.columns + [column for column in result_columns
+                                                                       if column not in reader.columns]))
+            writer.close()
+            ResultStore(processed_filepath).ensure_export(default_format)
+        except Exception as e:
+            msg = f"Error al guardar el archivo procesado: {e}"
+            update_progress_callback(0, 0, msg, "error")
+            return None, {"error": msg}
+        update_progress_callback(0, 0, "El archivo está vacío.", "completed")
+        return processed_filepath, {"message": "Archivo vacío", "total_tickets": 0}
+
+    num_unique_tickets = pipeline_stats["unique_tickets"]
+    rows_analyzed_this_run = num_tickets - pipeline_stats["resumed_rows"] - pipeline_stats["incremental_reused_rows"]
+    category_counts = dict(category_counts.most_common())
+    top_clusters = semantic_index.top_clusters(SEMANTIC_TOP_CLUSTERS) if semantic_index is not None else []
     analysis_summary_for_ui = {
         "total_tickets": num_tickets,
         "category_counts": category_counts,
-        "recommendations": recommendations,
+        "recommendations": build_pattern_recommendations(category_counts, num_tickets, top_clusters),
         "ollama_model_used": ollama_model,
         "custom_context_provided": bool(custom_context),
-        "columns_generated_by_ia": list(df_analysis_results.columns)
+        "columns_generated_by_ia": list(result_columns),
+        "unique_tickets_analyzed": num_unique_tickets,
+        "duplicate_tickets_reused": rows_analyzed_this_run - num_unique_tickets,
+        "dedup_ratio": round(1 - num_unique_tickets / rows_analyzed_this_run, 4) if rows_analyzed_this_run else 0.0,
+        "cache_enabled": result_cache is not None,
+        "cache_bypassed": bool(bypass_cache),
+        "cache_hits": pipeline_stats["cache_hits"],
+        "cache_misses": pipeline_stats["cache_misses"],
+        "batch_mode": bool(batch_mode),
+        "batch_context_tokens": batch_context_tokens,
+        "batches_sent": pipeline_stats["batches_sent"],
+        "batched_tickets": pipeline_stats["batched_tickets"],
+        "batch_fallback_tickets": pipeline_stats["batch_fallback_tickets"],
+        "resumed": bool(resume),
+        "resumed_rows": pipeline_stats["resumed_rows"],
+        "semantic_clustering": semantic_index is not None,
+        "embedding_model": EMBEDDING_MODEL if semantic_index is not None else None,
+        "semantic_clusters": semantic_index.num_clusters if semantic_index is not None else 0,
+        "semantic_reused_tickets": pipeline_stats["semantic_reused_rows"],
+        "semantic_error": pipeline_stats["semantic_error"],
+        "top_clusters": top_clusters,
+        "model_routing": bool(routing_fast_model),
+        "routing_fast_model": routing_fast_model,
+        "routing_tier_counts": dict(routing_tier_counts.most_common()),
+        "prompt_token_budget": prompt_token_budget or None,
+        "truncated_tickets": pipeline_stats["truncated_tickets"],
+        "truncated_tokens_removed": pipeline_stats["truncated_tokens_removed"],
+        "work_notes_entries_omitted": pipeline_stats["work_notes_entries_omitted"],
+        "work_notes_summarization": bool(summarize_work_notes),
+        "work_notes_summarized": pipeline_stats["work_notes_summarized"],
+        "work_notes_summary_errors": pipeline_stats["work_notes_summary_errors"],
+        "incremental_analysis": ticket_history is not None,
+        "incremental_note": incremental_note,
+        "incremental_new_tickets": pipeline_stats["incremental_status_counts"][INCREMENTAL_STATUS_NEW],
+        "incremental_changed_tickets": pipeline_stats["incremental_status_counts"][INCREMENTAL_STATUS_CHANGED],
+        "incremental_unchanged_tickets": pipeline_stats["incremental_status_counts"][INCREMENTAL_STATUS_UNCHANGED],
+        "incremental_tickets_without_id": pipeline_stats["incremental_status_counts"][INCREMENTAL_STATUS_NO_ID],
+        "incremental_reused_tickets": pipeline_stats["incremental_reused_rows"],
+        "ollama_backends": stage_timings.backend_summary()
     }
 
-    os.makedirs(PROCESSED_FOLDER, exist_ok=True)
-    ext = os.path.splitext(filepath)[1]
-    processed_filename = f"{original_filename_base}_analizado{ext}"
-    processed_filepath = os.path.join(PROCESSED_FOLDER, processed_filename)
-    
+    metrics.increment("ticket_analyzer_result_cache_lookups_total", pipeline_stats["cache_hits"], result="hit")
+    metrics.increment("ticket_analyzer_result_cache_lookups_total", pipeline_stats["cache_misses"], result="miss")
+    metrics.increment("ticket_analyzer_truncated_tickets_total", pipeline_stats["truncated_tickets"])
+    metrics.increment("ticket_analyzer_incremental_reused_tickets_total", pipeline_stats["incremental_reused_rows"])
+    metrics.increment("ticket_analyzer_work_notes_summaries_total", pipeline_stats["work_notes_summarized"], outcome="success")
+    metrics.increment("ticket_analyzer_work_notes_summaries_total", pipeline_stats["work_notes_summary_errors"], outcome="error")
+
+    if result_cache is not None:
+        try:
+            result_cache.evict()
+        except Exception as e:
+            print(f"Error al aplicar la política de expulsión de la caché: {e}")
+
     try:
-        df.to_excel(processed_filepath, index=False)
+        with timed_stage("write", stage_timings):
+            writer.close()
+        # El archivo de descarga por defecto se genera aquí, en el worker de la tarea, y no en la primera
+        # petición de descarga (que lo haría esperar y, con varias a la vez, lo generaría varias veces)
+        update_progress_callback(num_tickets, num_tickets, "Generando el archivo de resultados...", "processing")
+        with timed_stage("write", stage_timings):
+            result_store = ResultStore(processed_filepath)
+            result_store.ensure_export(result_store.manifest["default_format"])
+        analysis_summary_for_ui["timing_breakdown"] = stage_timings.as_summary()
         update_progress_callback(num_tickets, num_tickets, "Análisis completado. Puede descargar el archivo.", "completed")
     except Exception as e:
         msg = f"Error al guardar el archivo procesado: {e}"
@@ -267,4 +1401,27 @@ def clean_old_files():
                         os.remove(filepath)
                         print(f"Archivo antiguo eliminado: {filepath}")
                 except Exception as e:
-                    print(f"Error procesando para eliminar archivo {filepath}: {e}")
\ No newline at end of file
+                    print(f"Error procesando para eliminar archivo {filepath}: {e}")
+            elif os.path.isdir(filepath):
+                # Almacenes de resultados por tarea (partes columnares y exportaciones generadas)
+                try:
+                    dir_mod_time = datetime.fromtimestamp(os.path.getmtime(filepath))
+                    if dir_mod_time < cutoff:
+                        shutil.rmtree(filepath)
+                        print(f"Resultados antiguos eliminados: {filepath}")
+                except Exception as e:
+                    print(f"Error procesando para eliminar directorio {filepath}: {e}")
+    if CHECKPOINT_ENABLED:
+        try:
+            get_checkpoint_store().delete_older_than(cutoff.timestamp())
+        except Exception as e:
+            print(f"Error eliminando checkpoints antiguos: {e}")
+    if LIVE_RESULTS_ENABLED:
+        try:
+            get_live_result_store().delete_older_than(cutoff.timestamp())
+        except Exception as e:
+            print(f"Error eliminando filas terminadas antiguas: {e}")
+    try:
+        get_ticket_history_store().delete_older_than((now - timedelta(seconds=TICKET_HISTORY_MAX_AGE_SECONDS)).timestamp())
+    except Exception as e:
+        print(f"Error eliminando historial de tickets antiguo: {e}")
\ No newline at end of file
@@ -0,0 +1,133 @@
+# result_cache.py
+import sqlite3
+import hashlib
+import json
+import threading
+import time
+import os
+
+from config import (
+    RESULT_CACHE_DB_PATH, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_MAX_AGE_SECONDS
+)
+
+
+# --- Clave de Caché ---
+def build_cache_key(ticket_content, custom_context, ollama_model, prompt_version):
+    # Separador nulo para que "ab" + "c" no colisione con "a" + "bc"
+    raw_key = "\x00".join([
+        prompt_version or "",
+        ollama_model or "",
+        custom_context or "",
+        ticket_content or ""
+    ])
+    return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+
+# --- Caché Persistente de Resultados del LLM ---
+class ResultCache:
+    def __init__(self, db_path=RESULT_CACHE_DB_PATH, max_entries=RESULT_CACHE_MAX_ENTRIES,
+                 max_age_seconds=RESULT_CACHE_MAX_AGE_SECONDS):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Con WAL, NORMAL no sincroniza con disco en cada commit (solo en los checkpoints): una caída del
+        # sistema puede perder las últimas entradas, pero la base de datos no se corrompe
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_results ("
+            " cache_key TEXT PRIMARY KEY,"
+            " result_json TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_results_last_access ON llm_results(last_access)")
+        self._conn.commit()
+        # Último acceso de las entradas leídas, pendiente de guardar: las lecturas no escriben ni hacen
+        # commit, los accesos se guardan junto con la siguiente escritura o antes de expulsar entradas
+        self._pending_access = {}
+
+    def get(self, cache_key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result_json, created_at FROM llm_results WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if row is None:
+                return None
+            result_json, created_at = row
+            if self.max_age_seconds and now - created_at > self.max_age_seconds:
+                return None  # evict() la elimina
+            self._pending_access[cache_key] = now
+        try:
+            return json.loads(result_json)
+        except json.JSONDecodeError:
+            return None
+
+    def put(self, cache_key, analysis_result):
+        self.put_many([(cache_key, analysis_result)])
+
+    def put_many(self, entries):
+        # entries: lista de (clave, resultado). Una sola transacción (y un solo commit) para todas
+        now = time.time()
+        rows = [(cache_key, json.dumps(analysis_result, ensure_ascii=False), now, now)
+                for cache_key, analysis_result in entries]
+        with self._lock:
+            if not rows and not self._pending_access:
+                return
+            if rows:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO llm_results (cache_key, result_json, created_at, last_access) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+            self._write_pending_access()
+            self._conn.commit()
+
+    def _write_pending_access(self):
+        # Llamar con self._lock tomado; el commit lo hace quien llama
+        if self._pending_access:
+            self._conn.executemany("UPDATE llm_results SET last_access = ? WHERE cache_key = ?",
+                                   [(accessed_at, cache_key) for cache_key, accessed_at in self._pending_access.items()])
+            self._pending_access = {}
+
+    def flush(self):
+        self.put_many([])
+
+    def evict(self):
+        # Elimina entradas caducadas y, si se supera el máximo, las menos usadas recientemente
+        removed = 0
+        with self._lock:
+            self._write_pending_access()
+            if self.max_age_seconds:
+                cur = self._conn.execute("DELETE FROM llm_results WHERE created_at < ?", (time.time() - self.max_age_seconds,))
+                removed += cur.rowcount
+            if self.max_entries:
+                total = self._conn.execute("SELECT COUNT(*) FROM llm_results").fetchone()[0]
+                excess = total - self.max_entries
+                if excess > 0:
+                    cur = self._conn.execute(
+                        "DELETE FROM llm_results WHERE cache_key IN ("
+                        " SELECT cache_key FROM llm_results ORDER BY last_access ASC LIMIT ?)",
+                        (excess,)
+                    )
+                    removed += cur.rowcount
+            self._conn.commit()
+        if removed:
+            print(f"Caché de resultados: {removed} entradas eliminadas por antigüedad/tamaño.")
+        return removed
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+def get_result_cache():
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache()
+        return _result_cache
@@ -0,0 +1,305 @@
+# result_store.py
+import json
+import math
+import os
+import time
+import uuid
+import datetime as dt
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional: sin él, las partes se guardan como pickle de pandas y no hay exportación Parquet
+    pa = None
+    pq = None
+
+from config import RESULT_EXPORT_LOCK_STALE_SECONDS
+from ticket_io import ResultFileWriter
+
+MANIFEST_FILENAME = "manifest.json"
+EXPORT_FORMATS = ("xlsx", "csv", "csv.gz", "parquet")
+EXPORT_MIMETYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "csv.gz": "application/gzip",
+    "parquet": "application/vnd.apache.parquet"
+}
+
+
+class ResultStoreError(Exception):
+    pass
+
+
+class ExportInProgressError(ResultStoreError):
+    pass
+
+
+# --- Almacén Columnar de Resultados por Tarea ---
+# Cada bloque procesado se guarda como una parte independiente (Parquet si pyarrow está instalado) y un
+# manifiesto registra las columnas y las filas de cada parte. Guardar un bloque cuesta mucho menos que
+# escribirlo en un .xlsx, la paginación solo lee las partes necesarias, y los archivos para descargar se
+# generan a partir de las partes la primera vez que se piden.
+def _to_storage_value(value):
+    if value is None or value is pd.NaT:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (dt.datetime, dt.date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _storage_frame(chunk_df):
+    # Parquet exige un tipo por columna: las columnas de tipo mixto (texto y números de una misma celda
+    # de Excel, por ejemplo) se guardan como texto; las numéricas y de fecha conservan su tipo.
+    frame = chunk_df.copy()
+    for column in frame.columns:
+        if frame[column].dtype == object:
+            frame[column] = frame[column].map(_to_storage_value).astype(object)
+    return frame
+
+
+class ResultStoreWriter:
+    def __init__(self, directory, default_format="xlsx", csv_delimiter=','):
+        self.directory = directory
+        self.part_format = "parquet" if pq is not None else "pickle"
+        self.columns = None
+        self.rows_written = 0
+        self._manifest = {
+            "version": 1,
+            "part_format": self.part_format,
+            "default_format": default_format,
+            "csv_delimiter": csv_delimiter,
+            "columns": None,
+            "parts": [],
+            "total_rows": 0,
+            "complete": False
+        }
+        os.makedirs(directory, exist_ok=True)
+
+    def write_chunk(self, chunk_df):
+        if self.columns is None:
+            self.columns = [str(column) for column in chunk_df.columns]
+            self._manifest["columns"] = self.columns
+        part_name = f"part-{len(self._manifest['parts']):05d}.{'parquet' if self.part_format == 'parquet' else 'pkl'}"
+        part_path = os.path.join(self.directory, part_name)
+        frame = _storage_frame(chunk_df)
+        if self.part_format == "parquet":
+            frame.to_parquet(part_path, index=False, engine="pyarrow")
+        else:
+            frame.to_pickle(part_path)
+        self._manifest["parts"].append({"file": part_name, "rows": len(frame)})
+        self.rows_written += len(frame)
+        self._manifest["total_rows"] = self.rows_written
+        self._write_manifest()
+
+    def _write_manifest(self):
+        # Escritura atómica: un lector nunca ve un manifiesto a medias
+        tmp_path = os.path.join(self.directory, f"{MANIFEST_FILENAME}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.directory, MANIFEST_FILENAME))
+
+    def close(self):
+        self._manifest["complete"] = True
+        self._manifest["finished_at"] = time.time()
+        self._write_manifest()
+
+
+class ResultStore:
+    def __init__(self, directory):
+        self.directory = directory
+        manifest_path = os.path.join(directory, MANIFEST_FILENAME)
+        if not os.path.exists(manifest_path):
+            raise ResultStoreError("No hay resultados guardados para esta tarea.")
+        with open(manifest_path, encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest["part_format"] == "parquet" and pq is None:
+            raise ResultStoreError("Los resultados se guardaron en Parquet y pyarrow no está instalado.")
+
+    @property
+    def columns(self):
+        return self.manifest["columns"] or []
+
+    @property
+    def total_rows(self):
+        return self.manifest["total_rows"]
+
+    def _read_part(self, part, columns=None):
+        part_path = os.path.join(self.directory, part["file"])
+        if self.manifest["part_format"] == "parquet":
+            return pd.read_parquet(part_path, columns=columns, engine="pyarrow")
+        frame = pd.read_pickle(part_path)
+        return frame[columns] if columns else frame
+
+    def iter_parts(self, columns=None):
+        for part in self.manifest["parts"]:
+            yield self._read_part(part, columns)
+
+    def read_rows(self, offset, limit, columns=None):
+        # Solo se leen las partes que se solapan con [offset, offset + limit)
+        frames = []
+        part_start = 0
+        end = offset + limit
+        for part in self.manifest["parts"]:
+            part_end = part_start + part["rows"]
+            if part_end > offset and part_start < end:
+                frame = self._read_part(part, columns)
+                frames.append(frame.iloc[max(offset - part_start, 0):min(end, part_end) - part_start])
+            part_start = part_end
+            if part_start >= end:
+                break
+        if not frames:
+            return pd.DataFrame(columns=columns or self.columns)
+        return pd.concat(frames, ignore_index=True)
+
+    # --- Exportación (se genera una vez y se guarda para las siguientes descargas) ---
+    def export_path(self, export_format):
+        return os.path.join(self.directory, f"resultados.{export_format}")
+
+    def _new_tmp_path(self, export_format):
+        return f"{self.export_path(export_format)}.{uuid.uuid4().hex}.tmp"
+
+    def _lock_path(self, export_format):
+        return f"{self.export_path(export_format)}.lock"
+
+    def _acquire_export_lock(self, export_format):
+        # Un archivo creado en exclusiva hace de bloqueo entre hilos y entre procesos (varios workers de
+        # gunicorn): solo una petición genera cada formato. Uno abandonado (proceso terminado a mitad) caduca.
+        lock_path = self._lock_path(export_format)
+        for _ in range(2):
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) < RESULT_EXPORT_LOCK_STALE_SECONDS:
+                        return False
+                    os.remove(lock_path)
+                except FileNotFoundError:
+                    pass
+        return False
+
+    def _release_export_lock(self, export_format):
+        try:
+            os.remove(self._lock_path(export_format))
+        except FileNotFoundError:
+            pass
+
+    def export_in_progress(self, export_format):
+        lock_path = self._lock_path(export_format)
+        try:
+            return time.time() - os.path.getmtime(lock_path) < RESULT_EXPORT_LOCK_STALE_SECONDS
+        except FileNotFoundError:
+            return False
+
+    def ensure_export(self, export_format):
+        if export_format not in EXPORT_FORMATS:
+            raise ResultStoreError(f"Formato no soportado: {export_format}. Formatos disponibles: {', '.join(EXPORT_FORMATS)}.")
+        if export_format == "parquet" and pq is None:
+            raise ResultStoreError("La exportación a Parquet requiere pyarrow (pip install pyarrow).")
+        export_path = self.export_path(export_format)
+        if os.path.exists(export_path):
+            return export_path
+        if not self._acquire_export_lock(export_format):
+            raise ExportInProgressError(f"El archivo {export_format} se está generando. Vuelve a intentarlo en unos segundos.")
+        tmp_path = self._new_tmp_path(export_format)
+        try:
+            if not os.path.exists(export_path):  # Otra petición pudo terminarlo justo antes de tomar el bloqueo
+                if export_format == "parquet":
+                    self._write_parquet(tmp_path)
+                else:
+                    for _ in self._write_tabular(tmp_path, export_format):
+                        pass
+                os.replace(tmp_path, export_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            self._release_export_lock(export_format)
+        return export_path
+
+    def _write_tabular(self, filepath, export_format):
+        # Generador: avanza una parte por iteración para que la descarga en streaming pueda enviar lo ya escrito
+        writer = ResultFileWriter(filepath, csv_delimiter=self.manifest["csv_delimiter"], file_format=export_format)
+        try:
+            for frame in self.iter_parts():
+                writer.write_chunk(frame)
+                yield
+        finally:
+            writer.close()
+
+    def _write_parquet(self, filepath):
+        # Las partes pueden diferir en el tipo de una columna (solo nulos en un bloque, números y texto en
+        # otro): se unifica a texto, o al tipo de las demás partes si en una solo hay nulos.
+        part_paths = [os.path.join(self.directory, part["file"]) for part in self.manifest["parts"]]
+        schemas = [pq.read_schema(path) for path in part_paths]
+        fields = []
+        for column in self.columns:
+            types = {schema.field(column).type for schema in schemas} - {pa.null()}
+            fields.append(pa.field(column, types.pop() if len(types) == 1 else pa.string()))
+        target_schema = pa.schema(fields)
+        with pq.ParquetWriter(filepath, target_schema) as writer:
+            for path in part_paths:
+                table = pq.read_table(path).select(self.columns)
+                arrays = []
+                for field, array in zip(target_schema, table.columns):
+                    if array.type == field.type:
+                        arrays.append(array)
+                    elif array.type == pa.null():
+                        arrays.append(pa.nulls(len(array), field.type))
+                    else:
+                        arrays.append(array.cast(field.type))
+                writer.write_table(pa.Table.from_arrays(arrays, schema=target_schema))
+
+    def iter_csv_gz(self, read_size=256 * 1024):
+        # CSV comprimido en streaming: se envía al cliente a medida que se escribe cada parte y, si la
+        # descarga termina, el archivo queda guardado para las siguientes peticiones.
+        export_path = self.export_path("csv.gz")
+        if os.path.exists(export_path):
+            with open(export_path, "rb") as f:
+                while True:
+                    data = f.read(read_size)
+                    if not data:
+                        return
+                    yield data
+        # Si otra petición lo está generando a la vez, este flujo se envía igualmente pero no se guarda
+        locked = self._acquire_export_lock("csv.gz")
+        tmp_path = self._new_tmp_path("csv.gz")
+        completed = False
+        try:
+            with open(tmp_path, "wb"):
+                pass
+            with open(tmp_path, "rb") as pending:
+                for _ in self._write_tabular(tmp_path, "csv.gz"):
+                    data = pending.read()
+                    if data:
+                        yield data
+                data = pending.read()  # Lo que quedaba en el búfer del compresor al cerrar
+                if data:
+                    yield data
+            if locked:
+                os.replace(tmp_path, export_path)
+                completed = True
+        finally:
+            if not completed and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            if locked:
+                self._release_export_lock("csv.gz")
+
+
+def to_json_value(value):
+    if value is None or value is pd.NaT:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, (pd.Timestamp, dt.datetime, dt.date)):
+        return value.isoformat()
+    if hasattr(value, "item") and not isinstance(value, (str, bytes)):
+        value = value.item()  # Tipos numpy -> tipos nativos de Python
+        if isinstance(value, float) and math.isnan(value):
+            return None
+    return value
@@ -0,0 +1,125 @@
+# semantic_index.py
+import numpy as np
+import requests
+
+from config import (
+    EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_CHARS, SEMANTIC_CLUSTER_THRESHOLD,
+    SEMANTIC_REUSE_THRESHOLD, SEMANTIC_MAX_CLUSTERS
+)
+from ollama_client import get_ollama_client
+
+
+class EmbeddingError(Exception):
+    pass
+
+
+# --- Embeddings vía Ollama ---
+def embed_texts(texts, model_name=EMBEDDING_MODEL, batch_size=EMBEDDING_BATCH_SIZE):
+    # Devuelve una matriz float32 (n, dims) con filas normalizadas (norma L2 = 1): el producto escalar
+    # entre filas es directamente la similitud coseno.
+    vectors = []
+    client = get_ollama_client()
+    for start in range(0, len(texts), batch_size):
+        batch = [(text or "")[:EMBEDDING_MAX_CHARS] for text in texts[start:start + batch_size]]
+        try:
+            response = client.embed(model_name, batch)
+            response.raise_for_status()
+            embeddings = response.json().get("embeddings")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise EmbeddingError(f"No se pudieron calcular embeddings con '{model_name}': {e}") from e
+        if not isinstance(embeddings, list) or len(embeddings) != len(batch):
+            raise EmbeddingError(f"Respuesta de /api/embed inesperada para '{model_name}'.")
+        vectors.append(np.asarray(embeddings, dtype=np.float32))
+    if not vectors:
+        return np.zeros((0, 0), dtype=np.float32)
+    matrix = np.vstack(vectors)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+# --- Índice de Similitud (agrupamiento por líder) ---
+# Cada grupo se representa por el primer ticket que no se parecía lo suficiente a ningún representante
+# anterior. Solo se guardan los vectores de los representantes, en una matriz que crece por duplicación,
+# y la búsqueda del más parecido es un único producto matriz-vector por bloque de tickets.
+class SemanticIndex:
+    def __init__(self, cluster_threshold=SEMANTIC_CLUSTER_THRESHOLD, reuse_threshold=SEMANTIC_REUSE_THRESHOLD,
+                 max_clusters=SEMANTIC_MAX_CLUSTERS):
+        self.cluster_threshold = cluster_threshold
+        self.reuse_threshold = max(reuse_threshold, cluster_threshold)
+        self.max_clusters = max_clusters
+        self._vectors = None
+        self.num_clusters = 0
+        self.cluster_sizes = []  # filas por grupo
+        self.cluster_samples = []  # texto del representante
+        self.cluster_results = []  # análisis del representante (None mientras no esté disponible o si falló)
+        self.unclustered_rows = 0
+
+    def _append_cluster(self, vector, sample_text):
+        if self._vectors is None:
+            self._vectors = np.zeros((64, vector.shape[0]), dtype=np.float32)
+        elif self.num_clusters == self._vectors.shape[0]:
+            grown = np.zeros((self._vectors.shape[0] * 2, self._vectors.shape[1]), dtype=np.float32)
+            grown[:self.num_clusters] = self._vectors[:self.num_clusters]
+            self._vectors = grown
+        self._vectors[self.num_clusters] = vector
+        self.cluster_sizes.append(0)
+        self.cluster_samples.append((sample_text or "")[:300])
+        self.cluster_results.append(None)
+        self.num_clusters += 1
+        return self.num_clusters - 1
+
+    def assign(self, vectors, sample_texts):
+        # Devuelve, por cada vector, (id de grupo o None, similitud con su representante, es_nuevo_representante)
+        assignments = [None] * len(vectors)
+        if len(vectors) == 0:
+            return assignments
+        if self.num_clusters:
+            # Similitud de todo el bloque contra todos los representantes existentes de una vez
+            similarities = vectors @ self._vectors[:self.num_clusters].T
+            best_clusters = similarities.argmax(axis=1)
+            best_similarities = similarities[np.arange(len(vectors)), best_clusters]
+            for i in np.flatnonzero(best_similarities >= self.cluster_threshold):
+                assignments[i] = (int(best_clusters[i]), float(best_similarities[i]), False)
+        # Los que no encajan se comparan (en orden) con los representantes creados dentro del propio bloque
+        block_start = self.num_clusters
+        for i, assignment in enumerate(assignments):
+            if assignment is not None:
+                continue
+            if self.num_clusters > block_start:
+                block_similarities = self._vectors[block_start:self.num_clusters] @ vectors[i]
+                best = int(block_similarities.argmax())
+                if block_similarities[best] >= self.cluster_threshold:
+                    assignments[i] = (block_start + best, float(block_similarities[best]), False)
+                    continue
+            if self.num_clusters >= self.max_clusters:
+                assignments[i] = (None, 0.0, False)
+                continue
+            assignments[i] = (self._append_cluster(vectors[i], sample_texts[i]), 1.0, True)
+        return assignments
+
+    def add_rows(self, cluster_id, num_rows):
+        if cluster_id is None:
+            self.unclustered_rows += num_rows
+        else:
+            self.cluster_sizes[cluster_id] += num_rows
+
+    def set_result(self, cluster_id, analysis_result):
+        if cluster_id is not None and not analysis_result.get("Error_Analisis_IA"):
+            self.cluster_results[cluster_id] = analysis_result
+
+    def top_clusters(self, limit):
+        order = sorted(range(self.num_clusters), key=lambda cluster_id: self.cluster_sizes[cluster_id], reverse=True)
+        top = []
+        for cluster_id in order[:limit]:
+            if self.cluster_sizes[cluster_id] < 2:
+                break
+            result = self.cluster_results[cluster_id] or {}
+            top.append({
+                "cluster_id": cluster_id,
+                "size": self.cluster_sizes[cluster_id],
+                "category": result.get("Clasificacion_Sugerida_IA"),
+                "problem": result.get("Problema_Principal_IA"),
+                "sample": self.cluster_samples[cluster_id]
+            })
+        return top
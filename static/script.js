@@ -13,12 +13,52 @@ document.addEventListener('DOMContentLoaded', function() {
     const statusMessage = document.getElementById('statusMessage');
     const downloadLink = document.getElementById('downloadLink');
     const analysisSummaryDiv = document.getElementById('analysisSummary');
+    const resultsBrowser = document.getElementById('resultsBrowser');
+    const resumeButton = document.getElementById('resumeButton');
 
     const ollamaModelSelect = document.getElementById('ollama_model_select');
     const ollamaModelCustomInput = document.getElementById('ollama_model_custom');
 
     let currentTaskId = null;
     let pollInterval = null;
+    let statusEventSource = null;
+
+    // El estado de Ollama lo comprueba el servidor en segundo plano; si al cargar la página aún no había
+    // resultado, se consulta /health hasta tenerlo
+    const ollamaStatusDiv = document.getElementById('ollamaStatus');
+    if (ollamaStatusDiv && ollamaStatusDiv.dataset.pending === 'true') {
+        refreshOllamaStatus(0);
+    }
+
+    function refreshOllamaStatus(attempt) {
+        setTimeout(async function() {
+            let health = null;
+            try {
+                const response = await fetch('/health');
+                health = await response.json();
+            } catch (error) {
+                console.error("SCRIPT.JS: Error consultando /health:", error);
+            }
+            if (!health || health.ollama.available === null) {
+                if (attempt < 10) refreshOllamaStatus(attempt + 1);
+                return;
+            }
+            document.getElementById('ollamaStatusText').textContent = health.ollama.message;
+            ollamaStatusDiv.classList.add(health.ollama.available ? 'ollama-ok' : 'ollama-error');
+            ollamaStatusDiv.dataset.pending = 'false';
+            const models = health.ollama.models || [];
+            if (models.length > 0) {
+                document.getElementById('ollamaModelsText').innerHTML = `<br>Modelos detectados: ${escapeHtml(models.join(', '))}`;
+                if (ollamaModelSelect) {
+                    const selectedModel = ollamaModelSelect.options[0] ? ollamaModelSelect.options[0].value : '';
+                    const customOption = ollamaModelSelect.querySelector('option[value="otro_modelo_personalizado"]');
+                    ollamaModelSelect.innerHTML = '';
+                    models.forEach(model => ollamaModelSelect.add(new Option(model, model, false, model === selectedModel)));
+                    if (customOption) ollamaModelSelect.add(customOption);
+                }
+            }
+        }, attempt === 0 ? 300 : 1000);
+    }
 
     if (!uploadForm) console.error("SCRIPT.JS: Elemento uploadForm NO encontrado.");
     if (!uploadButton) console.error("SCRIPT.JS: Elemento uploadButton NO encontrado.");
@@ -33,14 +73,16 @@ document.addEventListener('DOMContentLoaded', function() {
             event.preventDefault(); 
             console.log("SCRIPT.JS: Evento 'submit' de uploadForm CAPTURADO y PREVENIDO.");
             
-            if (pollInterval) { clearInterval(pollInterval); pollInterval = null; }
+            stopStatusUpdates();
             currentTaskId = null;
             if(progressBar) { progressBar.style.width = '0%'; progressBar.textContent = '0%'; }
             if (statusMessage) statusMessage.textContent = '';
             if (downloadLink) downloadLink.innerHTML = '';
             if (analysisSummaryDiv) analysisSummaryDiv.innerHTML = '';
+            if (resultsBrowser) resultsBrowser.innerHTML = '';
             if (analyzeButton) { analyzeButton.style.display = 'none'; analyzeButton.disabled = true; }
             if (uploadButton) { uploadButton.style.display = 'inline-block';}
+            if (resumeButton) resumeButton.style.display = 'none';
 
             const formData = new FormData();
             if (!fileInput.files || fileInput.files.length === 0) {
@@ -129,12 +171,14 @@ document.addEventListener('DOMContentLoaded', function() {
 
             analyzeButton.disabled = true;
             analyzeButton.textContent = 'Analizando...';
+            if (resumeButton) resumeButton.style.display = 'none';
             if(statusMessage) {
                 statusMessage.textContent = 'Iniciando análisis...';
                 statusMessage.className = 'status-message info';
             }
             if(downloadLink) downloadLink.innerHTML = '';
             if(analysisSummaryDiv) analysisSummaryDiv.innerHTML = '';
+            if(resultsBrowser) resultsBrowser.innerHTML = '';
             if(progressBar) {
                 progressBar.style.width = '0%';
                 progressBar.textContent = '0%';
@@ -145,6 +189,24 @@ document.addEventListener('DOMContentLoaded', function() {
             analysisFormData.append('description_column', document.getElementById('description_column').value);
             analysisFormData.append('short_description_column', document.getElementById('short_description_column').value);
             analysisFormData.append('work_notes_column', document.getElementById('work_notes_column').value);
+            const ticketIdColumnInput = document.getElementById('ticket_id_column');
+            if (ticketIdColumnInput) analysisFormData.append('ticket_id_column', ticketIdColumnInput.value);
+            const incrementalCheckbox = document.getElementById('incremental');
+            analysisFormData.append('incremental', incrementalCheckbox && incrementalCheckbox.checked ? 'true' : 'false');
+            const batchModeCheckbox = document.getElementById('batch_mode');
+            analysisFormData.append('batch_mode', batchModeCheckbox && batchModeCheckbox.checked ? 'true' : 'false');
+            const promptTokenBudgetInput = document.getElementById('prompt_token_budget');
+            if (promptTokenBudgetInput) analysisFormData.append('prompt_token_budget', promptTokenBudgetInput.value.trim());
+            const summarizeWorkNotesCheckbox = document.getElementById('summarize_work_notes');
+            analysisFormData.append('summarize_work_notes', summarizeWorkNotesCheckbox && summarizeWorkNotesCheckbox.checked ? 'true' : 'false');
+            const modelRoutingCheckbox = document.getElementById('model_routing');
+            analysisFormData.append('model_routing', modelRoutingCheckbox && modelRoutingCheckbox.checked ? 'true' : 'false');
+            const routingFastModelInput = document.getElementById('routing_fast_model');
+            if (routingFastModelInput) analysisFormData.append('routing_fast_model', routingFastModelInput.value.trim());
+            const semanticClusteringCheckbox = document.getElementById('semantic_clustering');
+            analysisFormData.append('semantic_clustering', semanticClusteringCheckbox && semanticClusteringCheckbox.checked ? 'true' : 'false');
+            const bypassCacheCheckbox = document.getElementById('bypass_cache');
+            analysisFormData.append('bypass_cache', bypassCacheCheckbox && bypassCacheCheckbox.checked ? 'true' : 'false');
             
             let selectedModel = ollamaModelSelect.value;
             if (selectedModel === "otro_modelo_personalizado") {
@@ -174,8 +236,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
                 if (response.ok || response.status === 202) { 
                     if(statusMessage) statusMessage.textContent = data.message || 'Análisis iniciado. Esperando progreso...';
-                    if (pollInterval) clearInterval(pollInterval); 
-                    pollInterval = setInterval(() => pollStatus(currentTaskId), 2000); 
+                    startStatusUpdates(currentTaskId);
                 } else {
                     if(statusMessage) {
                         statusMessage.textContent = `Error al iniciar análisis: ${data.error || 'Error desconocido del servidor'}`;
@@ -202,6 +263,51 @@ document.addEventListener('DOMContentLoaded', function() {
          console.error("SCRIPT.JS: No se pudo adjuntar el event listener a analyzeButton porque el BOTÓN no se encontró.");
     }
 
+    function formatEta(seconds) {
+        if (seconds === null || seconds === undefined) return '';
+        const minutes = Math.floor(seconds / 60);
+        const secs = Math.round(seconds % 60);
+        return minutes > 0 ? `${minutes} min ${secs} s` : `${secs} s`;
+    }
+
+    function stopStatusUpdates() {
+        if (pollInterval) { clearInterval(pollInterval); pollInterval = null; }
+        if (statusEventSource) { statusEventSource.close(); statusEventSource = null; }
+    }
+
+    function startPolling(taskId) {
+        if (pollInterval) clearInterval(pollInterval);
+        pollInterval = setInterval(() => pollStatus(taskId), 2000);
+    }
+
+    // Progreso por Server-Sent Events; si el navegador no lo soporta o la conexión falla, se vuelve al polling
+    function startStatusUpdates(taskId) {
+        stopStatusUpdates();
+        if (!window.EventSource) {
+            startPolling(taskId);
+            return;
+        }
+        let receivedEvent = false;
+        statusEventSource = new EventSource(`/status/${taskId}/stream`);
+        statusEventSource.onmessage = function(event) {
+            receivedEvent = true;
+            try {
+                handleStatusData(taskId, JSON.parse(event.data));
+            } catch (error) {
+                console.error('SCRIPT.JS: Evento SSE no válido:', error);
+            }
+        };
+        statusEventSource.onerror = function() {
+            // Sin ningún evento recibido (proxy que no admite SSE, etc.) se pasa directamente al polling.
+            // Si ya llegaban eventos, EventSource reintenta solo; si la tarea terminó, ya se cerró.
+            if (!receivedEvent || (statusEventSource && statusEventSource.readyState === EventSource.CLOSED)) {
+                console.warn('SCRIPT.JS: SSE no disponible, usando polling de /status.');
+                if (statusEventSource) { statusEventSource.close(); statusEventSource = null; }
+                startPolling(taskId);
+            }
+        };
+    }
+
     async function pollStatus(taskId) {
         try {
             const response = await fetch(`/status/${taskId}`);
@@ -215,40 +321,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 }
                 return;
             }
-            
-            if(statusMessage) statusMessage.textContent = data.message || "Procesando...";
-            let progress = 0;
-            if (data.progress_total > 0) {
-                progress = (data.progress_current / data.progress_total) * 100;
-            }
-            if(progressBar) {
-                progressBar.style.width = `${progress}%`;
-                progressBar.textContent = `${Math.round(progress)}%`;
-            }
-
-            if (data.status === 'completed') {
-                if (pollInterval) { clearInterval(pollInterval); pollInterval = null; }
-                if(progressBar) { progressBar.style.width = '100%'; progressBar.textContent = '100%'; }
-                if(statusMessage) { statusMessage.textContent = data.message || 'Análisis completado.'; statusMessage.className = 'status-message info'; }
-                if(downloadLink) downloadLink.innerHTML = `<a href="/download/${taskId}" class="button" style="background-color: #28a745; color: white; padding: 10px 15px; text-decoration: none; border-radius: 4px;">Descargar Resultados</a>`;
-                
-                if(uploadButton) { uploadButton.style.display = 'inline-block'; uploadButton.disabled = false; uploadButton.textContent = '1. Subir Otro Archivo'; }
-                if(analyzeButton) { analyzeButton.textContent = '2. Analizar de Nuevo'; analyzeButton.disabled = false; }
-                if(fileInput) fileInput.value = ''; 
-                
-                displayAnalysisSummary(data.analysis_summary);
-
-            } else if (data.status === 'error') {
-                if (pollInterval) { clearInterval(pollInterval); pollInterval = null; }
-                if(statusMessage) { statusMessage.textContent = `Error: ${data.message || 'Fallo en el análisis.'}`; statusMessage.className = 'status-message error'; }
-                
-                if(uploadButton) { uploadButton.style.display = 'inline-block'; uploadButton.disabled = false; uploadButton.textContent = '1. Subir Otro Archivo'; }
-                if(analyzeButton) { analyzeButton.textContent = '2. Intentar Análisis de Nuevo'; analyzeButton.disabled = false; }
-                
-                displayAnalysisSummary(data.analysis_summary);
-            } else { 
-                 if(statusMessage) statusMessage.className = 'status-message info';
-            }
+            handleStatusData(taskId, data);
 
         } catch (error) {
             console.error('SCRIPT.JS: Error de red en pollStatus:', error);
@@ -258,7 +331,138 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         }
     }
+
+    function handleStatusData(taskId, data) {
+        if(statusMessage) {
+            statusMessage.textContent = data.message || "Procesando...";
+            if (data.status === 'queued' && data.queue_position) {
+                statusMessage.textContent += ` (posición en la cola: ${data.queue_position})`;
+            }
+            if (data.status === 'processing' && data.eta_seconds !== null && data.eta_seconds !== undefined) {
+                statusMessage.textContent += ` — ${data.throughput_tickets_per_second} tickets/s, tiempo restante estimado: ${formatEta(data.eta_seconds)}`;
+            }
+        }
+        let progress = 0;
+        if (data.progress_total > 0) {
+            progress = (data.progress_current / data.progress_total) * 100;
+        }
+        if(progressBar) {
+            progressBar.style.width = `${progress}%`;
+            progressBar.textContent = `${Math.round(progress)}%`;
+        }
+
+        if (data.status === 'completed') {
+            stopStatusUpdates();
+            if(progressBar) { progressBar.style.width = '100%'; progressBar.textContent = '100%'; }
+            if(statusMessage) { statusMessage.textContent = data.message || 'Análisis completado.'; statusMessage.className = 'status-message info'; }
+            if(downloadLink) {
+                downloadLink.innerHTML = `<a href="/download/${taskId}" class="button" style="background-color: #28a745; color: white; padding: 10px 15px; text-decoration: none; border-radius: 4px;">Descargar Resultados</a>`
+                    + ' <span>Otros formatos: '
+                    + ['xlsx', 'csv', 'csv.gz', 'parquet'].map(format => `<a href="/download/${taskId}?format=${format}">${format}</a>`).join(' · ')
+                    + '</span>';
+            }
+            loadResultsPage(taskId, 0);
+            
+            if(uploadButton) { uploadButton.style.display = 'inline-block'; uploadButton.disabled = false; uploadButton.textContent = '1. Subir Otro Archivo'; }
+            if(analyzeButton) { analyzeButton.textContent = '2. Analizar de Nuevo'; analyzeButton.disabled = false; }
+            if(fileInput) fileInput.value = ''; 
+            
+            displayAnalysisSummary(data.analysis_summary);
+
+        } else if (data.status === 'error') {
+            stopStatusUpdates();
+            if(resumeButton) { resumeButton.style.display = 'inline-block'; resumeButton.disabled = false; }
+            if(statusMessage) { statusMessage.textContent = `Error: ${data.message || 'Fallo en el análisis.'}`; statusMessage.className = 'status-message error'; }
+            
+            if(uploadButton) { uploadButton.style.display = 'inline-block'; uploadButton.disabled = false; uploadButton.textContent = '1. Subir Otro Archivo'; }
+            if(analyzeButton) { analyzeButton.textContent = '2. Intentar Análisis de Nuevo'; analyzeButton.disabled = false; }
+            
+            displayAnalysisSummary(data.analysis_summary);
+        } else { 
+             if(statusMessage) statusMessage.className = 'status-message info';
+             if (data.status === 'processing' && data.live_summary) displayLiveSummary(taskId, data.live_summary);
+        }
+    }
     
+    if (resumeButton) {
+        resumeButton.addEventListener('click', async function() {
+            if (!currentTaskId) return;
+            resumeButton.disabled = true;
+            try {
+                const response = await fetch(`/resume/${currentTaskId}`, { method: 'POST' });
+                const data = await response.json();
+                if (response.ok || response.status === 202) {
+                    resumeButton.style.display = 'none';
+                    if(statusMessage) {
+                        statusMessage.textContent = `${data.message} ${data.rows_already_analyzed || 0} filas ya analizadas se conservan.`;
+                        statusMessage.className = 'status-message info';
+                    }
+                    startStatusUpdates(currentTaskId);
+                } else {
+                    resumeButton.disabled = false;
+                    if(statusMessage) {
+                        statusMessage.textContent = `Error al reanudar: ${data.error || data.message || 'Error desconocido del servidor'}`;
+                        statusMessage.className = 'status-message error';
+                    }
+                }
+            } catch (error) {
+                console.error('SCRIPT.JS: Error en fetch /resume:', error);
+                resumeButton.disabled = false;
+            }
+        });
+    }
+
+    function escapeHtml(text) {
+        const div = document.createElement('div');
+        div.textContent = text === undefined || text === null ? '' : String(text);
+        return div.innerHTML;
+    }
+
+    // Navegación por los resultados (/results/<task_id>) sin descargar el archivo: solo las columnas de la IA
+    const RESULTS_BROWSER_PAGE_SIZE = 25;
+    async function loadResultsPage(taskId, offset) {
+        if (!resultsBrowser) return;
+        try {
+            const response = await fetch(`/results/${taskId}?offset=${offset}&limit=${RESULTS_BROWSER_PAGE_SIZE}`);
+            const data = await response.json();
+            if (!response.ok) {
+                resultsBrowser.innerHTML = `<p class="error">No se pudieron cargar los resultados: ${escapeHtml(data.error || response.status)}</p>`;
+                return;
+            }
+            const columns = data.columns.filter(column => column.endsWith('_IA'));
+            let html = `<h3>Resultados (filas ${data.total_rows ? offset + 1 : 0}-${offset + data.rows.length} de ${data.total_rows}):</h3>`;
+            html += '<div style="overflow-x:auto;"><table style="border-collapse: collapse; font-size: 13px;"><tr>';
+            html += columns.map(column => `<th style="border: 1px solid #ddd; padding: 4px;">${escapeHtml(column)}</th>`).join('');
+            html += '</tr>';
+            data.rows.forEach(row => {
+                html += '<tr>' + columns.map(column => `<td style="border: 1px solid #ddd; padding: 4px; vertical-align: top;">${escapeHtml(row[column])}</td>`).join('') + '</tr>';
+            });
+            html += '</table></div><div class="button-group">';
+            html += `<button type="button" id="resultsPrevButton" ${offset > 0 ? '' : 'disabled'}>Anterior</button>`;
+            html += `<button type="button" id="resultsNextButton" ${data.next_offset !== null ? '' : 'disabled'}>Siguiente</button></div>`;
+            resultsBrowser.innerHTML = html;
+            document.getElementById('resultsPrevButton').addEventListener('click', () => loadResultsPage(taskId, Math.max(offset - RESULTS_BROWSER_PAGE_SIZE, 0)));
+            document.getElementById('resultsNextButton').addEventListener('click', () => loadResultsPage(taskId, data.next_offset));
+        } catch (error) {
+            console.error('SCRIPT.JS: Error en fetch /results:', error);
+        }
+    }
+
+    // Resumen provisional mientras el análisis sigue en curso (tickets terminados hasta ahora)
+    function displayLiveSummary(taskId, liveSummary) {
+        if (!analysisSummaryDiv) return;
+        let html = `<h3>Resultados parciales (${liveSummary.tickets_completed} tickets terminados):</h3>`;
+        const categories = Object.entries(liveSummary.category_counts || {});
+        if (categories.length > 0) {
+            html += '<ul>' + categories.map(([category, count]) => `<li>${escapeHtml(category)}: ${count}</li>`).join('') + '</ul>';
+        }
+        if (liveSummary.recommendations && liveSummary.recommendations.length > 0) {
+            html += '<h4>Recomendaciones provisionales:</h4><ul>' + liveSummary.recommendations.map(rec => `<li>${escapeHtml(rec)}</li>`).join('') + '</ul>';
+        }
+        html += `<p><a href="/results/${taskId}/partial?limit=1000" target="_blank">Ver las filas terminadas (JSON)</a></p>`;
+        analysisSummaryDiv.innerHTML = html;
+    }
+
     function displayAnalysisSummary(summary) {
         if (!analysisSummaryDiv) return;
         analysisSummaryDiv.innerHTML = '';
@@ -276,6 +480,68 @@ document.addEventListener('DOMContentLoaded', function() {
         html += `<p><strong>Total de tickets analizados:</strong> ${summary.total_tickets !== undefined ? summary.total_tickets : 'N/A'}</p>`;
         html += `<p><strong>Modelo LLM utilizado:</strong> ${summary.ollama_model_used || 'No especificado'}</p>`;
         html += `<p><strong>Contexto personalizado proporcionado:</strong> ${summary.custom_context_provided ? 'Sí' : 'No'}</p>`;
+        if (summary.unique_tickets_analyzed !== undefined) {
+            html += `<p><strong>Tickets únicos enviados al análisis:</strong> ${summary.unique_tickets_analyzed} (${summary.duplicate_tickets_reused} duplicados reutilizados, ratio ${(summary.dedup_ratio * 100).toFixed(1)}%)</p>`;
+        }
+        if (summary.incremental_analysis) {
+            html += `<p><strong>Análisis incremental:</strong> ${summary.incremental_new_tickets} nuevos, ${summary.incremental_changed_tickets} modificados, ${summary.incremental_unchanged_tickets} sin cambios (${summary.incremental_reused_tickets} reutilizados de subidas anteriores)${summary.incremental_tickets_without_id ? `, ${summary.incremental_tickets_without_id} sin número de ticket` : ''}. El estado de cada ticket está en la columna Estado_Incremental_IA.</p>`;
+        } else if (summary.incremental_note) {
+            html += `<p class="info"><strong>Análisis incremental:</strong> ${escapeHtml(summary.incremental_note)}</p>`;
+        }
+        if (summary.resumed) {
+            html += `<p><strong>Análisis reanudado:</strong> ${summary.resumed_rows} filas recuperadas de checkpoints.</p>`;
+        }
+        if (summary.batch_mode) {
+            html += `<p><strong>Modo por lotes:</strong> ${summary.batched_tickets} tickets en ${summary.batches_sent} prompts agrupados (${summary.batch_fallback_tickets} reanalizados individualmente, contexto ${summary.batch_context_tokens} tokens)</p>`;
+        }
+        if (summary.prompt_token_budget) {
+            html += `<p><strong>Presupuesto de tokens por ticket:</strong> ${summary.prompt_token_budget} (${summary.truncated_tickets} tickets recortados, ~${summary.truncated_tokens_removed} tokens eliminados, ${summary.work_notes_entries_omitted} entradas de notas de trabajo omitidas)</p>`;
+        }
+        if (summary.work_notes_summarization) {
+            html += `<p><strong>Resumen de notas de trabajo largas:</strong> ${summary.work_notes_summarized} tickets resumidos${summary.work_notes_summary_errors ? `, ${summary.work_notes_summary_errors} sin resumir por error (se recortaron)` : ''}</p>`;
+        }
+        if (summary.model_routing) {
+            const tierLabels = { reglas: 'reglas de palabras clave', modelo_rapido: `modelo rápido (${summary.routing_fast_model})`, modelo_principal: `modelo principal (${summary.ollama_model_used})` };
+            const tiers = Object.entries(summary.routing_tier_counts || {}).map(([tier, count]) => `${count} por ${tierLabels[tier] || tier}`);
+            html += `<p><strong>Enrutamiento en dos niveles:</strong> ${escapeHtml(tiers.join(', ') || 'sin datos')}. La ruta de cada ticket está en las columnas Ruta_Modelo_IA y Motivo_Ruta_IA.</p>`;
+        }
+        if (summary.semantic_clustering) {
+            if (summary.semantic_error) {
+                html += `<p class="error"><strong>Agrupamiento semántico no disponible:</strong> ${summary.semantic_error}</p>`;
+            } else {
+                html += `<p><strong>Agrupamiento semántico (${summary.embedding_model}):</strong> ${summary.semantic_clusters} grupos, ${summary.semantic_reused_tickets} tickets casi idénticos reutilizaron el análisis de su representante</p>`;
+            }
+            if (summary.top_clusters && summary.top_clusters.length > 0) {
+                html += '<h4>Grupos de tickets similares más frecuentes:</h4><ul>';
+                summary.top_clusters.forEach(cluster => {
+                    const label = cluster.problem || cluster.sample;
+                    // El texto de muestra procede del propio ticket: se escapa antes de insertarlo
+                    html += `<li>${cluster.size} tickets${cluster.category ? ` [${escapeHtml(cluster.category)}]` : ''}: ${escapeHtml(label)}</li>`;
+                });
+                html += '</ul>';
+            }
+        }
+        const backendEntries = Object.entries(summary.ollama_backends || {});
+        if (backendEntries.length > 1) {
+            html += '<h4>Reparto entre instancias de Ollama:</h4><ul>';
+            backendEntries.forEach(([backend, stats]) => {
+                html += `<li>${escapeHtml(backend)}: ${stats.requests} peticiones (${stats.errors} con error), ${stats.requests_per_second} peticiones/s, ${stats.tokens_per_second} tokens/s, latencia media ${stats.avg_latency_seconds !== null ? stats.avg_latency_seconds + 's' : 'N/A'}</li>`;
+            });
+            html += '</ul>';
+        }
+        if (summary.cache_enabled) {
+            html += `<p><strong>Caché de resultados:</strong> ${summary.cache_hits} aciertos, ${summary.cache_misses} fallos${summary.cache_bypassed ? ' (caché ignorada en esta ejecución)' : ''}</p>`;
+        }
+        if (summary.timing_breakdown) {
+            const timing = summary.timing_breakdown;
+            const stages = timing.stages || {};
+            const seconds = (stage) => (stages[stage] ? stages[stage].seconds.toFixed(2) : '0.00');
+            const boundLabel = timing.bound_by === 'ollama' ? 'limitado por Ollama' : (timing.bound_by === 'pandas' ? 'limitado por trabajo local (lectura/limpieza/gestión de resultados/escritura)' : '');
+            html += `<p><strong>Tiempos:</strong> ${timing.wall_seconds.toFixed(1)}s en total${boundLabel ? ` (${boundLabel})` : ''}. `
+                + `Lectura ${seconds('read')}s, limpieza ${seconds('clean')}s, espera del LLM ${seconds('llm_wait')}s, gestión de resultados ${seconds('bookkeeping')}s, escritura ${seconds('write')}s, sin atribuir ${seconds('unattributed')}s. `
+                + `En los hilos del LLM: cola ${seconds('llm_queue_wait')}s, servicio ${seconds('llm_service')}s, parseo JSON ${seconds('json_parse')}s; `
+                + `${timing.llm_prompt_tokens} tokens de prompt y ${timing.llm_eval_tokens} generados.</p>`;
+        }
         
         if (summary.columns_generated_by_ia && summary.columns_generated_by_ia.length > 0) {
             html += `<p><strong>Columnas generadas por IA en el Excel:</strong> ${summary.columns_generated_by_ia.join(', ')}</p>`;
@@ -293,7 +559,7 @@ document.addEventListener('DOMContentLoaded', function() {
         if (summary.recommendations && summary.recommendations.length > 0) {
             html += '<h4>Recomendaciones/Observaciones:</h4><ul>';
             summary.recommendations.forEach(rec => {
-                html += `<li>${rec}</li>`;
+                html += `<li>${escapeHtml(rec)}</li>`;
             });
             html += '</ul>';
         } else if (summary.total_tickets > 0) {
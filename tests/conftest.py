@@ -0,0 +1,50 @@
+# tests/conftest.py
+import os
+import sys
+from collections import Counter
+
+import pandas as pd
+import pytest
+
+# Los módulos de la aplicación están en la raíz del repositorio (sin paquete)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+
+@pytest.fixture
+def pipeline_stats():
+    # Mismos contadores que inicializa process_excel_file
+    return {"unique_tickets": 0, "cache_hits": 0, "cache_misses": 0, "batches_sent": 0, "batched_tickets": 0,
+            "batch_fallback_tickets": 0, "resumed_rows": 0, "semantic_reused_rows": 0, "semantic_error": None,
+            "truncated_tickets": 0, "truncated_tokens_removed": 0, "work_notes_entries_omitted": 0,
+            "work_notes_summarized": 0, "work_notes_summary_errors": 0, "incremental_status_counts": Counter(),
+            "incremental_reused_rows": 0}
+
+
+@pytest.fixture
+def run_pipeline(monkeypatch, tmp_path):
+    # process_excel_file sobre un CSV con un LLM simulado; devuelve (ruta de resultados, resumen, progreso)
+    import processing_logic
+    from config import DEFAULT_COLUMNS_TO_ANALYZE
+
+    processed_folder = tmp_path / "processed"
+    monkeypatch.setattr(processing_logic, "PROCESSED_FOLDER", str(processed_folder))
+    monkeypatch.setattr(processing_logic, "RESULT_CACHE_ENABLED", False)
+    monkeypatch.setattr(processing_logic, "analyze_single_ticket",
+                        lambda *args, **kwargs: {key: "ok" for key in processing_logic.ANALYSIS_RESULT_KEYS})
+
+    def run(rows, **kwargs):
+        input_path = tmp_path / "tickets.csv"
+        pd.DataFrame(rows, columns=["Number", DEFAULT_COLUMNS_TO_ANALYZE["short_description_column"]]).to_csv(input_path, index=False)
+        updates = []
+
+        def record_progress(current, total, message, status, **details):
+            exports = sorted(os.listdir(processed_folder / "tickets_resultados")) if status == "completed" else None
+            updates.append((status, message, exports))
+
+        processed_filepath, summary = processing_logic.process_excel_file(
+            str(input_path), "tickets", "", dict(DEFAULT_COLUMNS_TO_ANALYZE), "modelo", record_progress,
+            incremental=False, **kwargs
+        )
+        return processed_filepath, summary, updates
+
+    return run
@@ -0,0 +1,64 @@
+# tests/test_batch_context.py
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import pandas as pd
+
+import processing_logic
+from config import BATCH_MAX_TICKET_CHARS, DEFAULT_COLUMNS_TO_ANALYZE
+
+
+def test_every_generate_call_in_batch_mode_uses_the_same_num_ctx(monkeypatch, pipeline_stats):
+    sent_options = []
+    lock = threading.Lock()
+
+    def fake_call_ollama(prompt_text, model_name=None, task_type="general", expect_json=False, extra_options=None,
+                         stage_timings=None, **kwargs):
+        with lock:
+            sent_options.append((task_type, (extra_options or {}).get("num_ctx")))
+        if task_type == "structured_summary_batch":
+            # Respuesta de lote incompleta: el segundo ticket se reanaliza individualmente
+            return {"results": [dict({key: "ok" for key in processing_logic.ANALYSIS_RESULT_KEYS}, ticket_index=0)]}
+        return {key: "ok" for key in processing_logic.ANALYSIS_RESULT_KEYS}
+
+    monkeypatch.setattr(processing_logic, "call_ollama", fake_call_ollama)
+    chunk_df = pd.DataFrame({
+        "Number": ["INC1", "INC2", "INC3"],
+        "Short description": ["Impresora sin papel", "VPN lenta", "Error en informe"],
+        "Description": ["", "", "x" * (BATCH_MAX_TICKET_CHARS + 100)],  # El tercero es demasiado largo para un lote
+        "Work notes": ["", "", ""]
+    })
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = processing_logic.analyze_ticket_chunk(
+            chunk_df, dict(DEFAULT_COLUMNS_TO_ANALYZE), "", "modelo", executor, None, True, pipeline_stats,
+            lambda row_indices, results: None, batch_context_tokens=4096, prompt_token_budget=None
+        )
+
+    assert all(not result.get("Error_Analisis_IA") for result in results)
+    assert {task_type for task_type, _ in sent_options} == {"structured_summary_batch", "structured_summary"}
+    assert {num_ctx for _, num_ctx in sent_options} == {4096}
+
+
+def test_work_notes_summary_uses_the_job_context(monkeypatch, pipeline_stats):
+    sent = []
+
+    def fake_call_ollama(prompt_text, model_name=None, task_type="general", expect_json=False, extra_options=None,
+                         stage_timings=None, **kwargs):
+        sent.append((task_type, dict(extra_options or {}), processing_logic.estimate_tokens(prompt_text)))
+        return "Resumen breve de las notas."
+
+    monkeypatch.setattr(processing_logic, "call_ollama", fake_call_ollama)
+    long_notes = "\n".join(f"2024-01-{day:02d} 10:00:00 - Técnico: revisado el servidor, sin cambios. " * 20
+                           for day in range(1, 29))
+    for context_tokens in (4096, None):
+        sent.clear()
+        rows_parts = [[("work_notes_column", "Notas de trabajo", long_notes)]]
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            processing_logic.summarize_long_work_notes(rows_parts, "modelo", executor, None, False, pipeline_stats,
+                                                       context_tokens=context_tokens)
+        [(task_type, options, prompt_tokens)] = sent
+        assert task_type == "work_notes_summary"
+        assert options.get("num_ctx") == context_tokens
+        effective_context = context_tokens or processing_logic.BATCH_DEFAULT_CONTEXT_TOKENS
+        assert prompt_tokens + options["num_predict"] <= effective_context
+        assert rows_parts[0][0][2] == "Resumen breve de las notas."
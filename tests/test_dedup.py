@@ -0,0 +1,54 @@
+# tests/test_dedup.py
+import threading
+
+import processing_logic
+from processing_logic import JobContentResults
+from result_cache import ResultCache, build_cache_key
+
+
+def test_duplicates_in_different_chunks_are_analyzed_once(run_pipeline, monkeypatch):
+    analyzed = []
+    lock = threading.Lock()
+
+    def fake_analyze(ticket_content, *args, **kwargs):
+        with lock:
+            analyzed.append(ticket_content)
+        return {key: "ok" for key in processing_logic.ANALYSIS_RESULT_KEYS}
+
+    monkeypatch.setattr(processing_logic, "analyze_single_ticket", fake_analyze)
+    original_reader = processing_logic.TicketFileReader
+    monkeypatch.setattr(processing_logic, "TicketFileReader", lambda filepath: original_reader(filepath, chunk_rows=2))
+    rows = [["INC1", "Servidor caído"], ["INC2", "VPN lenta"], ["INC3", "Servidor caído"],
+            ["INC4", "  servidor   CAÍDO "], ["INC5", "VPN lenta"], ["INC6", "Impresora sin papel"]]
+    _, summary, _ = run_pipeline(rows, bypass_cache=True)
+
+    assert sorted(analyzed) == sorted({content for content in analyzed})
+    assert len(analyzed) == 3
+    assert summary["unique_tickets_analyzed"] == 3
+    assert summary["duplicate_tickets_reused"] == 3
+
+
+def test_job_content_results_is_bounded():
+    results = JobContentResults(max_entries=2)
+    keys = [JobContentResults.content_key(text) for text in ("a", "b", "c")]
+    for key in keys:
+        results.put(key, {"Clasificacion_Sugerida_IA": "x"})
+    assert results.get(keys[0]) is None
+    assert results.get(keys[2]) == ({"Clasificacion_Sugerida_IA": "x"}, None)
+    assert JobContentResults.content_key("Servidor  caído") == JobContentResults.content_key("servidor caído")
+
+
+def test_job_content_results_with_cache_keeps_only_the_cache_key(tmp_path):
+    cache = ResultCache(db_path=str(tmp_path / "cache.sqlite3"), max_entries=0, max_age_seconds=0)
+    results = JobContentResults(cache, max_entries=10)
+    cache_key = build_cache_key("Servidor caído", "", "modelo", "v1")
+    cache.put_many([(cache_key, {"Clasificacion_Sugerida_IA": "x"})])
+    content_key = JobContentResults.content_key("Servidor caído")
+    results.put(content_key, {"Clasificacion_Sugerida_IA": "x"}, 3, cache_key)
+    results.put(JobContentResults.content_key("VPN lenta"), {"Clasificacion_Sugerida_IA": "y"})  # no está en la caché
+    assert results._entries[content_key] == (bytes.fromhex(cache_key), 3)
+    assert len(results._entries) == 1
+    assert results.get(content_key) == ({"Clasificacion_Sugerida_IA": "x"}, 3)
+    cache._conn.execute("DELETE FROM llm_results")
+    assert results.get(content_key) is None
+    assert content_key not in results._entries
@@ -0,0 +1,58 @@
+# tests/test_ollama_client.py
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+
+import pytest
+import requests
+
+from ollama_client import OllamaClient
+
+
+def start_server(handle_post):
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append(self.path)
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            handle_post(self, len(received))
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, received
+
+
+def reply(handler, status):
+    handler.send_response(status)
+    handler.send_header("Content-Type", "application/json")
+    handler.send_header("Content-Length", "2")
+    handler.end_headers()
+    handler.wfile.write(b"{}")
+
+
+def test_read_timeout_on_generate_is_not_retried():
+    server, received = start_server(lambda handler, attempt: (time.sleep(0.5), reply(handler, 200)))
+    try:
+        client = OllamaClient(base_url=f"http://127.0.0.1:{server.server_address[1]}", read_timeout=0.1,
+                              max_retries=3, backoff_factor=0)
+        with pytest.raises(requests.exceptions.RequestException):
+            client.generate({"model": "modelo", "prompt": "hola"})
+        time.sleep(0.6)
+        assert received == ["/api/generate"]
+    finally:
+        server.shutdown()
+
+
+def test_server_errors_are_still_retried():
+    server, received = start_server(lambda handler, attempt: reply(handler, 503 if attempt < 3 else 200))
+    try:
+        client = OllamaClient(base_url=f"http://127.0.0.1:{server.server_address[1]}", max_retries=3, backoff_factor=0)
+        response = client.generate({"model": "modelo", "prompt": "hola"})
+        assert response.status_code == 200
+        assert len(received) == 3
+    finally:
+        server.shutdown()
@@ -0,0 +1,25 @@
+# tests/test_pipeline_metrics.py
+import time
+
+import pytest
+
+from pipeline_metrics import MAIN_THREAD_STAGES, StageTimings
+
+
+def test_main_thread_breakdown_adds_up_to_wall_time():
+    timings = StageTimings()
+    timings.add("read", 0.01)
+    timings.add("llm_wait", 0.02)
+    time.sleep(0.05)
+    summary = timings.as_summary()
+    stages = summary["stages"]
+    total = sum(stages[stage]["seconds"] for stage in MAIN_THREAD_STAGES) + stages["unattributed"]["seconds"]
+    assert total == pytest.approx(summary["wall_seconds"], abs=0.01)
+    assert summary["dominant_stage"] == "llm_wait"
+
+
+def test_pipeline_records_bookkeeping_stage(run_pipeline):
+    _, summary, _ = run_pipeline([[f"INC{index}", f"Fallo {index}"] for index in range(30)])
+    stages = summary["timing_breakdown"]["stages"]
+    assert stages["bookkeeping"]["seconds"] > 0
+    assert "unattributed" in stages
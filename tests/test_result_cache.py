@@ -0,0 +1,42 @@
+# tests/test_result_cache.py
+import sqlite3
+
+from result_cache import ResultCache
+
+
+def last_access(db_path, cache_key):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT last_access FROM llm_results WHERE cache_key = ?", (cache_key,)).fetchone()[0]
+
+
+def test_put_many_writes_all_entries_in_one_transaction(tmp_path):
+    cache = ResultCache(db_path=str(tmp_path / "cache.sqlite3"), max_entries=0, max_age_seconds=0)
+    changes_before = cache._conn.total_changes
+    cache.put_many([(f"clave{i}", {"Clasificacion_Sugerida_IA": str(i)}) for i in range(50)])
+    assert cache._conn.total_changes - changes_before == 50
+    assert not cache._conn.in_transaction
+    assert cache.get("clave7") == {"Clasificacion_Sugerida_IA": "7"}
+    assert cache._conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+
+
+def test_reads_do_not_write_until_the_next_flush(tmp_path):
+    db_path = str(tmp_path / "cache.sqlite3")
+    cache = ResultCache(db_path=db_path, max_entries=0, max_age_seconds=0)
+    cache.put_many([("antigua", {"a": 1}), ("nueva", {"b": 2})])
+    written_access = last_access(db_path, "antigua")
+    changes_before = cache._conn.total_changes
+    assert cache.get("antigua") == {"a": 1}
+    assert cache._conn.total_changes == changes_before
+    assert last_access(db_path, "antigua") == written_access
+    cache.flush()
+    assert last_access(db_path, "antigua") > written_access
+
+
+def test_evict_uses_pending_accesses(tmp_path):
+    cache = ResultCache(db_path=str(tmp_path / "cache.sqlite3"), max_entries=1, max_age_seconds=0)
+    cache.put_many([("leida", {"a": 1})])
+    cache.put_many([("sin_leer", {"b": 2})])
+    cache.get("leida")
+    assert cache.evict() == 1
+    assert cache.get("leida") == {"a": 1}
+    assert cache.get("sin_leer") is None
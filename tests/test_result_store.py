@@ -0,0 +1,72 @@
+# tests/test_result_store.py
+import os
+import time
+
+import pandas as pd
+import pytest
+
+import result_store
+from result_store import ExportInProgressError, ResultStore, ResultStoreWriter
+
+
+def test_default_export_is_generated_by_the_job(run_pipeline):
+    processed_filepath, summary, updates = run_pipeline([["INC1", "VPN lenta"], ["INC2", "Impresora sin papel"]])
+    status, _, files_when_completed = updates[-1]
+    assert status == "completed"
+    # Ya existe cuando la tarea se marca como completada: la primera descarga no tiene que generarlo
+    assert "resultados.csv" in files_when_completed
+    exported = pd.read_csv(os.path.join(processed_filepath, "resultados.csv"))
+    assert exported["Number"].tolist() == ["INC1", "INC2"]
+
+
+def test_concurrent_export_of_the_same_format_is_refused(tmp_path):
+    writer = ResultStoreWriter(str(tmp_path), default_format="csv")
+    writer.write_chunk(pd.DataFrame({"Number": ["INC1"], "Resultado": ["ok"]}))
+    writer.close()
+    store = ResultStore(str(tmp_path))
+
+    assert store._acquire_export_lock("xlsx")
+    assert store.export_in_progress("xlsx")
+    with pytest.raises(ExportInProgressError):
+        store.ensure_export("xlsx")
+    store._release_export_lock("xlsx")
+    assert os.path.exists(store.ensure_export("xlsx"))
+    assert not store.export_in_progress("xlsx")
+
+
+def test_abandoned_export_lock_expires(tmp_path, monkeypatch):
+    writer = ResultStoreWriter(str(tmp_path), default_format="csv")
+    writer.write_chunk(pd.DataFrame({"Number": ["INC1"]}))
+    writer.close()
+    store = ResultStore(str(tmp_path))
+    assert store._acquire_export_lock("csv")
+    stale = time.time() - result_store.RESULT_EXPORT_LOCK_STALE_SECONDS - 1
+    os.utime(store._lock_path("csv"), (stale, stale))
+    assert os.path.exists(store.ensure_export("csv"))
+
+
+def test_empty_input_leaves_a_downloadable_empty_result(run_pipeline):
+    processed_filepath, summary, updates = run_pipeline([])
+    assert updates[-1][0] == "completed"
+    assert summary["total_tickets"] == 0
+    store = ResultStore(processed_filepath)
+    assert store.total_rows == 0
+    assert len(store.read_rows(0, 10)) == 0
+    exported = pd.read_csv(os.path.join(processed_filepath, "resultados.csv"))
+    assert len(exported) == 0
+    assert "Number" in exported.columns
+
+
+def test_store_works_without_pyarrow(tmp_path, monkeypatch):
+    # pyarrow es opcional: sin él las partes se guardan como pickle y solo falla la exportación a Parquet
+    monkeypatch.setattr(result_store, "pq", None)
+    monkeypatch.setattr(result_store, "pa", None)
+    writer = ResultStoreWriter(str(tmp_path), default_format="csv")
+    writer.write_chunk(pd.DataFrame({"Number": ["INC1", "INC2"], "Resultado": ["ok", None]}))
+    writer.close()
+    store = ResultStore(str(tmp_path))
+    assert store.manifest["part_format"] == "pickle"
+    assert store.read_rows(1, 5)["Number"].tolist() == ["INC2"]
+    assert pd.read_csv(store.ensure_export("csv"))["Number"].tolist() == ["INC1", "INC2"]
+    with pytest.raises(result_store.ResultStoreError):
+        store.ensure_export("parquet")
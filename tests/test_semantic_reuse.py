@@ -0,0 +1,70 @@
+# tests/test_semantic_reuse.py
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import numpy as np
+import pandas as pd
+
+import processing_logic
+from config import DEFAULT_COLUMNS_TO_ANALYZE
+from semantic_index import SemanticIndex
+
+
+def near_duplicate_chunk(num_rows):
+    # Mismo error en distintos servidores: textos distintos (sin deduplicación exacta), un único grupo semántico
+    return pd.DataFrame({
+        "Number": [f"INC{i:04d}" for i in range(num_rows)],
+        "Short description": [f"Servidor srv{i:03d} no responde" for i in range(num_rows)],
+        "Description": [f"El servidor srv{i:03d} no responde a ping desde las 8:00" for i in range(num_rows)],
+        "Work notes": [""] * num_rows
+    })
+
+
+def analyze_cluster(monkeypatch, pipeline_stats, num_rows, failing_calls):
+    calls = []
+    calls_lock = threading.Lock()
+
+    def fake_embed(texts):
+        return np.ones((len(texts), 8), dtype=np.float32) / np.sqrt(8)
+
+    def fake_analyze(ticket_content, custom_context, ollama_model, stage_timings=None, include_confidence=False,
+                     context_tokens=None):
+        with calls_lock:
+            calls.append(ticket_content)
+            call_number = len(calls)
+        if call_number <= failing_calls:
+            return processing_logic.build_error_result("Respuesta JSON malformada", "Error Formato JSON")
+        return {key: "ok" for key in processing_logic.ANALYSIS_RESULT_KEYS}
+
+    monkeypatch.setattr(processing_logic, "embed_texts", fake_embed)
+    monkeypatch.setattr(processing_logic, "analyze_single_ticket", fake_analyze)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = processing_logic.analyze_ticket_chunk(
+            near_duplicate_chunk(num_rows), dict(DEFAULT_COLUMNS_TO_ANALYZE), "", "modelo", executor,
+            None, True, pipeline_stats, lambda row_indices, results: None, semantic_index=SemanticIndex(),
+            prompt_token_budget=None
+        )
+    return results, calls
+
+
+def test_cluster_reuses_representative_result(monkeypatch, pipeline_stats):
+    results, calls = analyze_cluster(monkeypatch, pipeline_stats, 20, failing_calls=0)
+    assert len(calls) == 1
+    assert all(not result.get("Error_Analisis_IA") for result in results)
+    assert pipeline_stats["semantic_reused_rows"] == 19
+
+
+def test_failed_representative_is_not_propagated_to_followers(monkeypatch, pipeline_stats):
+    results, calls = analyze_cluster(monkeypatch, pipeline_stats, 20, failing_calls=1)
+    # El representante conserva su error; el siguiente ticket del grupo se analiza y su resultado se reutiliza
+    assert len(calls) == 2
+    assert results[0]["Error_Analisis_IA"]
+    assert all(not result.get("Error_Analisis_IA") for result in results[1:])
+    assert pipeline_stats["semantic_reused_rows"] == 18
+
+
+def test_repeated_failures_promote_next_follower(monkeypatch, pipeline_stats):
+    results, calls = analyze_cluster(monkeypatch, pipeline_stats, 10, failing_calls=3)
+    assert len(calls) == 4
+    assert sum(1 for result in results if result.get("Error_Analisis_IA")) == 3
+    assert pipeline_stats["semantic_reused_rows"] == 6
@@ -0,0 +1,15 @@
+# tests/test_startup.py
+import os
+import runpy
+
+import app as app_module
+
+
+def test_gunicorn_workers_start_background_threads(monkeypatch):
+    started = []
+    monkeypatch.setattr(app_module, "start_background_threads", lambda: started.append(True))
+    config = runpy.run_path(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gunicorn.conf.py"))
+    assert config["worker_class"] == "gthread"
+    config["post_worker_init"](worker=None)
+    assert started == [True]
+
@@ -0,0 +1,43 @@
+# tests/test_status_stream.py
+import threading
+
+import pytest
+
+import app as app_module
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(app_module.job_worker_pool, "start", lambda: None)
+    monkeypatch.setattr(app_module.health_monitor, "start", lambda: None)
+    monkeypatch.setattr(app_module, "get_task_snapshot",
+                        lambda task_id: {"status": "processing", "progress_current": 1, "message": "Analizando"})
+    monkeypatch.setattr(app_module, "build_status_payload", lambda task_data, job_store: {"status": task_data["status"]})
+    monkeypatch.setattr(app_module, "get_job_store", lambda: None)
+    monkeypatch.setattr(app_module, "SSE_POLL_INTERVAL_SECONDS", 0.01)
+    return app_module.app.test_client()
+
+
+def test_stream_ends_after_max_lifetime(client, monkeypatch):
+    monkeypatch.setattr(app_module, "SSE_MAX_STREAM_SECONDS", 0.2)
+    monkeypatch.setattr(app_module, "sse_stream_slots", threading.BoundedSemaphore(1))
+    response = client.get("/status/tarea/stream")
+    body = response.get_data(as_text=True)  # Termina sola aunque la tarea siga en curso
+    assert body.startswith("retry: ")
+    assert 'data: {"status": "processing"}' in body
+    response.close()
+    # La conexión cerrada deja libre su plaza
+    assert app_module.sse_stream_slots.acquire(blocking=False)
+
+
+def test_concurrent_streams_are_capped(client, monkeypatch):
+    monkeypatch.setattr(app_module, "SSE_MAX_STREAM_SECONDS", 0.2)
+    monkeypatch.setattr(app_module, "sse_stream_slots", threading.BoundedSemaphore(1))
+    first = client.get("/status/tarea/stream", buffered=False)
+    second = client.get("/status/tarea/stream")
+    assert second.status_code == 503
+    assert second.headers["Retry-After"] == str(app_module.SSE_BUSY_RETRY_AFTER_SECONDS)
+    first.close()
+    third = client.get("/status/tarea/stream")
+    assert third.status_code == 200
+    third.close()
@@ -0,0 +1,36 @@
+# tests/test_text_prep.py
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from bench_text_prep import legacy_build_ticket_contents
+from config import DEFAULT_COLUMNS_TO_ANALYZE
+from processing_logic import build_ticket_contents, clean_html_and_identifiers
+from synthetic_tickets import synthetic_export
+
+EDGE_CASE_CELLS = [
+    "a &amp b", "&lt 5 minutos", "&copy 2024 Empresa", "R&D sin acceso", "AT&T caído", "&#233xito", "&#xE9xito",
+    "precio &euro; 5", "1 < 2 y 3 > 2", "<3 el servicio", "texto\r\ncon\tsaltos", "  espacios  ", "<p>párrafo</p>",
+    "&nbsp;", "a&b;c", "&", "INC0012345 &amp; CRQ1234"
+]
+
+
+def test_column_wise_preparation_matches_legacy_output():
+    df = synthetic_export(2000, 0.3)
+    columns = DEFAULT_COLUMNS_TO_ANALYZE
+    edge_rows = pd.DataFrame({
+        columns["short_description_column"]: EDGE_CASE_CELLS,
+        columns["description_column"]: list(reversed(EDGE_CASE_CELLS)),
+        columns["work_notes_column"]: [None] * len(EDGE_CASE_CELLS)
+    })
+    df = pd.concat([df, edge_rows], ignore_index=True)
+    assert build_ticket_contents(df, columns) == legacy_build_ticket_contents(df, columns)
+
+
+def test_entities_without_semicolon_are_decoded():
+    assert clean_html_and_identifiers("a &amp b") == "a & b"
+    assert clean_html_and_identifiers("&lt 5") == "< 5"
+    assert clean_html_and_identifiers("&copy 2024") == "© 2024"
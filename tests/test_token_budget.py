@@ -0,0 +1,53 @@
+# tests/test_token_budget.py
+from collections import Counter
+
+import pytest
+
+from processing_logic import compose_ticket_content, estimate_tokens, fit_ticket_parts
+
+
+def work_notes_log(entries, words_per_entry):
+    return " ".join(f"2024-03-{day:02d} 10:00:00 - Técnico (Work notes) " + "revisado el equipo del usuario " * words_per_entry
+                    for day in range(entries, 0, -1))
+
+
+def ticket_parts(short_chars, description_chars, work_notes):
+    parts = [("short_description_column", "Descripción breve", ("impresora sin conexión " * 200)[:short_chars])]
+    if description_chars:
+        parts.append(("description_column", "Descripción completa", ("la impresora de la planta dos no imprime " * 200)[:description_chars]))
+    if work_notes:
+        parts.append(("work_notes_column", "Notas de trabajo", work_notes))
+    return parts
+
+
+TICKETS = [
+    ticket_parts(3000, 4000, work_notes_log(20, 10)),  # Todo largo
+    ticket_parts(3000, 0, None),  # Solo una descripción breve muy larga
+    ticket_parts(60, 4000, work_notes_log(1, 300)),  # Notas con una sola entrada enorme
+    ticket_parts(60, 200, work_notes_log(30, 3)),  # Muchas entradas cortas
+    ticket_parts(900, 900, work_notes_log(5, 40)),
+]
+
+
+@pytest.mark.parametrize("token_budget", [30, 50, 80, 150, 300, 600, 1200])
+@pytest.mark.parametrize("parts", TICKETS)
+def test_composed_ticket_never_exceeds_the_budget(parts, token_budget):
+    content = compose_ticket_content(parts, token_budget, Counter())
+    assert estimate_tokens(content) <= token_budget
+
+
+@pytest.mark.parametrize("token_budget", [30, 80, 300])
+def test_parts_without_room_are_dropped(token_budget):
+    # La descripción breve ocupa todo el presupuesto: no quedan prefijos vacíos de las demás partes
+    fitted = fit_ticket_parts(ticket_parts(3000, 4000, work_notes_log(20, 10)), token_budget)
+    assert [column_key for column_key, _, _ in fitted] == ["short_description_column"]
+    assert fitted[0][2].endswith("[...]")
+    assert all(text.strip() for _, _, text in fitted)
+
+
+def test_budget_is_shared_when_there_is_room():
+    stats = Counter()
+    fitted = fit_ticket_parts(ticket_parts(60, 4000, work_notes_log(20, 10)), 600, stats)
+    assert [column_key for column_key, _, _ in fitted] == ["short_description_column", "description_column", "work_notes_column"]
+    assert stats["truncated_tickets"] == 1
+    assert stats["work_notes_entries_omitted"] > 0
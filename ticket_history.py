@@ -0,0 +1,99 @@
+# ticket_history.py
+import sqlite3
+import json
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+from config import TICKET_HISTORY_DB_PATH
+
+# SQLite limita el número de parámetros por consulta
+LOOKUP_BATCH_SIZE = 500
+
+
+# --- Historial de Análisis por Número de Ticket ---
+# Guarda el último análisis de cada ticket junto con el hash de su contenido. La clave de análisis resume
+# todo lo que influye en el resultado (modelo, contexto, versión del prompt, presupuesto de tokens...), de
+# modo que cambiar cualquiera de ellos provoca un análisis nuevo en lugar de reutilizar uno obsoleto.
+class TicketHistoryStore:
+    def __init__(self, db_path=TICKET_HISTORY_DB_PATH):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ticket_results ("
+                " analysis_key TEXT NOT NULL,"
+                " ticket_id TEXT NOT NULL,"
+                " content_hash TEXT NOT NULL,"
+                " result_json TEXT NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " PRIMARY KEY (analysis_key, ticket_id))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ticket_results_updated_at ON ticket_results(updated_at)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA busy_timeout=30000")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def load(self, analysis_key, ticket_ids):
+        # Devuelve {ticket_id: (hash del contenido, resultado)} para los tickets ya analizados
+        ticket_ids = list(dict.fromkeys(ticket_ids))
+        found = {}
+        with self._connect() as conn:
+            for start in range(0, len(ticket_ids), LOOKUP_BATCH_SIZE):
+                batch = ticket_ids[start:start + LOOKUP_BATCH_SIZE]
+                rows = conn.execute(
+                    f"SELECT ticket_id, content_hash, result_json FROM ticket_results"
+                    f" WHERE analysis_key = ? AND ticket_id IN ({','.join('?' * len(batch))})",
+                    [analysis_key, *batch]
+                ).fetchall()
+                for ticket_id, content_hash, result_json in rows:
+                    found[ticket_id] = (content_hash, json.loads(result_json))
+        return found
+
+    def save(self, analysis_key, entries):
+        # entries: lista de (ticket_id, hash del contenido, resultado)
+        if not entries:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO ticket_results (analysis_key, ticket_id, content_hash, result_json, updated_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [(analysis_key, ticket_id, content_hash, json.dumps(result, ensure_ascii=False), now)
+                 for ticket_id, content_hash, result in entries]
+            )
+
+    def touch(self, analysis_key, ticket_ids):
+        # Los tickets reutilizados siguen vigentes: no deben expirar mientras sigan apareciendo en los exports
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE ticket_results SET updated_at = ? WHERE analysis_key = ? AND ticket_id = ?",
+                [(now, analysis_key, ticket_id) for ticket_id in dict.fromkeys(ticket_ids)]
+            )
+
+    def delete_older_than(self, cutoff_timestamp):
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM ticket_results WHERE updated_at < ?", (cutoff_timestamp,)).rowcount
+
+
+_ticket_history_store = None
+_ticket_history_store_lock = threading.Lock()
+
+def get_ticket_history_store():
+    global _ticket_history_store
+    with _ticket_history_store_lock:
+        if _ticket_history_store is None:
+            _ticket_history_store = TicketHistoryStore()
+        return _ticket_history_store
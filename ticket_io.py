@@ -0,0 +1,188 @@
+# ticket_io.py
+import csv
+import gzip
+import os
+import math
+import datetime as dt
+
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+
+from config import STREAMING_CHUNK_ROWS
+
+SUPPORTED_UPLOAD_EXTENSIONS = ('.xlsx', '.xls', '.csv')
+CSV_CANDIDATE_DELIMITERS = ",;\t|"
+
+
+# --- Detección de formato CSV ---
+def detect_csv_format(filepath, sample_size=64 * 1024):
+    with open(filepath, 'rb') as f:
+        raw_sample = f.read(sample_size)
+    encoding = 'utf-8-sig'
+    try:
+        sample = raw_sample.decode(encoding)
+    except UnicodeDecodeError as e:
+        # Si el fallo es solo por cortar un carácter multibyte al final de la muestra, sigue siendo UTF-8
+        if e.start >= len(raw_sample) - 4:
+            sample = raw_sample[:e.start].decode(encoding)
+        else:
+            encoding = 'cp1252'  # Exportaciones de Excel en español
+            sample = raw_sample.decode(encoding, errors='replace')
+    try:
+        delimiter = csv.Sniffer().sniff(sample, delimiters=CSV_CANDIDATE_DELIMITERS).delimiter
+    except csv.Error:
+        delimiter = ','
+    return encoding, delimiter
+
+
+# --- Lectura por bloques ---
+def _unique_headers(raw_headers):
+    # Mismo criterio que pandas: columnas sin nombre -> "Unnamed: i", duplicadas -> "Nombre.1", "Nombre.2"...
+    headers = []
+    seen = {}
+    for i, header in enumerate(raw_headers):
+        name = f"Unnamed: {i}" if header is None or str(header).strip() == "" else str(header)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        headers.append(name)
+    return headers
+
+
+class TicketFileReader:
+    def __init__(self, filepath, chunk_rows=STREAMING_CHUNK_ROWS):
+        self.filepath = filepath
+        self.chunk_rows = chunk_rows
+        self.extension = os.path.splitext(filepath)[1].lower()
+        self.columns = []
+        self.total_rows_hint = None
+        self.csv_encoding = None
+        self.csv_delimiter = None
+
+    def iter_chunks(self):
+        if self.extension == '.csv':
+            yield from self._iter_csv_chunks()
+        elif self.extension == '.xlsx':
+            yield from self._iter_xlsx_chunks()
+        else:
+            # .xls (formato binario antiguo): openpyxl no lo soporta, se lee completo con pandas
+            df = pd.read_excel(self.filepath)
+            self.columns = [str(col) for col in df.columns]
+            df.columns = self.columns
+            self.total_rows_hint = len(df)
+            for start in range(0, len(df), self.chunk_rows):
+                yield df.iloc[start:start + self.chunk_rows].reset_index(drop=True)
+
+    def _iter_csv_chunks(self):
+        self.csv_encoding, self.csv_delimiter = detect_csv_format(self.filepath)
+        self.total_rows_hint = self._count_csv_rows()
+        # dtype=str conserva identificadores con ceros a la izquierda tal cual vienen en la exportación
+        chunk_iterator = pd.read_csv(self.filepath, sep=self.csv_delimiter, encoding=self.csv_encoding,
+                                     dtype=str, chunksize=self.chunk_rows)
+        for chunk_df in chunk_iterator:
+            self.columns = [str(col) for col in chunk_df.columns]
+            yield chunk_df.reset_index(drop=True)
+
+    def _count_csv_rows(self):
+        with open(self.filepath, newline='', encoding=self.csv_encoding, errors='replace') as f:
+            return max(sum(1 for _ in csv.reader(f, delimiter=self.csv_delimiter)) - 1, 0)
+
+    def _iter_xlsx_chunks(self):
+        workbook = load_workbook(self.filepath, read_only=True, data_only=True)
+        try:
+            worksheet = workbook.worksheets[0]
+            if worksheet.max_row:
+                self.total_rows_hint = max(worksheet.max_row - 1, 0)
+            rows_iterator = worksheet.iter_rows(values_only=True)
+            header_row = next(rows_iterator, None)
+            if header_row is None:
+                return
+            # Recortar columnas vacías a la derecha de la cabecera
+            raw_headers = list(header_row)
+            while raw_headers and raw_headers[-1] is None:
+                raw_headers.pop()
+            self.columns = _unique_headers(raw_headers)
+            num_columns = len(self.columns)
+
+            chunk_rows = []
+            for row in rows_iterator:
+                values = list(row[:num_columns])
+                if all(value is None for value in values):
+                    continue
+                values.extend([None] * (num_columns - len(values)))
+                chunk_rows.append(values)
+                if len(chunk_rows) >= self.chunk_rows:
+                    yield pd.DataFrame(chunk_rows, columns=self.columns)
+                    chunk_rows = []
+            if chunk_rows:
+                yield pd.DataFrame(chunk_rows, columns=self.columns)
+        finally:
+            workbook.close()
+
+
+# --- Escritura incremental ---
+def _to_cell_value(value):
+    if value is None:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if value is pd.NaT:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if hasattr(value, "item") and not isinstance(value, (str, bytes, dt.date)):
+        return value.item()  # Tipos numpy -> tipos nativos de Python
+    return value
+
+
+class ResultFileWriter:
+    def __init__(self, filepath, csv_encoding='utf-8-sig', csv_delimiter=',', file_format=None):
+        # file_format ("xlsx", "csv" o "csv.gz") permite escribir en rutas temporales sin la extensión final
+        self.filepath = filepath
+        self.extension = f".{file_format}" if file_format else os.path.splitext(filepath)[1].lower()
+        self.columns = None
+        self.rows_written = 0
+        self._csv_file = None
+        self._csv_writer = None
+        self._workbook = None
+        self._worksheet = None
+        if self.extension == '.csv':
+            self._csv_file = open(filepath, 'w', newline='', encoding=csv_encoding)
+            self._csv_writer = csv.writer(self._csv_file, delimiter=csv_delimiter)
+        elif self.extension == '.csv.gz':
+            self._csv_file = gzip.open(filepath, 'wt', newline='', encoding=csv_encoding)
+            self._csv_writer = csv.writer(self._csv_file, delimiter=csv_delimiter)
+        else:
+            self._workbook = Workbook(write_only=True)
+            self._worksheet = self._workbook.create_sheet()
+
+    def write_chunk(self, chunk_df):
+        if self.columns is None:
+            self.columns = list(chunk_df.columns)
+            self._append_row(self.columns)
+        for row in chunk_df.itertuples(index=False, name=None):
+            self._append_row([_to_cell_value(value) for value in row])
+        self.rows_written += len(chunk_df)
+
+    def _append_row(self, values):
+        if self._csv_writer is not None:
+            self._csv_writer.writerow(["" if value is None else value for value in values])
+        else:
+            self._worksheet.append(values)
+
+    def close(self):
+        if self._csv_file is not None:
+            self._csv_file.close()
+            self._csv_file = None
+        if self._workbook is not None:
+            self._workbook.save(self.filepath)
+            self._workbook.close()
+            self._workbook = None
+
+
+def processed_file_extension(input_filepath):
+    # Las entradas .xls se escriben como .xlsx (pandas/openpyxl no generan el formato binario antiguo)
+    ext = os.path.splitext(input_filepath)[1].lower()
+    return '.csv' if ext == '.csv' else '.xlsx'